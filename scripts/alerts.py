@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Background ntfy alert dispatcher
+- send() only queues, the detection loop never waits on the network
+- Undelivered alerts are spooled to disk and survive a restart
+- Failed deliveries are retried with exponential backoff, strictly in order
+"""
+import json, os, threading, time
+from collections import deque
+from datetime import datetime
+
+import httppool
+import metrics
+
+SPOOL_FILE = "/opt/babymonitor/config/alert_spool.json"
+MAX_SPOOLED = 100       # Oldest alerts are dropped beyond this
+RETRY_MIN = 2           # Seconds before the first retry
+RETRY_MAX = 300         # Backoff ceiling
+LATE_AFTER = 60         # Mention the original time if delivered later than this
+
+DELIVERY_LATENCY = metrics.Histogram("babymonitor_ntfy_delivery_seconds", "Duration of successful ntfy POSTs")
+DELIVERY_FAILURES = metrics.Counter("babymonitor_ntfy_failures_total", "Failed ntfy delivery attempts")
+QUEUED = metrics.Gauge("babymonitor_ntfy_queued", "Alerts waiting for delivery")
+
+
+class AlertDispatcher:
+    def __init__(self, server, topic, spool_file=SPOOL_FILE):
+        self.server, self.topic, self.spool_file = server, topic, spool_file
+        self.pending = deque(self.load_spool())
+        QUEUED.set_function(lambda: len(self.pending))
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="ntfy-dispatcher", daemon=True)
+        self.thread.start()
+
+    def log(self, msg):
+        print(f"[{datetime.now()}] {msg}")
+
+    def load_spool(self):
+        try:
+            with open(self.spool_file) as f:
+                alerts = json.load(f)
+            if alerts:
+                self.log(f"Ntfy: {len(alerts)} undelivered alert(s) from spool")
+            return alerts
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            self.log(f"Ntfy spool unreadable, starting empty: {e}")
+            return []
+
+    def save_spool(self):
+        """Atomically rewrite the spool with the alerts still pending (caller holds cond)"""
+        try:
+            if not self.pending:
+                if os.path.exists(self.spool_file):
+                    os.unlink(self.spool_file)
+                return
+            tmp = self.spool_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(list(self.pending), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.spool_file)
+        except OSError as e:
+            self.log(f"Ntfy spool write failed: {e}")
+
+    def send(self, title, message, priority="high", tags=None):
+        """Queue an alert for delivery. Never blocks on the network."""
+        alert = {"title": title, "message": message, "priority": priority, "tags": tags, "created": time.time()}
+        with self.cond:
+            self.pending.append(alert)
+            while len(self.pending) > MAX_SPOOLED:
+                dropped = self.pending.popleft()
+                self.log(f"Ntfy spool full, dropped: {dropped['title']}")
+            self.save_spool()
+            self.cond.notify()
+
+    def flush(self, timeout=None):
+        """Wait until every queued alert is delivered. Returns False on timeout."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.pending, timeout)
+
+    def deliver(self, alert):
+        message = alert["message"]
+        late = time.time() - alert["created"]
+        if late > LATE_AFTER:
+            message += f"\n(Raised at {datetime.fromtimestamp(alert['created']):%H:%M:%S}, delivered {int(late)}s late)"
+        headers = {"Title": alert["title"], "Priority": alert["priority"]}
+        if alert["tags"]: headers["Tags"] = alert["tags"]
+        httppool.post(f"{self.server}/{self.topic}", message, headers=headers)
+
+    def run(self):
+        backoff = RETRY_MIN
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending)
+                alert = self.pending[0]
+            try:
+                started = time.monotonic()
+                self.deliver(alert)
+                DELIVERY_LATENCY.observe(time.monotonic() - started)
+                self.log(f"Ntfy: {alert['title']}")
+            except httppool.HTTPError as e:
+                if e.status and 400 <= e.status < 500 and e.status != 429:
+                    # Retrying will not help (bad topic, message rejected)
+                    self.log(f"Ntfy rejected {alert['title']!r}, dropping: {e}")
+                else:
+                    self.retry(alert, e, backoff)
+                    backoff = min(backoff * 2, RETRY_MAX)
+                    continue
+            except Exception as e:
+                self.retry(alert, e, backoff)
+                backoff = min(backoff * 2, RETRY_MAX)
+                continue
+            backoff = RETRY_MIN
+            with self.cond:
+                if self.pending and self.pending[0] is alert:
+                    self.pending.popleft()
+                self.save_spool()
+                self.cond.notify_all()
+
+    def retry(self, alert, error, backoff):
+        DELIVERY_FAILURES.inc()
+        self.log(f"Ntfy failed ({alert['title']}), retry in {backoff}s: {error}")
+        # A newly queued alert cuts the wait short and triggers an early retry
+        with self.cond:
+            self.cond.wait(backoff)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Snapcast Android APK from F-Droid, for the setup wizard
+- Package metadata is cached for INFO_TTL, on F-Droid errors the last
+  known version is used
+- The APK is streamed to disk in chunks, one file per versionCode; older
+  versions are removed once a newer one is complete
+- The bot remembers the Telegram file_id of the upload (bot_config.json),
+  so later sends of the same version are a re-share without any transfer
+Used by telegram-bot.py.
+Usage: apk_cache.py [info | fetch]
+"""
+import glob, os, sys, threading, time
+
+import httppool
+
+PACKAGE = "de.badaix.snapcast"
+FDROID_API = f"https://f-droid.org/api/v1/packages/{PACKAGE}"
+FDROID_REPO = "https://f-droid.org/repo"
+CACHE_DIR = "/opt/babymonitor/config/apk_cache"
+INFO_TTL = 6 * 3600
+
+
+class SnapcastAPK:
+    def __init__(self, directory=CACHE_DIR, ttl=INFO_TTL):
+        self.directory, self.ttl = directory, ttl
+        self.info, self.fetched = None, 0
+        # One download at a time, a second click waits for the first file
+        self.lock = threading.Lock()
+
+    def latest(self):
+        """(version_name, version_code) of the newest release, None if never reachable"""
+        if self.info and time.monotonic() - self.fetched < self.ttl:
+            return self.info
+        try:
+            data = httppool.get(FDROID_API).json()
+            pkg = data["packages"][0]
+            self.info, self.fetched = (pkg["versionName"], pkg["versionCode"]), time.monotonic()
+        except (httppool.HTTPError, ValueError, KeyError, IndexError):
+            pass    # Keep serving the last known version
+        return self.info
+
+    def path(self, version_code):
+        return os.path.join(self.directory, f"snapcast_{version_code}.apk")
+
+    def download(self, version_code):
+        """Path of the APK for version_code, downloaded unless already on disk"""
+        path = self.path(version_code)
+        with self.lock:
+            if os.path.exists(path):
+                return path
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = path + ".part"
+            try:
+                with open(tmp, "wb") as f:
+                    for chunk in httppool.stream(f"{FDROID_REPO}/{PACKAGE}_{version_code}.apk", timeout=60):
+                        f.write(chunk)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+            for old in glob.glob(os.path.join(self.directory, "snapcast_*.apk")):
+                if old != path:
+                    os.unlink(old)
+        return path
+
+
+if __name__ == "__main__":
+    apk = SnapcastAPK()
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "info"
+    info = apk.latest()
+    if not info:
+        print("F-Droid not reachable")
+        sys.exit(1)
+    print(f"Snapcast {info[0]} (versionCode {info[1]})")
+    if cmd == "fetch":
+        path = apk.download(info[1])
+        print(f"{path} ({os.path.getsize(path) / 2**20:.1f} MB)")
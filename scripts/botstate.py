@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Process-wide store for bot_config.json (Telegram bot state)
+- Loaded once, reads are plain in-memory lookups
+- Authorized users kept in a set, so auth checks are O(1)
+- Mutations are serialized by an asyncio lock and persisted with
+  write-to-temp + fsync + rename, a crash never leaves a half-written file
+"""
+import asyncio, json, logging, os
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {"authorized_users": [], "setup_complete": False, "device_name": "Bebefon"}
+
+
+def write_atomic(path, data):
+    """Replace path with data (JSON): readers see either the old or the new file"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    # Make the rename itself durable
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BotState:
+    def __init__(self, path):
+        self.path = str(path)
+        self.data = self.load()
+        self.users = set(self.data["authorized_users"])
+        self.lock = asyncio.Lock()
+
+    def load(self):
+        data = dict(DEFAULTS)
+        try:
+            with open(self.path) as f:
+                data.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot read {self.path}, starting with defaults: {e}")
+        return data
+
+    # --- Reads (no I/O) ---
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def is_authorized(self, user_id):
+        return user_id in self.users
+
+    @property
+    def has_users(self):
+        return bool(self.users)
+
+    @property
+    def authorized_users(self):
+        return list(self.data["authorized_users"])
+
+    # --- Mutations (serialized, written through) ---
+
+    async def save(self):
+        """Persist the current state (caller holds self.lock)"""
+        await asyncio.to_thread(write_atomic, self.path, self.data)
+
+    async def authorize(self, user_id, only_if_first=False):
+        """Add a user. Returns False if already authorized, or if only_if_first
+        and someone else got there first."""
+        async with self.lock:
+            if user_id in self.users or (only_if_first and self.users):
+                return False
+            self.users.add(user_id)
+            self.data["authorized_users"] = self.data["authorized_users"] + [user_id]
+            await self.save()
+            return True
+
+    async def revoke(self, user_id):
+        """Remove a user. Returns False if they were not authorized."""
+        async with self.lock:
+            if user_id not in self.users:
+                return False
+            self.users.discard(user_id)
+            self.data["authorized_users"] = [u for u in self.data["authorized_users"] if u != user_id]
+            await self.save()
+            return True
+
+    async def set(self, key, value):
+        async with self.lock:
+            self.data[key] = value
+            await self.save()
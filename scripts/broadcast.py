@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Concurrent, rate-limited Telegram broadcast to all authorized users
+- Every recipient is sent to at the same time, one slow or blocked chat
+  never holds up the others
+- Token buckets per chat and for the whole bot, matching Telegram's limits
+  (about 1 message per second per chat, 30 per second overall)
+- 429 RetryAfter pauses the whole bot (Telegram's flood limit is per bot, the
+  other chats would get 429 as well) and retries, network errors are
+  retried with backoff, permanent errors (bot blocked, chat gone) are not
+- Returns the result per recipient
+Used by telegram-bot.py (startup message, service alerts, /broadcast).
+"""
+import asyncio, logging
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE, GLOBAL_BURST = 30, 30      # Messages per second, whole bot
+CHAT_RATE, CHAT_BURST = 1, 3            # Messages per second, per chat
+MAX_ATTEMPTS = 4
+BACKOFF = 1                             # Seconds, doubled per network error
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tokens = burst
+        self.updated = None
+        self.paused_until = 0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self.updated is not None:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Telegram said 429: nothing more for this bucket until then"""
+        self.paused_until = max(self.paused_until, asyncio.get_running_loop().time() + seconds)
+        # One message may go right when the pause ends, the rate applies from there
+        self.tokens, self.updated = 1, self.paused_until
+
+
+def retry_seconds(error):
+    # retry_after is an int in older python-telegram-bot versions, a timedelta in newer ones
+    delay = error.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else delay
+
+
+class Broadcaster:
+    def __init__(self):
+        self.bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.chats = {}
+
+    def chat_bucket(self, chat_id):
+        if chat_id not in self.chats:
+            self.chats[chat_id] = TokenBucket(CHAT_RATE, CHAT_BURST)
+        return self.chats[chat_id]
+
+    async def send(self, chat_id, send):
+        """Deliver one message: await send(chat_id) under the limits. Returns (ok, error)."""
+        backoff = BACKOFF
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self.chat_bucket(chat_id).acquire()
+            await self.bucket.acquire()
+            try:
+                await send(chat_id)
+                return True, ""
+            except RetryAfter as e:
+                logger.warning(f"Flood control at {chat_id}, all chats wait {retry_seconds(e)}s")
+                self.chat_bucket(chat_id).pause(retry_seconds(e))
+                # The limit is per bot: every other send waits too instead of collecting its own 429
+                self.bucket.pause(retry_seconds(e))
+                error = str(e)
+            except (Forbidden, BadRequest) as e:
+                return False, str(e)    # Bot blocked, chat gone, bad text: retrying will not help
+            except NetworkError as e:
+                # Also covers TimedOut
+                error = str(e)
+                if attempt < MAX_ATTEMPTS:
+                    await asyncio.sleep(backoff)
+                    backoff *= 2
+            except Exception as e:
+                return False, str(e)
+        return False, error
+
+    async def broadcast(self, chat_ids, send, what="message"):
+        """send(chat_id) to every chat concurrently. Returns {chat_id: (ok, error)}."""
+        chat_ids = list(chat_ids)
+        results = await asyncio.gather(*(self.send(chat_id, send) for chat_id in chat_ids))
+        for chat_id, (ok, error) in zip(chat_ids, results):
+            if ok:
+                logger.info(f"Sent {what} to {chat_id}")
+            else:
+                logger.error(f"Failed to send {what} to {chat_id}: {error}")
+        return dict(zip(chat_ids, results))
+
+    async def send_message(self, bot, chat_ids, text, what="message", **kwargs):
+        return await self.broadcast(chat_ids, lambda chat_id: bot.send_message(chat_id=chat_id, text=text, **kwargs),
+                                    what)
+
+
+# Process-wide, so startup messages, alerts and /broadcast share the limits
+BROADCASTER = Broadcaster()
+
+
+async def send_message(bot, chat_ids, text, **kwargs):
+    return await BROADCASTER.send_message(bot, chat_ids, text, **kwargs)
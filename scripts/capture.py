@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+BabyMonitor capture relay - the only writer of /tmp/snapfifo
+- Runs arecord itself and passes the S16_LE PCM on block by block
+- Heartbeat and warning beeps are pre-rendered int16 arrays, mixed into the
+  live signal sample-aligned (one vectorized add + clip per block). Nothing is
+  appended to the fifo, so frames stay aligned and latency stays constant.
+- Without a mic, or while arecord stalls, it keeps the stream alive with
+  silence on the block clock (beeps still audible)
+  and starts arecord again on `restart` or when the card shows up
+- Software mic gain and mute, changed live over the control socket and
+  applied from the next block on (no restart, clients stay connected)
+- Windowed RMS and peak per block with NumPy (no per-sample Python)
+- Dead-air alert when the level stays at the noise floor (or no data arrives)
+- Optional sustained-loudness events
+- Control socket: beep heartbeat | beep warning | gain [DB] | mute | unmute |
+  restart | status
+Usage: capture.py > /tmp/snapfifo | capture.py gain [DB] | mute | unmute | status
+"""
+import math, os, select, signal, socket, subprocess, sys, time
+from datetime import datetime
+
+import numpy as np
+
+import control, probes, settings
+from alerts import AlertDispatcher
+
+CONFIG = settings.CONFIG
+PAUSE_FILE = os.path.join(os.path.dirname(CONFIG.path), "paused")
+
+AUDIO_DEVICE = CONFIG.get_str('AUDIO_DEVICE', 'hw:2,0')
+SAMPLE_RATE = CONFIG.get_int('SAMPLE_RATE', 48000)
+CHANNELS = CONFIG.get_int('CHANNELS', 1)
+MIC_GAIN_DB = CONFIG.get_float('MIC_GAIN_DB', 0)
+if not math.isfinite(MIC_GAIN_DB):
+    # float() takes "nan" / "inf", which would silence the mic instead of failing
+    print(f"Config MIC_GAIN_DB={MIC_GAIN_DB} is not finite, using 0", file=sys.stderr)
+    MIC_GAIN_DB = 0.0
+LEVEL_WINDOW_MS = CONFIG.get_int('LEVEL_WINDOW_MS', 100)
+DEAD_AIR_DBFS = CONFIG.get_float('DEAD_AIR_DBFS', -85)
+DEAD_AIR_TIMEOUT = CONFIG.get_int('DEAD_AIR_TIMEOUT', 30)
+LOUD_ALERT_ENABLED = CONFIG.get_bool('LOUD_ALERT_ENABLED', False)
+LOUD_DBFS = CONFIG.get_float('LOUD_DBFS', -20)
+LOUD_DURATION = CONFIG.get_int('LOUD_DURATION', 5)
+LOUD_COOLDOWN = CONFIG.get_int('LOUD_COOLDOWN', 300)
+NTFY_TOPIC = CONFIG.get_str('NTFY_TOPIC', 'babymonitor-alerts')
+NTFY_SERVER = CONFIG.get_str('NTFY_SERVER', 'https://ntfy.sh')
+# capture runs as _snapserver, which cannot write to the config dir
+SPOOL_FILE = "/tmp/babymonitor-capture-alerts.json"
+
+SOCKET_PATH = control.CAPTURE_SOCKET
+
+FLOOR_DBFS = -120.0
+RECOVER_DB = 6  # Hysteresis before dead air counts as recovered
+RETRY = 10      # Seconds between mic checks while there is none (`restart` is immediate)
+GAIN_RANGE = (-30.0, 30.0)
+
+
+def log(msg):
+    print(f"[{datetime.now()}] {msg}", file=sys.stderr, flush=True)
+
+
+class LevelAnalyzer:
+    """RMS / peak per int16 block and the dead-air / loudness state machines.
+    Time is counted in samples, so results do not depend on scheduling jitter."""
+
+    def __init__(self, block_samples, sample_rate=SAMPLE_RATE):
+        self.block_samples, self.sample_rate = block_samples, sample_rate
+        self.fbuf = np.empty(block_samples, dtype=np.float32)
+        self.rms_dbfs = self.peak_dbfs = FLOOR_DBFS
+        self.quiet_samples = self.loud_samples = 0
+        self.dead_air = self.loud = False
+
+    @staticmethod
+    def dbfs(value):
+        return 20 * math.log10(value / 32768) if value > 0 else FLOOR_DBFS
+
+    def measure(self, block):
+        """block: int16 ndarray. Returns (rms_dbfs, peak_dbfs)."""
+        n = len(block)
+        f = self.fbuf[:n]
+        np.copyto(f, block)
+        rms = math.sqrt(float(np.dot(f, f)) / n) if n else 0.0
+        peak = max(int(block.max()), -int(block.min())) if n else 0
+        self.rms_dbfs, self.peak_dbfs = self.dbfs(rms), self.dbfs(peak)
+        return self.rms_dbfs, self.peak_dbfs
+
+    def process(self, block):
+        """Measure one block and return a list of event names that fired"""
+        rms_dbfs, _ = self.measure(block)
+        events = []
+        if rms_dbfs < DEAD_AIR_DBFS:
+            self.quiet_samples += len(block)
+            if not self.dead_air and self.quiet_samples >= DEAD_AIR_TIMEOUT * self.sample_rate:
+                self.dead_air = True
+                events.append("dead_air")
+        else:
+            self.quiet_samples = 0
+            if self.dead_air and rms_dbfs >= DEAD_AIR_DBFS + RECOVER_DB:
+                self.dead_air = False
+                events.append("audio_restored")
+        if rms_dbfs >= LOUD_DBFS:
+            self.loud_samples += len(block)
+            if not self.loud and self.loud_samples >= LOUD_DURATION * self.sample_rate:
+                self.loud = True
+                events.append("loud")
+        else:
+            self.loud_samples, self.loud = 0, False
+        return events
+
+    @property
+    def quiet_seconds(self):
+        return self.quiet_samples / self.sample_rate
+
+
+def tone(frequency, duration, volume, rate=SAMPLE_RATE):
+    """Sine as int16, what `sox -n ... synth D sine F vol V` renders"""
+    t = np.arange(int(rate * duration), dtype=np.float32) / rate
+    return (np.sin(2 * np.pi * frequency * t) * (32767 * volume)).astype(np.int16)
+
+
+def warning_sound(rate=SAMPLE_RATE):
+    """Three short high beeps (the mic-lost warning)"""
+    beep, gap = tone(1200, 0.15, 0.4, rate), np.zeros(int(rate * 0.1), dtype=np.int16)
+    return np.concatenate([beep, gap, beep, gap, beep])
+
+
+class GainStage:
+    """Mic gain (dB) and mute. Scaling saturates at full scale instead of
+    wrapping around; all scratch buffers are allocated once."""
+
+    def __init__(self, block_samples, gain_db=MIC_GAIN_DB):
+        self.fbuf = np.empty(block_samples, dtype=np.float32)
+        self.out = np.empty(block_samples, dtype=np.int16)
+        self.silence = np.zeros(block_samples, dtype=np.int16)
+        self.muted = False
+        self.set_gain(gain_db)
+
+    def set_gain(self, gain_db):
+        # NaN would pass the clamp and turn every sample into 0: the mic silenced for good
+        if not math.isfinite(gain_db):
+            raise ValueError(f"gain must be finite, not {gain_db}")
+        self.gain_db = min(max(gain_db, GAIN_RANGE[0]), GAIN_RANGE[1])
+        self.factor = np.float32(10 ** (self.gain_db / 20))
+
+    def apply(self, block):
+        """block: int16 ndarray. Returns it unchanged, or the result (valid until the next call)."""
+        n = len(block)
+        if self.muted:
+            return self.silence[:n]
+        if self.gain_db == 0:
+            return block
+        f = self.fbuf[:n]
+        np.multiply(block, self.factor, out=f)
+        np.rint(f, out=f)
+        np.clip(f, -32768, 32767, out=f)
+        out = self.out[:n]
+        np.copyto(out, f, casting="unsafe")
+        return out
+
+
+class Mixer:
+    """Pre-rendered sounds mixed into outgoing blocks at the sample they start on.
+    All scratch buffers are allocated once."""
+
+    def __init__(self, block_samples, channels=CHANNELS):
+        self.channels = channels
+        self.sounds = {"warning": self.interleave(warning_sound())}
+        self.heartbeat_params = None
+        self.playing = []   # [sound, position] pairs
+        self.acc = np.empty(block_samples, dtype=np.int32)
+        self.out = np.empty(block_samples, dtype=np.int16)
+
+    def interleave(self, mono):
+        return np.repeat(mono, self.channels) if self.channels > 1 else mono
+
+    def sound(self, name):
+        if name == "heartbeat":
+            # Re-rendered only when BEEP_FREQUENCY / DURATION / VOLUME change
+            params = (CONFIG.get_float('BEEP_FREQUENCY', 800), CONFIG.get_float('BEEP_DURATION', 0.3),
+                      CONFIG.get_float('BEEP_VOLUME', 0.3))
+            if params != self.heartbeat_params:
+                self.heartbeat_params, self.sounds["heartbeat"] = params, self.interleave(tone(*params))
+        return self.sounds.get(name)
+
+    def play(self, name):
+        sound = self.sound(name)
+        if sound is None:
+            return False
+        self.playing.append([sound, 0])
+        return True
+
+    def mix(self, block):
+        """block: int16 ndarray. Returns it unchanged, or the mixed result (valid until the next call)."""
+        if not self.playing:
+            return block
+        n = len(block)
+        acc = self.acc[:n]
+        np.copyto(acc, block)
+        for item in self.playing:
+            sound, pos = item
+            chunk = sound[pos:pos + n]
+            acc[:len(chunk)] += chunk
+            item[1] = pos + len(chunk)
+        self.playing = [item for item in self.playing if item[1] < len(item[0])]
+        np.clip(acc, -32768, 32767, out=acc)
+        out = self.out[:n]
+        np.copyto(out, acc, casting="unsafe")
+        return out
+
+
+class CaptureRelay:
+    def __init__(self, dst=1):
+        self.dst = dst
+        self.block_bytes = SAMPLE_RATE * LEVEL_WINDOW_MS // 1000 * 2 * CHANNELS
+        self.block_seconds = LEVEL_WINDOW_MS / 1000
+        self.analyzer = LevelAnalyzer(self.block_bytes // 2)
+        self.gain = GainStage(self.block_bytes // 2)
+        self.mixer = Mixer(self.block_bytes // 2)
+        self.alerts = AlertDispatcher(NTFY_SERVER, NTFY_TOPIC, spool_file=SPOOL_FILE)
+        self.buf = bytearray(self.block_bytes)
+        self.silence = np.zeros(self.block_bytes // 2, dtype=np.int16)
+        self.proc, self.src = None, None
+        self.next_retry = self.next_silence = 0
+        self.restart_requested = False
+        self.got = 0                # Bytes of the current block already in self.buf
+        self.stall_since = None     # time.monotonic() arecord last delivered data, None = flowing
+        self.stalled = False
+        self.last_loud_alert = 0
+        self.sock = None
+
+    def alert(self, title, message, priority, tags):
+        log(f"Alert: {title}")
+        if not os.path.exists(PAUSE_FILE):
+            self.alerts.send(title, message, priority, tags)
+
+    def handle_event(self, event):
+        if event == "dead_air":
+            self.alert("NO AUDIO!", f"Microphone delivers silence for {int(self.analyzer.quiet_seconds)}s. Check mic!",
+                       "urgent", "red_circle,warning,microphone")
+        elif event == "audio_restored":
+            self.alert("Audio Restored", "Microphone signal is back.", "default", "green_circle,microphone")
+        elif event == "loud":
+            log(f"Sustained loudness: {self.analyzer.rms_dbfs:.1f} dBFS for {LOUD_DURATION}s")
+            now = time.time()
+            if LOUD_ALERT_ENABLED and now - self.last_loud_alert >= LOUD_COOLDOWN:
+                self.last_loud_alert = now
+                self.alert("Loud Noise", f"Sustained noise for {LOUD_DURATION}s ({self.analyzer.rms_dbfs:.0f} dBFS).",
+                           "high", "loud_sound,baby")
+
+    # --- Source (arecord) ---
+
+    def start_source(self):
+        """Start arecord if the USB mic is there. False otherwise."""
+        self.next_retry = time.monotonic() + RETRY
+        if not probes.mic_detected():
+            return False
+        self.proc = subprocess.Popen(
+            ["arecord", "-q", "-D", AUDIO_DEVICE, "-f", "S16_LE", "-r", str(SAMPLE_RATE),
+             "-c", str(CHANNELS), "-t", "raw"], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+        self.src = self.proc.stdout.fileno()
+        log(f"Capturing from {AUDIO_DEVICE} (arecord pid {self.proc.pid})")
+        return True
+
+    def stop_source(self):
+        """Stop arecord, returns its exit status"""
+        if self.proc is None:
+            return None
+        self.proc.terminate()
+        try:
+            status = self.proc.wait(2)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            status = self.proc.wait()
+        self.proc.stdout.close()
+        self.proc, self.src = None, None
+        self.got, self.stall_since = 0, None
+        # Silence takes over right away, the stream never stops
+        self.next_silence = time.monotonic()
+        return status
+
+    # --- Control socket ---
+
+    def listen(self):
+        if os.path.exists(SOCKET_PATH):
+            os.unlink(SOCKET_PATH)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(SOCKET_PATH)
+        # Capture runs as _snapserver, the supervisor and bot as the install user
+        os.chmod(SOCKET_PATH, 0o666)
+        self.sock.listen(8)
+        self.sock.setblocking(False)
+
+    def command(self, cmd):
+        args = cmd.split()
+        if args[:1] == ["beep"] and len(args) == 2:
+            if self.mixer.play(args[1]):
+                return {"ok": True}
+            return {"ok": False, "error": f"unknown sound {args[1]!r}"}
+        if args[:1] == ["gain"] and len(args) <= 2:
+            if len(args) == 2:
+                try:
+                    gain_db = float(args[1])
+                    if not math.isfinite(gain_db):
+                        raise ValueError(gain_db)
+                    self.gain.set_gain(gain_db)
+                except ValueError:
+                    return {"ok": False, "error": f"not a number: {args[1]!r}"}
+                log(f"Mic gain {self.gain.gain_db:+.1f} dB")
+            return {"ok": True, "gain_db": self.gain.gain_db, "muted": self.gain.muted}
+        if args in (["mute"], ["unmute"]):
+            self.gain.muted = args == ["mute"]
+            log(f"Mic {'muted' if self.gain.muted else 'unmuted'}")
+            return {"ok": True, "gain_db": self.gain.gain_db, "muted": self.gain.muted}
+        if args == ["restart"]:
+            self.restart_requested = True
+            return {"ok": True}
+        if args == ["status"]:
+            return {"ok": True, "source": "arecord" if self.proc else "silence", "device": AUDIO_DEVICE,
+                    "rms_dbfs": round(self.analyzer.rms_dbfs, 1), "peak_dbfs": round(self.analyzer.peak_dbfs, 1),
+                    "dead_air": self.analyzer.dead_air, "playing": len(self.mixer.playing),
+                    "gain_db": self.gain.gain_db, "muted": self.gain.muted}
+        return {"ok": False, "error": f"unknown command {cmd!r}"}
+
+    def handle_control(self):
+        """Serve every pending connection. Clients are local and send at once,
+        the short timeout keeps a misbehaving one from stalling the audio."""
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except BlockingIOError:
+                return
+            with conn:
+                try:
+                    conn.settimeout(0.05)
+                    control.reply(conn, self.command(conn.makefile().readline().strip()))
+                except OSError:
+                    pass
+
+    # --- Relay loop ---
+
+    def read_block(self):
+        """Fill self.buf from arecord, serving control requests while waiting.
+        Returns the block size in bytes (0 = EOF), None if arecord delivered nothing
+        for one block period. A partly filled block is kept for the next call."""
+        view = memoryview(self.buf)
+        deadline = time.monotonic() + self.block_seconds
+        while self.got < self.block_bytes:
+            ready = select.select([self.src, self.sock], [], [], max(0, deadline - time.monotonic()))[0]
+            if self.sock in ready:
+                self.handle_control()
+            if self.src in ready:
+                n = os.readv(self.src, [view[self.got:]])
+                if n == 0:
+                    break
+                self.got += n
+                deadline = time.monotonic() + self.block_seconds
+            elif not ready:
+                return None
+        got, self.got = self.got, 0
+        return got
+
+    def write(self, data):
+        view = memoryview(data).cast("B")
+        while view:
+            view = view[os.write(self.dst, view):]
+
+    def relay_block(self):
+        n = self.read_block()
+        if n is None:
+            # arecord is alive but wedged: silence on the block clock keeps the stream
+            # and the beeps going, the stall itself is timed here
+            self.write(self.mixer.mix(self.silence))
+            now = time.monotonic()
+            if self.stall_since is None:
+                self.stall_since = now - self.block_seconds
+            if not self.stalled and now - self.stall_since >= DEAD_AIR_TIMEOUT:
+                self.stalled = True
+                self.alert("NO AUDIO!", f"Audio capture delivered no data for {DEAD_AIR_TIMEOUT}s.",
+                           "urgent", "red_circle,warning,microphone")
+            return
+        self.stall_since = None
+        if self.stalled:
+            self.stalled = False
+            self.alert("Audio Restored", "Audio capture is delivering data again.", "default", "green_circle,microphone")
+        n -= n % (2 * CHANNELS)
+        if n == 0:
+            log(f"arecord exited ({self.stop_source()}), relaying silence")
+            return
+        block = np.frombuffer(self.buf, dtype=np.int16, count=n // 2)
+        # Beeps go on top of the (possibly muted) mic, so the heartbeat stays audible
+        self.write(self.mixer.mix(self.gain.apply(block)))
+        # Levels of the raw mic signal: neither beeps nor mute / gain may hide dead air
+        for event in self.analyzer.process(block):
+            self.handle_event(event)
+
+    def relay_silence(self):
+        """No mic: silence on the block clock, so the stream stays up and beeps get through"""
+        now = time.monotonic()
+        if select.select([self.sock], [], [], max(0, self.next_silence - now))[0]:
+            self.handle_control()
+        now = time.monotonic()
+        if now >= self.next_silence:
+            self.write(self.mixer.mix(self.silence))
+            # Catch up after a long pause rather than bursting every missed block
+            self.next_silence = max(self.next_silence + self.block_seconds, now - self.block_seconds)
+        if now >= self.next_retry:
+            self.start_source()
+
+    def run(self):
+        log(f"Capture relay started | Window: {LEVEL_WINDOW_MS}ms | Dead air: {DEAD_AIR_DBFS} dBFS for {DEAD_AIR_TIMEOUT}s")
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.listen()
+        if not self.start_source():
+            log("No USB mic, relaying silence until it is plugged in")
+        try:
+            while True:
+                # BEEP_* edits reach the mixer without a restart
+                CONFIG.check()
+                if self.restart_requested:
+                    self.restart_requested = False
+                    self.stop_source()
+                    self.start_source()
+                if self.proc:
+                    self.relay_block()
+                else:
+                    self.relay_silence()
+        finally:
+            self.stop_source()
+            os.unlink(SOCKET_PATH)
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if cmd != "run":
+        if cmd not in ("gain", "mute", "unmute", "status") or len(sys.argv) > (3 if cmd == "gain" else 2):
+            print("Usage: capture.py [run] | gain [DB] | mute | unmute | status")
+            sys.exit(1)
+        reply = control.request(SOCKET_PATH, " ".join(sys.argv[1:]))
+        if reply is None:
+            print("Capture relay not running (babymonitor-audio.service)")
+            sys.exit(1)
+        if not reply["ok"]:
+            print(f"Failed: {reply['error']}")
+        elif cmd == "status":
+            for key, value in reply.items():
+                if key != "ok":
+                    print(f"  {key + ':':<12} {value}")
+        else:
+            print(f"Mic gain: {reply['gain_db']:+.1f} dB" + (" (MUTED)" if reply["muted"] else ""))
+        sys.exit(0 if reply["ok"] else 1)
+    # fd 1 carries audio, anything printed must go to the journal instead
+    sys.stdout = sys.stderr
+    try:
+        CaptureRelay().run()
+    except BrokenPipeError:
+        log("Fifo reader went away")
+        sys.exit(1)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Line-based control sockets of the long-running BabyMonitor processes
+- One command line in, one JSON object line out, then the connection closes
+- supervisor.py: /tmp/babymonitor-supervisor.sock, capture.py: /tmp/babymonitor-capture.sock
+Used by supervisor.py and micwatch.py (clients), capture.py (server).
+Usage: control.py SOCKET COMMAND...
+"""
+import json, socket, sys
+
+CAPTURE_SOCKET = "/tmp/babymonitor-capture.sock"
+
+
+def request(path, cmd, timeout=5):
+    """Send one command, return the decoded reply. None if nobody listens."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(f"{cmd}\n".encode())
+            return json.loads(sock.makefile().readline())
+    except (OSError, ValueError):
+        return None
+
+
+def reply(conn, data):
+    conn.sendall((json.dumps(data) + "\n").encode())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: control.py SOCKET COMMAND...")
+        sys.exit(1)
+    result = request(sys.argv[1], " ".join(sys.argv[2:]))
+    print(json.dumps(result))
+    sys.exit(0 if result and result.get("ok") else 1)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Asyncio subprocess executor for the Telegram bot
+- argv lists only, no shell (no quoting bugs with SSIDs or passwords)
+- Per-command timeout, the process group is terminated when it runs over
+- Concurrency limit per command class, so a slow git fetch or WiFi connect
+  never holds up quick status queries
+- Cancelling the awaiting task terminates the process
+- on_line: output handed over line by line while the command runs (auth URLs
+  of `tailscale up`, which keeps running until the login is done)
+"""
+import asyncio, logging, os, signal
+
+logger = logging.getLogger(__name__)
+
+# Concurrent commands per class. Quick read-only queries may overlap,
+# anything that changes system state runs one at a time.
+LIMITS = {
+    "query": 4,     # systemctl is-active, tailscale ip, nmcli list, journalctl, ...
+    "service": 1,   # systemctl start / stop / restart, reboot
+    "network": 1,   # nmcli connect / radio, tailscale logout
+    "git": 1,
+    "media": 1,     # beeps into the stream (speaker playback has its own queue, playback.py)
+    "login": 1,     # sudo tailscale up, runs until the browser login is done
+}
+KILL_GRACE = 2      # Seconds between SIGTERM and SIGKILL
+
+
+class Executor:
+    def __init__(self, limits=LIMITS):
+        self.limits = dict(limits)
+        self.semaphores = {}
+
+    def semaphore(self, kind):
+        # Created lazily so they bind to the running event loop
+        if kind not in self.semaphores:
+            self.semaphores[kind] = asyncio.Semaphore(self.limits.get(kind, 1))
+        return self.semaphores[kind]
+
+    async def run(self, *argv, timeout=30, kind="query", cwd=None, stderr=True, on_line=None):
+        """Run argv and return (ok, output). output is stdout, followed by stderr
+        unless stderr=False. With on_line, stdout and stderr are merged and every
+        line is passed to on_line(line) as it arrives. Never raises for a failing
+        or missing command."""
+        async with self.semaphore(kind):
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *argv, cwd=cwd,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=(asyncio.subprocess.STDOUT if on_line else
+                            asyncio.subprocess.PIPE if stderr else asyncio.subprocess.DEVNULL),
+                    # Own process group, so children (sudo, pipes) are terminated too
+                    start_new_session=True,
+                )
+            except OSError as e:
+                return False, str(e)
+            try:
+                if on_line:
+                    out, err = await asyncio.wait_for(self.read_lines(proc, on_line), timeout), None
+                else:
+                    out, err = await asyncio.wait_for(proc.communicate(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Command timed out after {timeout}s: {' '.join(argv)}")
+                await self.terminate(proc)
+                return False, "Command timed out"
+            except asyncio.CancelledError:
+                await asyncio.shield(self.terminate(proc))
+                raise
+            output = out.decode(errors="replace") + (err.decode(errors="replace") if err else "")
+            return proc.returncode == 0, output
+
+    @staticmethod
+    async def read_lines(proc, on_line):
+        lines = []
+        async for line in proc.stdout:
+            lines.append(line)
+            on_line(line.decode(errors="replace").rstrip("\n"))
+        await proc.wait()
+        return b"".join(lines)
+
+    @staticmethod
+    async def terminate(proc):
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(proc.pid, sig)
+            except (ProcessLookupError, PermissionError):
+                pass
+            try:
+                await asyncio.wait_for(proc.wait(), KILL_GRACE)
+                return
+            except asyncio.TimeoutError:
+                continue
+
+
+EXECUTOR = Executor()
+
+
+async def run(*argv, **kwargs):
+    return await EXECUTOR.run(*argv, **kwargs)
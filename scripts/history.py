@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Persistent event history (SQLite, WAL mode, indexed by time)
+- Connection losses / restorations, stream idle, mic failures, pauses, alerts
+- EventLog batches writes in a background thread so the SD card is not hit per event
+- summary() answers "disconnects in the last 24h / 7d", per-client uptime and
+  longest outage from the time index, without reading logs
+Used by monitor.py, micwatch.py, babymonitor-ctl and telegram-bot.py.
+Usage: history.py record KIND [SUBJECT] [DETAIL] | history.py summary [DAYS]
+"""
+import atexit, sqlite3, sys, threading, time
+from datetime import datetime
+
+HISTORY_DB = "/opt/babymonitor/config/history.db"
+FLUSH_INTERVAL = 30     # Seconds an event may wait in memory before it is written
+FLUSH_BATCH = 100       # Write early once this many events are pending
+KEEP_DAYS = 90          # Older events are pruned when the monitor starts
+
+# Event kinds
+CLIENT_CONNECTED = "client_connected"
+CLIENT_DISCONNECTED = "client_disconnected"
+STREAM_IDLE = "stream_idle"
+STREAM_PLAYING = "stream_playing"
+MIC_LOST = "mic_lost"
+MIC_RESTORED = "mic_restored"
+PAUSED = "paused"
+RESUMED = "resumed"
+ALERT = "alert"
+MONITOR_START = "monitor_start"
+MONITOR_STOP = "monitor_stop"
+
+# While the monitor is stopped or paused nobody knows whether clients are connected
+UNKNOWN_FROM = (MONITOR_START, MONITOR_STOP, PAUSED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (ts REAL NOT NULL, kind TEXT NOT NULL, subject TEXT NOT NULL DEFAULT '', detail TEXT NOT NULL DEFAULT '');
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_kind_ts ON events (kind, ts);
+"""
+
+
+def connect(path=HISTORY_DB, readonly=False):
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+    db = sqlite3.connect(path, timeout=5)
+    db.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL: a commit is one sequential append, fsync only at checkpoints
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def record(kind, subject="", detail="", path=HISTORY_DB):
+    """Write one event immediately, for short-lived callers (bot, shell scripts)"""
+    with connect(path) as db:
+        db.execute("INSERT INTO events VALUES (?, ?, ?, ?)", (time.time(), kind, subject, detail))
+    db.close()
+
+
+class EventLog:
+    """Buffered writer for long-running processes. record() never touches the disk."""
+
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self.pending = []
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="history-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def log(self, msg):
+        print(f"[{datetime.now()}] {msg}")
+
+    def record(self, kind, subject="", detail="", ts=None):
+        with self.cond:
+            self.pending.append((ts or time.time(), kind, subject, detail))
+            if len(self.pending) >= FLUSH_BATCH:
+                self.cond.notify()
+
+    def write(self, db):
+        """Write everything pending in one transaction"""
+        with self.cond:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            with db:
+                db.executemany("INSERT INTO events VALUES (?, ?, ?, ?)", batch)
+        except sqlite3.Error as e:
+            self.log(f"History write failed, {len(batch)} event(s) lost: {e}")
+
+    def prune(self, db):
+        with db:
+            db.execute("DELETE FROM events WHERE ts < ?", (time.time() - KEEP_DAYS * 86400,))
+
+    def run(self):
+        try:
+            db = connect(self.path)
+            self.prune(db)
+        except sqlite3.Error as e:
+            self.log(f"History database unavailable ({self.path}): {e}")
+            return
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: len(self.pending) >= FLUSH_BATCH, FLUSH_INTERVAL)
+            self.write(db)
+
+    def flush(self):
+        """Write pending events now (at exit), from a connection of the calling thread"""
+        with self.cond:
+            if not self.pending:
+                return
+        try:
+            db = connect(self.path)
+            self.write(db)
+            db.close()
+        except sqlite3.Error as e:
+            self.log(f"History flush failed: {e}")
+
+
+# ============== Queries ==============
+
+def counts(db, since):
+    """Number of events per kind since a timestamp (range scan on the time index)"""
+    return dict(db.execute("SELECT kind, COUNT(*) FROM events WHERE ts >= ? GROUP BY kind", (since,)))
+
+
+def presence(db, since, until):
+    """Per client name: [connected seconds, disconnected seconds, longest outage, disconnects]
+    between since and until. Time while the monitor was stopped or paused is not counted."""
+    stats, cur = {}, {}     # cur: name -> (state kind, since when)
+
+    def close(name, end):
+        kind, start = cur.pop(name)
+        s = stats.setdefault(name, [0.0, 0.0, 0.0, 0])
+        if kind == CLIENT_CONNECTED:
+            s[0] += end - max(start, since)
+        else:
+            s[1] += end - max(start, since)
+            # An outage that began before the window still counts in full
+            s[2] = max(s[2], end - start)
+
+    # State at the window start: last client event before it, unless the monitor stopped since
+    boundary = db.execute("SELECT MAX(ts) FROM events WHERE kind IN (?, ?, ?) AND ts < ?",
+                          (*UNKNOWN_FROM, since)).fetchone()[0]
+    for name, kind, ts in db.execute(
+            "SELECT subject, kind, MAX(ts) FROM events WHERE kind IN (?, ?) AND ts < ? GROUP BY subject",
+            (CLIENT_CONNECTED, CLIENT_DISCONNECTED, since)):
+        if boundary is None or ts > boundary:
+            cur[name] = (kind, ts)
+
+    for ts, kind, name in db.execute(
+            "SELECT ts, kind, subject FROM events WHERE ts >= ? AND ts < ? AND kind IN (?, ?, ?, ?, ?) ORDER BY ts",
+            (since, until, CLIENT_CONNECTED, CLIENT_DISCONNECTED, *UNKNOWN_FROM)):
+        if kind in UNKNOWN_FROM:
+            for other in list(cur):
+                close(other, ts)
+            continue
+        if name in cur:
+            if cur[name][0] == kind:
+                continue
+            close(name, ts)
+        cur[name] = (kind, ts)
+        if kind == CLIENT_DISCONNECTED:
+            stats.setdefault(name, [0.0, 0.0, 0.0, 0])[3] += 1
+    for name in list(cur):
+        close(name, until)
+    return stats
+
+
+def uptime_percent(stat):
+    observed = stat[0] + stat[1]
+    return 100 * stat[0] / observed if observed else None
+
+
+def summary(days=7, now=None, path=HISTORY_DB, recent=10):
+    """Counts for the last 24h and the last `days`, per-client presence and the latest events"""
+    now = now or time.time()
+    db = connect(path, readonly=True)
+    try:
+        return {
+            "day": counts(db, now - 86400),
+            "window": counts(db, now - days * 86400),
+            "clients": presence(db, now - days * 86400, now),
+            "recent": db.execute("SELECT ts, kind, subject, detail FROM events WHERE kind != ? ORDER BY ts DESC LIMIT ?",
+                                 (ALERT, recent)).fetchall(),
+        }
+    finally:
+        db.close()
+
+
+def duration(secs):
+    """Compact duration: 12s, 5m 3s, 2h 14m, 3d 4h"""
+    secs = int(secs)
+    if secs < 60:
+        return f"{secs}s"
+    if secs < 3600:
+        return f"{secs // 60}m {secs % 60}s"
+    if secs < 86400:
+        return f"{secs // 3600}h {secs % 3600 // 60}m"
+    return f"{secs // 86400}d {secs % 86400 // 3600}h"
+
+
+def print_summary(days):
+    s = summary(days)
+    for label, c in (("Last 24h", s["day"]), (f"Last {days}d", s["window"])):
+        print(f"{label}: {c.get(CLIENT_DISCONNECTED, 0)} disconnects, {c.get(MIC_LOST, 0)} mic failures, "
+              f"{c.get(STREAM_IDLE, 0)} stream idle, {c.get(PAUSED, 0)} pauses, {c.get(ALERT, 0)} alerts")
+    print("")
+    print(f"Clients ({days}d):")
+    for name, stat in sorted(s["clients"].items()):
+        pct = uptime_percent(stat)
+        print(f"  {name}: {'-' if pct is None else f'{pct:.1f}%'} connected, "
+              f"longest outage {duration(stat[2])}, {stat[3]} disconnects")
+    if not s["clients"]:
+        print("  No client events")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["record"] and len(sys.argv) >= 3:
+        record(*sys.argv[2:5])
+    elif sys.argv[1:2] == ["summary"]:
+        try:
+            print_summary(int(sys.argv[2]) if len(sys.argv) > 2 else 7)
+        except sqlite3.Error as e:
+            print(f"No history available ({e})")
+            sys.exit(1)
+    else:
+        print("Usage: history.py record KIND [SUBJECT] [DETAIL] | history.py summary [DAYS]")
+        sys.exit(1)
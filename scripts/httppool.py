@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for ntfy, healthchecks.io, F-Droid and Telegram downloads
+- Keep-alive connections pooled per host, reused across requests
+- TLS sessions resumed when a connection has to be re-established
+- Concurrent fan-out for pinging several URLs at once
+- Streamed downloads, handed over chunk by chunk as they arrive
+Usable from Python (import httppool) and from shell scripts (CLI below).
+"""
+import http.client, json, socket, ssl, sys, threading, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+USER_AGENT = "bebefon"
+DEFAULT_TIMEOUT = 10
+MAX_IDLE_PER_HOST = 4
+FAN_OUT_WORKERS = 8
+
+# Errors that mean a kept-alive connection went stale and the request can be retried
+STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, BrokenPipeError, ConnectionResetError)
+
+
+class HTTPError(Exception):
+    """Transport failure (status is None) or HTTP error status >= 400"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class Response:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status, headers, body):
+        self.status, self.headers, self.body = status, headers, body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class TLSConnection(http.client.HTTPSConnection):
+    """HTTPS connection that offers the pool's last TLS session for resumption"""
+
+    def __init__(self, host, port, pool, timeout):
+        super().__init__(host, port, timeout=timeout, context=pool.context)
+        self.pool = pool
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        session = self.pool.sessions.get((self.host, self.port))
+        try:
+            self.sock = self._context.wrap_socket(sock, server_hostname=self.host, session=session)
+        except ssl.SSLError:
+            if session is None:
+                sock.close()
+                raise
+            # Server refused the cached session, fall back to a full handshake
+            self.pool.sessions.pop((self.host, self.port), None)
+            sock.close()
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+            self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class HTTPPool:
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.context = ssl.create_default_context()
+        self.sessions = {}
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _connection(self, key, timeout):
+        """Return (connection, reused) for scheme/host/port key"""
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                conn = conns.pop()
+                conn.timeout = timeout
+                if conn.sock:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        scheme, host, port = key
+        if scheme == "https":
+            return TLSConnection(host, port, self, timeout), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _release(self, key, conn):
+        if conn.sock is None:
+            return
+        if key[0] == "https" and getattr(conn.sock, "session", None):
+            self.sessions[key[1:]] = conn.sock.session
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            if len(conns) < MAX_IDLE_PER_HOST:
+                conns.append(conn)
+                return
+        conn.close()
+
+    @staticmethod
+    def _split(url):
+        u = urllib.parse.urlsplit(url)
+        if u.scheme not in ("http", "https"):
+            raise HTTPError(f"unsupported URL: {url}")
+        port = u.port or (443 if u.scheme == "https" else 80)
+        path = u.path or "/"
+        if u.query:
+            path += "?" + u.query
+        return (u.scheme, u.hostname, port), path
+
+    def open(self, method, url, body=None, headers=None, timeout=None):
+        """Send a request and return (key, connection, raw response) with the body unread"""
+        key, path = self._split(url)
+        hdrs = {"User-Agent": USER_AGENT}
+        hdrs.update(headers or {})
+        if isinstance(body, str):
+            body = body.encode()
+        for attempt in (1, 2):
+            conn, reused = self._connection(key, timeout or self.timeout)
+            try:
+                conn.request(method, path, body=body, headers=hdrs)
+                return key, conn, conn.getresponse()
+            except STALE_ERRORS as e:
+                conn.close()
+                if not reused or attempt == 2:
+                    raise HTTPError(f"{method} {url}: {e}") from e
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise HTTPError(f"{method} {url}: {e}") from e
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        key, conn, resp = self.open(method, url, body, headers, timeout)
+        try:
+            data = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise HTTPError(f"{method} {url}: {e}") from e
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        if resp.status >= 400:
+            raise HTTPError(f"{method} {url}: HTTP {resp.status} {resp.reason}", resp.status)
+        return Response(resp.status, dict(resp.getheaders()), data)
+
+    def stream(self, url, chunk_size=65536, headers=None, timeout=None):
+        """GET url and yield the body as it arrives. read1() hands over whatever
+        is buffered instead of waiting for a full chunk, so consumers start early."""
+        key, conn, resp = self.open("GET", url, headers=headers, timeout=timeout)
+        if resp.status >= 400:
+            conn.close()
+            raise HTTPError(f"GET {url}: HTTP {resp.status} {resp.reason}", resp.status)
+        complete = False
+        try:
+            while chunk := resp.read1(chunk_size):
+                yield chunk
+            complete = True
+        except (OSError, http.client.HTTPException) as e:
+            raise HTTPError(f"GET {url}: {e}") from e
+        finally:
+            # Abandoned halfway: the rest of the body is still on the wire
+            if complete and not resp.will_close:
+                self._release(key, conn)
+            else:
+                conn.close()
+
+    def get(self, url, **kw):
+        return self.request("GET", url, **kw)
+
+    def post(self, url, data, **kw):
+        return self.request("POST", url, body=data, **kw)
+
+    def fan_out(self, method, urls, **kw):
+        """Run the same request against several URLs concurrently.
+        Returns a list of Response or HTTPError, in the order of urls."""
+        def one(url):
+            try:
+                return self.request(method, url, **kw)
+            except HTTPError as e:
+                return e
+        urls = list(urls)
+        if len(urls) <= 1:
+            return [one(u) for u in urls]
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(FAN_OUT_WORKERS, thread_name_prefix="http")
+        return list(self.executor.map(one, urls))
+
+
+# Process-wide pool
+POOL = HTTPPool()
+
+
+def get(url, **kw):
+    return POOL.get(url, **kw)
+
+
+def post(url, data, **kw):
+    return POOL.post(url, data, **kw)
+
+
+def stream(url, **kw):
+    return POOL.stream(url, **kw)
+
+
+def ping_all(urls, suffix=""):
+    """Ping every URL concurrently (healthchecks.io). Returns list of bools."""
+    return [not isinstance(r, HTTPError) for r in POOL.fan_out("GET", [u + suffix for u in urls])]
+
+
+def main(argv):
+    """
+    httppool.py post URL [-H 'Name: value']... [-d DATA]
+    httppool.py ping [--suffix /0] URL...
+    """
+    if len(argv) >= 2 and argv[0] == "post":
+        url, headers, data, rest = argv[1], {}, b"", argv[2:]
+        while rest:
+            opt, val, rest = rest[0], rest[1] if len(rest) > 1 else "", rest[2:]
+            if opt == "-H" and ":" in val:
+                name, value = val.split(":", 1)
+                headers[name.strip()] = value.strip()
+            elif opt == "-d":
+                data = val.encode()
+            else:
+                print(main.__doc__)
+                return 2
+        try:
+            post(url, data, headers=headers)
+        except HTTPError as e:
+            print(e, file=sys.stderr)
+            return 1
+        return 0
+    if argv and argv[0] == "ping":
+        rest, suffix = argv[1:], ""
+        if rest[:1] == ["--suffix"]:
+            suffix, rest = rest[1], rest[2:]
+        return 0 if all(ping_all(rest, suffix)) else 1
+    print(main.__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
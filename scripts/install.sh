@@ -46,7 +46,7 @@ sudo DEBIAN_FRONTEND=noninteractive apt upgrade -y || echo -e "${YELLOW}Warning:
 
 # Step 2: Install dependencies
 echo -e "${YELLOW}Step 2: Installing dependencies...${NC}"
-sudo apt install -y snapserver alsa-utils netcat-openbsd python3 python3-pip sox ffmpeg curl
+sudo apt install -y snapserver alsa-utils netcat-openbsd python3 python3-pip python3-numpy sox ffmpeg curl
 
 # Step 3: Install Python packages
 echo -e "${YELLOW}Step 3: Installing Python packages...${NC}"
@@ -102,7 +102,7 @@ Requires=snapserver.service
 [Service]
 Type=simple
 ExecStartPre=/bin/sleep 5
-ExecStart=/bin/bash -c 'while ! arecord -l 2>/dev/null | grep -q USB; do sleep 2; done; sleep 2; exec arecord -D ${AUDIO_DEVICE} -f S16_LE -r ${SAMPLE_RATE:-48000} -c ${CHANNELS:-1} -t raw > /tmp/snapfifo'
+ExecStart=/bin/bash -c 'exec python3 ${INSTALL_DIR}/scripts/capture.py > /tmp/snapfifo'
 Restart=always
 RestartSec=5
 User=_snapserver
@@ -112,16 +112,17 @@ Group=audio
 WantedBy=multi-user.target
 EOF
 
-# Monitor service
+# Monitor service (supervisor: connection monitor, mic hot-plug watcher, heartbeat beep)
 sudo tee /etc/systemd/system/babymonitor-monitor.service > /dev/null << EOF
 [Unit]
-Description=BabyMonitor Connection Monitor
+Description=BabyMonitor Supervisor (Connection Monitor, Mic Watcher, Heartbeat)
 After=network-online.target snapserver.service
 Wants=network-online.target
 
 [Service]
 Type=simple
-ExecStart=/usr/bin/python3 ${INSTALL_DIR}/scripts/monitor.py
+ExecStart=/usr/bin/python3 ${INSTALL_DIR}/scripts/supervisor.py
+ExecReload=/bin/kill -HUP \$MAINPID
 Restart=always
 RestartSec=10
 User=$USER
@@ -131,18 +132,19 @@ EnvironmentFile=${CONFIG_FILE}
 WantedBy=multi-user.target
 EOF
 
-# Mic alert service
-sudo tee /etc/systemd/system/babymonitor-mic-alert.service > /dev/null << EOF
+# Status daemon (snapshot for the bot, status.sh and babymonitor-ctl)
+sudo tee /etc/systemd/system/babymonitor-status.service > /dev/null << EOF
 [Unit]
-Description=BabyMonitor Mic Alert Loop
-After=snapserver.service
+Description=BabyMonitor Status Daemon
+After=network-online.target snapserver.service
 
 [Service]
 Type=simple
-ExecStart=${INSTALL_DIR}/scripts/mic-alert-loop.sh
+ExecStart=/usr/bin/python3 ${INSTALL_DIR}/scripts/statusd.py serve
 Restart=always
 RestartSec=5
-User=_snapserver
+User=$USER
+SupplementaryGroups=audio
 
 [Install]
 WantedBy=multi-user.target
@@ -167,79 +169,25 @@ WorkingDirectory=${INSTALL_DIR}
 WantedBy=multi-user.target
 EOF
 
-# Step 9: Create mic-alert-loop script
-echo -e "${YELLOW}Step 9: Creating mic-alert-loop script...${NC}"
-cat > ${INSTALL_DIR}/scripts/mic-alert-loop.sh << 'EOF'
-#!/bin/bash
-# Continuous warning beep while mic is disconnected
-
-CONFIG_FILE="/opt/babymonitor/config/config.env"
-PIPE="/tmp/snapfifo"
-PAUSE_FILE="/opt/babymonitor/config/paused"
-WARNING_BEEP_FILE="/opt/babymonitor/config/warning_beep.raw"
-
-source "$CONFIG_FILE" 2>/dev/null
+# Step 9: Remove the old mic alert loop service (its job moved into supervisor.py)
+sudo systemctl disable --now babymonitor-mic-alert 2>/dev/null || true
+sudo rm -f /etc/systemd/system/babymonitor-mic-alert.service ${INSTALL_DIR}/scripts/mic-alert-loop.sh
 
-# Generate warning beep if not exists
-if [ ! -f "$WARNING_BEEP_FILE" ]; then
-    sox -n -r 48000 -b 16 -c 1 -t raw /tmp/beep1.raw synth 0.15 sine 1200 vol 0.4 2>/dev/null
-    sox -n -r 48000 -b 16 -c 1 -t raw /tmp/silence.raw synth 0.1 sine 0 vol 0 2>/dev/null
-    cat /tmp/beep1.raw /tmp/silence.raw /tmp/beep1.raw /tmp/silence.raw /tmp/beep1.raw > "$WARNING_BEEP_FILE"
-    rm -f /tmp/beep1.raw /tmp/silence.raw
-fi
-
-while true; do
-    if [ -f "$PAUSE_FILE" ]; then
-        sleep 5
-        continue
-    fi
-
-    if ! arecord -l 2>/dev/null | grep -q "USB"; then
-        if [ -p "$PIPE" ]; then
-            cat "$WARNING_BEEP_FILE" >> "$PIPE" 2>/dev/null
-        fi
-        sleep 3
-    else
-        sleep 5
-    fi
-done
-EOF
-chmod +x ${INSTALL_DIR}/scripts/mic-alert-loop.sh
-
-# Step 9b: Pre-generate warning beep file with correct permissions
-echo -e "${YELLOW}Step 9b: Generating warning beep audio file...${NC}"
-sox -n -r 48000 -b 16 -c 1 -t raw /tmp/beep1.raw synth 0.15 sine 1200 vol 0.4 2>/dev/null
-sox -n -r 48000 -b 16 -c 1 -t raw /tmp/silence.raw synth 0.1 sine 0 vol 0 2>/dev/null
-cat /tmp/beep1.raw /tmp/silence.raw /tmp/beep1.raw /tmp/silence.raw /tmp/beep1.raw > ${INSTALL_DIR}/config/warning_beep.raw
-rm -f /tmp/beep1.raw /tmp/silence.raw
-sudo chown _snapserver:audio ${INSTALL_DIR}/config/warning_beep.raw
-echo -e "${GREEN}Warning beep file created${NC}"
-
-# Step 9c: Pre-generate heartbeat beep file with correct permissions
-echo -e "${YELLOW}Step 9c: Generating heartbeat beep audio file...${NC}"
-sox -n -r 48000 -b 16 -c 1 -t raw ${INSTALL_DIR}/config/beep.raw synth ${BEEP_DURATION:-0.3} sine ${BEEP_FREQUENCY:-800} vol ${BEEP_VOLUME:-0.3} 2>/dev/null
-echo "${BEEP_FREQUENCY:-800}_${BEEP_DURATION:-0.3}_${BEEP_VOLUME:-0.3}" > ${INSTALL_DIR}/config/beep_params
-sudo chown _snapserver:audio ${INSTALL_DIR}/config/beep.raw ${INSTALL_DIR}/config/beep_params
-echo -e "${GREEN}Heartbeat beep file created${NC}"
+# Beeps are rendered by capture.py now, remove the file from older installs
+rm -f ${INSTALL_DIR}/config/warning_beep.raw
 
 # Step 10: Set up cron jobs
 echo -e "${YELLOW}Step 10: Setting up cron jobs...${NC}"
 
-# Heartbeat beep cron (as _snapserver user)
+# Heartbeat beep and mic check are scheduled by supervisor.py, remove their cron jobs from older installs
 sudo -u _snapserver crontab -l 2>/dev/null | grep -v heartbeat-beep > /tmp/snapserver_cron || true
-echo "*/5 * * * * ${INSTALL_DIR}/scripts/heartbeat-beep.sh" >> /tmp/snapserver_cron
 sudo -u _snapserver crontab /tmp/snapserver_cron
 rm /tmp/snapserver_cron
-
-# Mic check cron
-(crontab -l 2>/dev/null | grep -v mic-check; echo "* * * * * ${INSTALL_DIR}/scripts/mic-check.sh") | crontab -
+(crontab -l 2>/dev/null | grep -v mic-check) | crontab - || true
 
 # Healthchecks.io ping cron
 if [ -n "$HEALTHCHECK_URLS" ]; then
-    PING_CMD="[ ! -f ${INSTALL_DIR}/config/paused ]"
-    for url in $HEALTHCHECK_URLS; do
-        PING_CMD="$PING_CMD && curl -fsS -m 10 --retry 3 '$url' > /dev/null 2>&1"
-    done
+    PING_CMD="[ ! -f ${INSTALL_DIR}/config/paused ] && python3 ${INSTALL_DIR}/scripts/httppool.py ping $HEALTHCHECK_URLS > /dev/null 2>&1"
     (crontab -l 2>/dev/null | grep -v hc-ping; echo "* * * * * $PING_CMD") | crontab -
     echo -e "${GREEN}Healthchecks.io configured${NC}"
 fi
@@ -260,10 +208,10 @@ EOF
 # Step 13: Enable and start services
 echo -e "${YELLOW}Step 13: Enabling and starting services...${NC}"
 sudo systemctl daemon-reload
-sudo systemctl enable snapserver babymonitor-audio babymonitor-monitor babymonitor-mic-alert babymonitor-telegram
+sudo systemctl enable snapserver babymonitor-audio babymonitor-monitor babymonitor-status babymonitor-telegram
 sudo systemctl restart snapserver
 sleep 3
-sudo systemctl start babymonitor-audio babymonitor-monitor babymonitor-mic-alert babymonitor-telegram
+sudo systemctl start babymonitor-audio babymonitor-monitor babymonitor-status babymonitor-telegram
 
 # Step 14: Wait and check status
 echo -e "${YELLOW}Step 14: Checking service status...${NC}"
@@ -271,7 +219,7 @@ sleep 5
 
 echo ""
 echo "Service Status:"
-for svc in snapserver babymonitor-audio babymonitor-monitor babymonitor-mic-alert babymonitor-telegram tailscaled; do
+for svc in snapserver babymonitor-audio babymonitor-monitor babymonitor-status babymonitor-telegram tailscaled; do
     STATUS=$(systemctl is-active $svc 2>/dev/null || echo "not installed")
     if [ "$STATUS" = "active" ]; then
         echo -e "  ${GREEN}✓${NC} $svc: $STATUS"
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Live systemd journal of one unit, for /logs follow in the Telegram bot
+- One `journalctl -f -o json` reader per follow, entries arrive as they are logged
+- The __CURSOR of every entry is kept; if the reader dies it is restarted
+  with --after-cursor, so nothing is shown twice or lost
+Used by telegram-bot.py.
+Usage: journal.py UNIT
+"""
+import asyncio, json, sys
+from datetime import datetime
+
+import executor
+
+RESTART_DELAY = 2       # Seconds before a dead reader is restarted
+LINE_LIMIT = 2**20      # A single journal entry can be long (stack traces)
+
+
+def format_entry(entry):
+    """'12:03:04 telegram-bot.py[812]: message', the journalctl short format without date and host"""
+    message = entry.get("MESSAGE", "")
+    if isinstance(message, list):
+        # Binary messages come as a byte array
+        message = bytes(message).decode(errors="replace")
+    try:
+        ts = datetime.fromtimestamp(int(entry["__REALTIME_TIMESTAMP"]) / 1e6).strftime("%H:%M:%S")
+    except (KeyError, ValueError):
+        ts = "--:--:--"
+    ident = entry.get("SYSLOG_IDENTIFIER") or entry.get("_COMM", "")
+    pid = f"[{entry['_PID']}]" if entry.get("_PID") else ""
+    return f"{ts} {ident}{pid}: {message}"
+
+
+class JournalFollower:
+    def __init__(self, unit, lines=10):
+        self.unit, self.lines = unit, lines
+        self.cursor = None
+        self.proc = None
+
+    def argv(self):
+        argv = ["journalctl", "-u", self.unit, "-f", "-o", "json", "--no-pager"]
+        # First start: the last few entries for context. Restart: exactly where it stopped.
+        return argv + (["--after-cursor", self.cursor] if self.cursor else ["-n", str(self.lines)])
+
+    async def entries(self):
+        """Yield journal entries (dicts) until cancelled"""
+        while True:
+            self.proc = await asyncio.create_subprocess_exec(
+                *self.argv(), stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL, limit=LINE_LIMIT, start_new_session=True)
+            try:
+                oversized = False
+                while True:
+                    try:
+                        line = await self.proc.stdout.readline()
+                    except (ValueError, asyncio.LimitOverrunError):
+                        # Entry over LINE_LIMIT: dropped by the reader (possibly in several
+                        # pieces), one stand-in keeps the gap visible. A tail still to come
+                        # does not parse as JSON and is skipped below.
+                        if not oversized:
+                            oversized = True
+                            yield {"MESSAGE": f"[entry longer than {LINE_LIMIT // 2**20} MiB skipped]"}
+                        continue
+                    if not line:
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    oversized = False
+                    self.cursor = entry.get("__CURSOR", self.cursor)
+                    yield entry
+            finally:
+                await asyncio.shield(executor.Executor.terminate(self.proc))
+            await asyncio.sleep(RESTART_DELAY)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: journal.py UNIT")
+        sys.exit(1)
+
+    async def main():
+        async for entry in JournalFollower(sys.argv[1]).entries():
+            print(format_entry(entry), flush=True)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Minimal Prometheus text-format metrics (no client library needed)
+- Counter / Gauge / Histogram, cheap enough to update on the hot loop
+- Optional HTTP endpoint served from a daemon thread
+"""
+import bisect, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from local RPC round-trips up to slow ntfy deliveries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {} if labelnames else {(): 0}
+        (registry or REGISTRY).register(self)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in list(self.values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    """Set explicitly, or give a function that is evaluated at scrape time"""
+
+    def __init__(self, name, help, fn=None, registry=None):
+        self.name, self.help, self.fn, self.value = name, help, fn, 0
+        (registry or REGISTRY).register(self)
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, fn):
+        self.fn = fn
+
+    def render(self):
+        value = self.value
+        if self.fn:
+            try:
+                value = self.fn()
+            except Exception:
+                return
+        if value is None:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS, registry=None):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        (registry or REGISTRY).register(self)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f'{self.name}_bucket{{le="{bound}"}} {total}'
+        total += self.counts[-1]
+        yield f'{self.name}_bucket{{le="+Inf"}} {total}'
+        yield f"{self.name}_sum {self.sum}"
+        yield f"{self.name}_count {total}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        lines = [line for m in self.metrics for line in m.render()]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, address="127.0.0.1"):
+    """Expose REGISTRY at http://address:port/metrics from a daemon thread"""
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+USB microphone hot-plug watcher
+- inotify on /dev/snd: ALSA card add / remove is seen within milliseconds,
+  the card list itself is then read from /proc/asound (probes.py)
+- Same ntfy alerts, history events and warning beep as mic-check.sh
+- Warning beep and capture restart go to the capture relay's control socket
+  (capture.py), which keeps the stream alive with silence while the mic is gone
+- Warning beep repeats every MIC_BEEP_INTERVAL seconds while the mic is gone
+Runs inside supervisor.py, or standalone: micwatch.py
+"""
+import ctypes, os, select, signal, struct, subprocess, sys, time
+from datetime import datetime
+import control, history, probes, settings
+from alerts import AlertDispatcher
+
+CONFIG = settings.CONFIG
+CONFIG_DIR = os.path.dirname(CONFIG.path)
+PAUSE_FILE = os.path.join(CONFIG_DIR, "paused")
+MIC_STATE_FILE = os.path.join(CONFIG_DIR, "mic_state")     # Shared with mic-check.sh: 1 = ok, 0 = lost (alert sent)
+SPOOL_FILE = os.path.join(CONFIG_DIR, "mic_alert_spool.json")
+HISTORY_DB = os.path.join(CONFIG_DIR, "history.db")
+SND_DIR = "/dev/snd"
+SETTLE = 0.2        # A card add / remove is a burst of device nodes, wait for the last one
+RESCAN = 60         # Safety re-check without events (also covers a missing /dev/snd)
+
+IN_CREATE, IN_DELETE, IN_DELETE_SELF = 0x100, 0x200, 0x400
+IN_NONBLOCK, IN_CLOEXEC = os.O_NONBLOCK, os.O_CLOEXEC
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len (name follows)
+
+
+def log(msg):
+    print(f"[{datetime.now()}] {msg}", flush=True)
+
+
+class Inotify:
+    """Minimal inotify(7) binding through libc"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {path} failed")
+        return wd
+
+    def read(self):
+        """Names of the entries in the pending events"""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        names, offset = [], 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            names.append(data[offset:offset + length].rstrip(b"\0").decode(errors="replace"))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class MicWatcher:
+    """alerts / events: the supervisor passes its shared AlertDispatcher and EventLog"""
+
+    def __init__(self, alerts=None, events=None):
+        self.alerts = alerts or AlertDispatcher(CONFIG.get_str('NTFY_SERVER', 'https://ntfy.sh'),
+                                                CONFIG.get_str('NTFY_TOPIC', 'babymonitor'), SPOOL_FILE)
+        self.events = events
+        self.present = probes.mic_detected()
+        self.alerted = self.load_state() == "0"
+        self.last_beep = 0
+        self.inotify = Inotify()
+        self.watching = False
+
+    def load_state(self):
+        try:
+            with open(MIC_STATE_FILE) as f:
+                return f.read().strip()
+        except OSError:
+            return "1"
+
+    def save_state(self):
+        try:
+            with open(MIC_STATE_FILE, "w") as f:
+                f.write("0\n" if self.alerted else "1\n")
+        except OSError as e:
+            log(f"Cannot write {MIC_STATE_FILE}: {e}")
+
+    def watch(self):
+        """(Re)arm the /dev/snd watch, False if the directory is missing"""
+        try:
+            self.inotify.add_watch(SND_DIR, IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+            self.watching = True
+        except OSError:
+            self.watching = False
+        return self.watching
+
+    def record(self, kind):
+        if self.events:
+            self.events.record(kind)
+            return
+        try:
+            history.record(kind, path=HISTORY_DB)
+        except Exception as e:
+            log(f"History write failed: {e}")
+
+    def play_warning(self):
+        """Three short high beeps, mixed into the stream by the capture relay"""
+        self.last_beep = time.monotonic()
+        control.request(control.CAPTURE_SOCKET, "beep warning", timeout=1)
+
+    def restart_capture(self):
+        log("Mic back, restarting capture")
+        if control.request(control.CAPTURE_SOCKET, "restart", timeout=1):
+            return
+        # Relay not running: restart the whole service. --no-block: don't wait for ExecStartPre
+        try:
+            subprocess.run(["sudo", "-n", "systemctl", "restart", "--no-block", "babymonitor-audio"], timeout=10)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            log(f"Cannot restart babymonitor-audio: {e}")
+
+    def update(self):
+        """Compare with the card list, alert on changes. Called after events and on timeouts."""
+        present = probes.mic_detected()
+        if present != self.present:
+            self.present = present
+            log(f"Mic {'connected' if present else 'disconnected'}")
+            if present:
+                self.restart_capture()
+        if os.path.exists(PAUSE_FILE):
+            return
+        if not present and not self.alerted:
+            self.alerts.send("MICROPHONE DISCONNECTED!", "USB microphone not detected. Check connection!",
+                             priority="urgent", tags="red_circle,warning,microphone")
+            self.record(history.MIC_LOST)
+            self.alerted = True
+            self.save_state()
+        elif present and self.alerted:
+            self.alerts.send("Microphone Restored", "USB microphone is working again.",
+                             priority="default", tags="green_circle,microphone")
+            self.record(history.MIC_RESTORED)
+            self.alerted = False
+            self.save_state()
+        if not present and time.monotonic() - self.last_beep >= CONFIG.get_int('MIC_BEEP_INTERVAL', 3):
+            self.play_warning()
+
+    def timeout(self):
+        if not self.present and not os.path.exists(PAUSE_FILE):
+            # Next warning beep while the mic is gone
+            return max(0, self.last_beep + CONFIG.get_int('MIC_BEEP_INTERVAL', 3) - time.monotonic())
+        if not self.present:
+            return 5  # Paused: notice the resume
+        return RESCAN if self.watching else 5
+
+    def start(self):
+        if not self.watch():
+            log(f"{SND_DIR} missing, checking every 5s until it appears")
+        log(f"Mic watcher started, mic {'connected' if self.present else 'NOT DETECTED'}")
+        self.update()
+
+    def handle_events(self):
+        """Drain inotify after the burst has settled (caller waited SETTLE)"""
+        names = self.inotify.read()
+        if not os.path.isdir(SND_DIR) or any(not n for n in names):
+            # /dev/snd itself went away, the watch is gone with it
+            self.watching = False
+
+    def tick(self):
+        if not self.watching:
+            self.watch()
+        self.update()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.start()
+        while True:
+            CONFIG.check()
+            if select.select([self.inotify], [], [], self.timeout())[0]:
+                # Let the rest of the burst arrive, then look once
+                time.sleep(SETTLE)
+                self.handle_events()
+            self.tick()
+
+
+if __name__ == "__main__":
+    MicWatcher().run()
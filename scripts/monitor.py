@@ -1,71 +1,358 @@
 #!/usr/bin/env python3
 """BabyMonitor Connection Monitor - Reads config from config.env"""
-import json, socket, time, urllib.request, os
+import atexit, signal, sys, time, os
 from datetime import datetime
+import history, metrics, settings
+from alerts import AlertDispatcher
+from snapcast import SnapcastClient, SnapcastError, Server, Client, Stream
 
-# Load config
-CONFIG_FILE = "/opt/babymonitor/config/config.env"
-config = {}
-if os.path.exists(CONFIG_FILE):
-    with open(CONFIG_FILE) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, val = line.split('=', 1)
-                # Strip inline comments
-                if '#' in val:
-                    val = val.split('#')[0]
-                config[key.strip()] = val.strip().strip('"')
-
-# Configuration from file or defaults
-SNAPSERVER_HOST = "localhost"
-SNAPSERVER_PORT = 1705
-CHECK_INTERVAL = int(config.get('CHECK_INTERVAL', 5))
-DISCONNECT_TIMEOUT = int(config.get('DISCONNECT_TIMEOUT', 10))
-ALERT_COOLDOWN = int(config.get('ALERT_COOLDOWN', 30))
-NTFY_TOPIC = config.get('NTFY_TOPIC', 'babymonitor-alerts')
-NTFY_SERVER = config.get('NTFY_SERVER', 'https://ntfy.sh')
+CONFIG = settings.CONFIG
+CONFIG_FILE = CONFIG.path
+SPOOL_FILE = os.path.join(os.path.dirname(CONFIG_FILE), "alert_spool.json")
+HISTORY_DB = os.path.join(os.path.dirname(CONFIG_FILE), "history.db")
+RELOAD_CHECK = settings.RELOAD_CHECK  # Push mode wakes at least this often for the config check
+# Read once at startup, changing them needs a restart
+RESTART_KEYS = {"MONITOR_MODE", "METRICS_PORT", "METRICS_ADDRESS"}
+
+def load_settings():
+    """(Re)read the tunables from config.env, also called on live reload"""
+    global SNAPSERVER_HOST, SNAPSERVER_PORT, CHECK_INTERVAL, DISCONNECT_TIMEOUT, ALERT_COOLDOWN, NTFY_TOPIC, NTFY_SERVER
+    global MONITOR_MODE, RESYNC_INTERVAL, STREAM_IDLE_TIMEOUT, METRICS_PORT, METRICS_ADDRESS
+    SNAPSERVER_HOST = CONFIG.get_str('SNAPSERVER_HOST', 'localhost')
+    SNAPSERVER_PORT = CONFIG.get_int('SNAPSERVER_PORT', 1705)
+    CHECK_INTERVAL = CONFIG.get_int('CHECK_INTERVAL', 5)
+    DISCONNECT_TIMEOUT = CONFIG.get_int('DISCONNECT_TIMEOUT', 10)
+    ALERT_COOLDOWN = CONFIG.get_int('ALERT_COOLDOWN', 30)
+    NTFY_TOPIC = CONFIG.get_str('NTFY_TOPIC', 'babymonitor-alerts')
+    NTFY_SERVER = CONFIG.get_str('NTFY_SERVER', 'https://ntfy.sh')
+    # "push" keeps one control connection open and reacts to snapserver notifications,
+    # "poll" queries Server.GetStatus every CHECK_INTERVAL seconds (old behaviour)
+    MONITOR_MODE = CONFIG.get_str('MONITOR_MODE', 'push')
+    RESYNC_INTERVAL = CONFIG.get_int('RESYNC_INTERVAL', 60)
+    # Alert when the audio stream is idle this long while clients are connected
+    STREAM_IDLE_TIMEOUT = CONFIG.get_int('STREAM_IDLE_TIMEOUT', 20)
+    # Prometheus text endpoint, disabled unless a port is set
+    METRICS_PORT = CONFIG.get_int('METRICS_PORT', 0)
+    METRICS_ADDRESS = CONFIG.get_str('METRICS_ADDRESS', '127.0.0.1')
+
+load_settings()
+
+RPC_LATENCY = metrics.Histogram("babymonitor_rpc_latency_seconds", "Snapserver JSON-RPC round-trip time")
+LOOP_DURATION = metrics.Histogram("babymonitor_poll_duration_seconds", "Time to process one status update or poll")
+ALERTS = metrics.Counter("babymonitor_alerts_total", "Alerts raised, by type", ("type",))
+CONNECTED_CLIENTS = metrics.Gauge("babymonitor_connected_clients", "Snapcast clients currently connected")
+SINCE_CLIENT_SEEN = metrics.Gauge("babymonitor_seconds_since_client_seen", "Seconds since any client was last seen connected")
+
+class ClientPresence:
+    """Per-client entry of the presence table, with its own alert timer"""
+    __slots__ = ("id", "name", "volume", "connected", "last_seen", "alert_sent", "last_alert_time")
+
+    def __init__(self, client):
+        self.id, self.name, self.volume, self.connected = client.id, client.name, client.volume, client.connected
+        # Local time the client was last known connected (None = not seen during this run)
+        self.last_seen = None
+        self.alert_sent, self.last_alert_time = False, None
+
+    def deadline(self):
+        """Time at which the disconnect alert fires, or None if no timer is armed"""
+        if self.connected or self.last_seen is None or self.alert_sent:
+            return None
+        due = self.last_seen + DISCONNECT_TIMEOUT
+        if self.last_alert_time:
+            due = max(due, self.last_alert_time + ALERT_COOLDOWN)
+        return due
+
+class StreamState:
+    """Playing/idle state of one snapserver stream and its idle periods"""
+    __slots__ = ("id", "status", "idle_since", "alert_sent", "last_idle_duration", "idle_count")
+
+    def __init__(self, stream, now):
+        self.id, self.status = stream.id, stream.status
+        self.idle_since = None if stream.status == "playing" else now
+        self.alert_sent = False
+        self.last_idle_duration, self.idle_count = None, 0
 
 class Monitor:
     def __init__(self):
-        self.last_client_seen = self.last_alert_time = None
-        self.alert_sent = False
+        self.snapcast = SnapcastClient(SNAPSERVER_HOST, SNAPSERVER_PORT, on_reply=lambda method, secs: RPC_LATENCY.observe(secs))
+        self.clients = {}       # client id -> ClientPresence
+        self.online = set()     # ids of connected clients
+        self.armed = set()      # ids of disconnected clients with a running timer
+        self.streams = {}       # stream id -> StreamState
+        self.status_id = None
+        self.alerts = AlertDispatcher(NTFY_SERVER, NTFY_TOPIC, spool_file=SPOOL_FILE)
+        self.history = history.EventLog(HISTORY_DB)
+        self.reload_requested = False
+        self.next_resync = 0    # push mode: time of the next full Server.GetStatus
+        CONFIG.on_change(self.apply_config)
+        CONNECTED_CLIENTS.set_function(lambda: len(self.online))
+        SINCE_CLIENT_SEEN.set_function(self.seconds_since_client_seen)
 
-    def get_connected_clients(self):
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(2)
-            sock.connect((SNAPSERVER_HOST, SNAPSERVER_PORT))
-            sock.send((json.dumps({"id":1,"jsonrpc":"2.0","method":"Server.GetStatus"})+"\n").encode())
-            data = json.loads(sock.recv(8192).decode())
-            sock.close()
-            return sum(1 for g in data["result"]["server"]["groups"] for c in g["clients"] if c["connected"])
-        except: return 0
-
-    def send_ntfy(self, title, message, priority="high", tags=None):
+    def send_ntfy(self, title, message, priority="high", tags=None, kind="other"):
+        # Queued for the background dispatcher, delivery and retries never block this loop
+        print(f"[{datetime.now()}] Alert: {title}")
+        ALERTS.inc(kind)
+        self.history.record(history.ALERT, kind, title)
+        self.alerts.send(title, message, priority, tags)
+
+    # --- Live config reload ---
+
+    def check_config(self):
+        """Pick up config.env edits (mtime check) or a SIGHUP-forced reload. The one reload
+        point: called between passes by the loop that owns the monitor, so apply_config()
+        never runs while a pass is using the snapserver connection."""
+        force, self.reload_requested = self.reload_requested, False
+        if not CONFIG.check(force) and force:
+            print(f"[{datetime.now()}] Config reloaded, nothing changed")
+
+    def apply_config(self, changed):
+        load_settings()
+        print(f"[{datetime.now()}] Config reloaded: {', '.join(sorted(changed))}")
+        self.alerts.server, self.alerts.topic = NTFY_SERVER, NTFY_TOPIC
+        if (self.snapcast.host, self.snapcast.port) != (SNAPSERVER_HOST, SNAPSERVER_PORT):
+            self.snapcast.host, self.snapcast.port = SNAPSERVER_HOST, SNAPSERVER_PORT
+            self.snapcast.close()
+            self.mark_all_disconnected(time.time())
+        if changed & RESTART_KEYS:
+            print(f"[{datetime.now()}] Changes to {', '.join(sorted(changed & RESTART_KEYS))} take effect after a restart")
+
+    def seconds_since_client_seen(self):
+        if self.online:
+            return 0
+        seen = [e.last_seen for e in self.clients.values() if e.last_seen is not None]
+        return round(time.time() - max(seen), 1) if seen else None
+
+    # --- Presence table ---
+
+    def update_client(self, client, now, live):
+        """Apply one client's new state. live=True means the change happened just now
+        (notification), otherwise it was observed in a snapshot."""
+        entry = self.clients.get(client.id)
+        if entry is None:
+            entry = self.clients[client.id] = ClientPresence(client)
+            if client.connected:
+                entry.last_seen = now
+                self.online.add(client.id)
+                print(f"[{datetime.now()}] Client {entry.name}: connected")
+                self.history.record(history.CLIENT_CONNECTED, entry.name, ts=now)
+            return
+        entry.name, entry.volume = client.name, client.volume
+        if client.connected:
+            if not entry.connected:
+                self.client_connected(entry, now)
+            entry.last_seen = now
+        elif entry.connected:
+            # A notification means the client was connected until now
+            if live: entry.last_seen = now
+            self.client_disconnected(entry)
+
+    def apply_snapshot(self, server, now, live=False):
+        """Diff a full Server status against the table, touching only what changed"""
+        seen = set()
+        for client in server.clients():
+            seen.add(client.id)
+            self.update_client(client, now, live)
+        for gone in self.clients.keys() - seen:
+            # Client was deleted from snapserver, stop tracking it. A running disconnect
+            # timer would go with it: the client cannot come back, so alert right away.
+            entry = self.clients[gone]
+            if gone in self.armed and entry.deadline() is not None:
+                self.send_ntfy("CONNECTION LOST!", f"{entry.name}: no connection for {int(now - entry.last_seen)}s, removed from snapserver. Check app!", priority="urgent", tags="red_circle,warning,baby", kind="connection_lost")
+            self.armed.discard(gone)
+            self.online.discard(gone)
+            del self.clients[gone]
+        for stream in server.streams:
+            self.update_stream(stream, now)
+
+    def mark_all_disconnected(self, now):
+        """Control connection lost: nobody can be listening any more"""
+        for entry in self.clients.values():
+            if entry.connected:
+                entry.last_seen = now
+                self.client_disconnected(entry)
+
+    def client_connected(self, entry, now):
+        entry.connected = True
+        self.online.add(entry.id)
+        self.armed.discard(entry.id)
+        print(f"[{datetime.now()}] Client {entry.name}: connected")
+        self.history.record(history.CLIENT_CONNECTED, entry.name, ts=now)
+        if entry.alert_sent:
+            self.send_ntfy("Connection Restored", f"{entry.name} reconnected after {int(now - entry.last_seen)}s", priority="default", tags="green_circle,baby", kind="connection_restored")
+            entry.alert_sent = False
+
+    def client_disconnected(self, entry):
+        entry.connected = False
+        self.online.discard(entry.id)
+        print(f"[{datetime.now()}] Client {entry.name}: disconnected")
+        self.history.record(history.CLIENT_DISCONNECTED, entry.name, ts=entry.last_seen)
+        if entry.last_seen is not None:
+            self.armed.add(entry.id)
+
+    # --- Stream state ---
+
+    def update_stream(self, stream, now):
+        state = self.streams.get(stream.id)
+        if state is None:
+            self.streams[stream.id] = StreamState(stream, now)
+            print(f"[{datetime.now()}] Stream {stream.id}: {stream.status}")
+            return
+        if stream.status == state.status:
+            return
+        print(f"[{datetime.now()}] Stream {stream.id}: {state.status} -> {stream.status}")
+        state.status = stream.status
+        if stream.status != "playing":
+            if state.idle_since is None:
+                state.idle_since = now
+                self.history.record(history.STREAM_IDLE, stream.id, stream.status, ts=now)
+        elif state.idle_since is not None:
+            duration = int(now - state.idle_since)
+            state.idle_since, state.last_idle_duration = None, duration
+            state.idle_count += 1
+            print(f"[{datetime.now()}] Stream {stream.id} was idle for {duration}s")
+            self.history.record(history.STREAM_PLAYING, stream.id, f"{duration}s idle", ts=now)
+            if state.alert_sent:
+                self.send_ntfy("Audio Stream Restored", f"Stream {stream.id} is playing again after {duration}s idle.", priority="default", tags="green_circle,microphone", kind="stream_restored")
+                state.alert_sent = False
+
+    def stream_deadline(self, state):
+        """Time at which the idle-stream alert fires, or None"""
+        if state.idle_since is None or state.alert_sent or not self.online:
+            return None
+        return state.idle_since + STREAM_IDLE_TIMEOUT
+
+    def next_deadline(self, now):
+        """Seconds until the earliest client or stream timer fires, or None if none is armed"""
+        due = [d for d in (self.clients[i].deadline() for i in self.armed) if d is not None]
+        due += [d for d in map(self.stream_deadline, self.streams.values()) if d is not None]
+        return max(0, min(due) - now) if due else None
+
+    def evaluate(self, now):
+        """Fire every client disconnect or stream idle alert whose timer has run out"""
+        for cid in list(self.armed):
+            entry = self.clients[cid]
+            due = entry.deadline()
+            if due is None:
+                self.armed.discard(cid)
+            elif now >= due:
+                secs = int(now - entry.last_seen)
+                self.send_ntfy("CONNECTION LOST!", f"{entry.name}: no connection for {secs}s. Check app!", priority="urgent", tags="red_circle,warning,baby", kind="connection_lost")
+                entry.alert_sent, entry.last_alert_time = True, now
+                self.armed.discard(cid)
+        for state in self.streams.values():
+            due = self.stream_deadline(state)
+            if due is not None and now >= due:
+                # Clients are connected but hear nothing: capture pipeline is down
+                self.send_ntfy("NO AUDIO STREAM!", f"Stream {state.id} idle for {int(now - state.idle_since)}s while {len(self.online)} client(s) listen. Check mic/capture!", priority="urgent", tags="red_circle,warning,microphone", kind="stream_idle")
+                state.alert_sent = True
+
+    # --- Persistent control connection (push mode) ---
+
+    def connect(self):
+        """Open the control connection and request a full status snapshot"""
+        self.snapcast.connect()
+        self.request_status()
+        print(f"[{datetime.now()}] Connected to snapserver control port")
+
+    def request_status(self):
+        self.status_id = self.snapcast.send("Server.GetStatus")
+
+    def handle_message(self, msg, now):
+        """Update the presence table from a reply or notification"""
+        method = msg.get("method")
+        if method is None:
+            self.snapcast.replied(msg)
+        if method is None and msg.get("id") == self.status_id and "result" in msg:
+            self.apply_snapshot(Server.from_json(msg["result"]["server"]), now)
+        elif method == "Server.OnUpdate":
+            self.apply_snapshot(Server.from_json(msg["params"]["server"]), now, live=True)
+        elif method in ("Client.OnConnect", "Client.OnDisconnect"):
+            self.update_client(Client.from_json(msg["params"]["client"]), now, live=True)
+        elif method == "Stream.OnUpdate":
+            self.update_stream(Stream.from_json(msg["params"]["stream"]), now)
+
+    def poll_pass(self):
+        """One Server.GetStatus round-trip and evaluation (poll mode)"""
+        now, started = time.time(), time.monotonic()
         try:
-            headers = {"Title": title, "Priority": priority}
-            if tags: headers["Tags"] = tags
-            req = urllib.request.Request(f"{NTFY_SERVER}/{NTFY_TOPIC}", data=message.encode(), headers=headers)
-            urllib.request.urlopen(req, timeout=10)
-            print(f"[{datetime.now()}] Ntfy: {title}")
-        except Exception as e: print(f"[{datetime.now()}] Ntfy failed: {e}")
+            self.apply_snapshot(self.snapcast.get_status(), now)
+        except SnapcastError as e:
+            print(f"[{datetime.now()}] Snapserver query failed: {e}")
+            self.mark_all_disconnected(now)
+        self.evaluate(now)
+        LOOP_DURATION.observe(time.monotonic() - started)
 
-    def run(self):
-        print(f"[{datetime.now()}] Monitor started | Topic: {NTFY_TOPIC} | Timeout: {DISCONNECT_TIMEOUT}s | Cooldown: {ALERT_COOLDOWN}s")
-        self.send_ntfy("BabyMonitor Online", "Monitoring started.", priority="low", tags="white_check_mark,baby")
+    def run_poll(self):
         while True:
-            clients, now = self.get_connected_clients(), time.time()
-            if clients > 0:
-                if self.alert_sent:
-                    self.send_ntfy("Connection Restored", f"Reconnected after {int(now-self.last_client_seen)}s", priority="default", tags="green_circle,baby")
-                    self.alert_sent = False
-                self.last_client_seen = now
-            elif self.last_client_seen:
-                secs = int(now - self.last_client_seen)
-                if secs >= DISCONNECT_TIMEOUT and not self.alert_sent and (not self.last_alert_time or now - self.last_alert_time >= ALERT_COOLDOWN):
-                    self.send_ntfy("CONNECTION LOST!", f"No client for {secs}s. Check app!", priority="urgent", tags="red_circle,warning,baby")
-                    self.alert_sent, self.last_alert_time = True, now
+            self.check_config()
+            self.poll_pass()
             time.sleep(CHECK_INTERVAL)
 
+    def push_wait(self):
+        """Connect if needed and return how long to wait for the next notification:
+        until the earliest client deadline, the resync or the next config check.
+        None while snapserver is unreachable (retry after CHECK_INTERVAL)."""
+        now = time.time()
+        if not self.snapcast.connected:
+            try:
+                self.connect()
+                self.next_resync = now + RESYNC_INTERVAL
+            except SnapcastError as e:
+                print(f"[{datetime.now()}] Snapserver unreachable: {e}")
+                self.evaluate(now)
+                return None
+        wait = min(self.next_resync - now, RELOAD_CHECK)
+        deadline = self.next_deadline(now)
+        if deadline is not None:
+            wait = min(wait, deadline)
+        return max(0, wait)
+
+    def push_receive(self, timeout):
+        """Handle what arrives within timeout (0 once the socket polled readable), then evaluate"""
+        try:
+            msgs = self.snapcast.read_messages(timeout)
+            now, started = time.time(), time.monotonic()
+            for msg in msgs:
+                self.handle_message(msg, now)
+            if now >= self.next_resync:
+                # Low-frequency consistency check in case a notification was missed
+                self.request_status()
+                self.next_resync = now + RESYNC_INTERVAL
+        except SnapcastError as e:
+            print(f"[{datetime.now()}] Control connection lost: {e}")
+            self.mark_all_disconnected(time.time())
+            started = time.monotonic()
+        self.evaluate(time.time())
+        LOOP_DURATION.observe(time.monotonic() - started)
+
+    def run_push(self):
+        while True:
+            self.check_config()
+            wait = self.push_wait()
+            if wait is None:
+                time.sleep(CHECK_INTERVAL)
+            else:
+                self.push_receive(wait)
+
+    def start(self):
+        """Startup log, metrics endpoint, history and the online notice"""
+        print(f"[{datetime.now()}] Monitor started | Mode: {MONITOR_MODE} | Topic: {NTFY_TOPIC} | Timeout: {DISCONNECT_TIMEOUT}s | Cooldown: {ALERT_COOLDOWN}s")
+        if METRICS_PORT:
+            metrics.serve(METRICS_PORT, METRICS_ADDRESS)
+            print(f"[{datetime.now()}] Metrics on http://{METRICS_ADDRESS}:{METRICS_PORT}/metrics")
+        self.history.record(history.MONITOR_START, detail=MONITOR_MODE)
+        # systemctl stop / pause: record the stop and write buffered history before exiting
+        atexit.register(self.history.record, history.MONITOR_STOP)
+        self.send_ntfy("BabyMonitor Online", "Monitoring started.", priority="low", tags="white_check_mark,baby", kind="startup")
+
+    def run(self):
+        self.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        # systemctl reload: reread config.env at the next loop pass
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, "reload_requested", True))
+        if MONITOR_MODE == "poll":
+            self.run_poll()
+        else:
+            self.run_push()
+
 if __name__ == "__main__": Monitor().run()
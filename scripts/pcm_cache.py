@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of decoded voice messages / audio files (raw S16_LE PCM)
+- Keyed by Telegram's file_unique_id: the same recording sent again is the
+  same key, even from another chat or with another file_id
+- Size-capped, least recently played entries are evicted first
+- The index lives in memory, rebuilt from the directory at start; the file
+  mtime is the last-played time, so the LRU order survives restarts
+- New entries are written to KEY.part and renamed once decoding succeeded
+Used by playback.py.
+Usage: pcm_cache.py [DIR]
+"""
+import collections, os, re, sys
+
+CACHE_DIR = "/opt/babymonitor/config/pcm_cache"
+MAX_BYTES = 200 * 2**20     # ~36 min of 48 kHz mono
+
+
+class PCMCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory, self.max_bytes = directory, max_bytes
+        self.index = collections.OrderedDict()  # key -> size, least recently used first
+        self.load()
+
+    def load(self):
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".pcm")]
+        except FileNotFoundError:
+            return
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self.index[entry.name[:-4]] = entry.stat().st_size
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".part"):
+                os.unlink(entry.path)   # Left over from a crash mid-decode
+        self.evict()
+
+    @staticmethod
+    def valid(key):
+        # file_unique_id is base64url, anything else never becomes a path
+        return bool(key) and re.fullmatch(r"[A-Za-z0-9_-]+", key) is not None
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    @property
+    def size(self):
+        return sum(self.index.values())
+
+    def get(self, key):
+        """Path of the cached PCM, None on a miss. Marks the entry as just used."""
+        if key not in self.index:
+            return None
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            del self.index[key]
+            return None
+        self.index.move_to_end(key)
+        return path
+
+    def partial(self, key):
+        """Where a decoder writes a new entry, None if the key cannot be cached"""
+        if not self.valid(key):
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        return self.path(key) + ".part"
+
+    def commit(self, key):
+        """Decoding finished: the .part file becomes the entry"""
+        path = self.path(key)
+        try:
+            os.replace(path + ".part", path)
+            self.index[key] = os.path.getsize(path)
+        except OSError:
+            return
+        self.index.move_to_end(key)
+        self.evict()
+
+    def discard(self, key):
+        """Decoding failed or was cancelled: drop the half-written file"""
+        try:
+            os.unlink(self.path(key) + ".part")
+        except OSError:
+            pass
+
+    def evict(self):
+        total = self.size
+        while total > self.max_bytes and len(self.index) > 1:
+            key, size = self.index.popitem(last=False)
+            total -= size
+            try:
+                os.unlink(self.path(key))
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    cache = PCMCache(sys.argv[1] if len(sys.argv) > 1 else CACHE_DIR)
+    for key, size in cache.index.items():
+        print(f"{size / 96000:7.1f}s  {key}")
+    print(f"{len(cache.index)} entries, {cache.size / 2**20:.1f} of {cache.max_bytes / 2**20:.0f} MB")
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Playback queue for voice messages and audio files on the Pi's speaker
+- Download -> ffmpeg -> aplay as one pipeline: the download is streamed into
+  ffmpeg's stdin, ffmpeg's PCM goes through a kernel pipe straight to aplay.
+  No temp files, playback starts while the download is still running.
+- One message plays at a time, the rest wait in FIFO order
+- Every item can be cancelled, waiting or playing
+- With a PCMCache (pcm_cache.py), ffmpeg also writes the decoded PCM to the
+  cache; a repeat plays straight from that file, no download or decoding
+Used by telegram-bot.py.
+Usage: playback.py FILE_OR_URL...
+"""
+import asyncio, collections, itertools, logging, os, sys
+
+import executor, httppool
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 48000
+PCM_OUTPUT = ["-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1"]
+# Small probe: ffmpeg starts decoding after the first few KB instead of 5 MB
+DECODER = ["ffmpeg", "-nostdin", "-loglevel", "error", "-probesize", "32k", "-i", "pipe:0", *PCM_OUTPUT, "pipe:1"]
+PLAYER = ["aplay", "-q", "-t", "raw", "-f", "S16_LE", "-r", str(SAMPLE_RATE), "-c", "1"]
+MAX_DURATION = 600  # Seconds one item may play
+FEED_GRACE = 5      # Seconds a cut-short item waits for its download thread
+CHUNK_SIZE = 16384
+
+
+class SourceError(Exception):
+    """A source could not deliver its audio. The message is shown to the user."""
+
+
+def url_source(url):
+    """Source for submit(): the body of url, streamed"""
+    return lambda: httppool.stream(url, chunk_size=CHUNK_SIZE, timeout=60)
+
+
+def file_source(path):
+    def chunks():
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+    return chunks
+
+
+class Playback:
+    """One queued item. source() returns an iterable of encoded audio chunks,
+    it runs in a worker thread and raises SourceError if the audio is unavailable.
+    key: cache key (file_unique_id), if any.
+    Await wait() for (ok, error)."""
+
+    def __init__(self, item_id, label, source, key=None):
+        self.id, self.label, self.source, self.key = item_id, label, source, key
+        self.cancelled = False
+        self.error = ""
+        self.procs = []
+        self.done = asyncio.get_running_loop().create_future()
+
+    async def wait(self):
+        return await asyncio.shield(self.done)
+
+    def finish(self, ok, error=""):
+        if not self.done.done():
+            self.done.set_result((ok, error))
+
+
+class PlaybackQueue:
+    def __init__(self, decoder=DECODER, player=PLAYER, cache=None):
+        self.decoder, self.player, self.cache = decoder, player, cache
+        self.pending = collections.deque()
+        self.current = None
+        self.ids = itertools.count(1)
+        self.wakeup = None
+        self.worker = None
+
+    def submit(self, label, source, key=None):
+        """Queue source for playback, returns the Playback item"""
+        item = Playback(next(self.ids), label, source, key)
+        self.pending.append(item)
+        # Created lazily so they bind to the running event loop
+        if self.worker is None or self.worker.done():
+            self.wakeup = asyncio.Event()
+            self.worker = asyncio.create_task(self.run())
+        self.wakeup.set()
+        return item
+
+    def cached(self, key):
+        return bool(self.cache and key and key in self.cache.index)
+
+    def position(self, item):
+        """0 = playing now, n = n-th in line, None = finished or cancelled"""
+        if item is self.current:
+            return 0
+        return self.pending.index(item) + 1 if item in self.pending else None
+
+    async def cancel(self, item_id):
+        """Cancel a waiting or playing item. False if there is no such item (anymore)."""
+        for item in self.pending:
+            if item.id == item_id:
+                self.pending.remove(item)
+                item.cancelled = True
+                item.finish(False, "cancelled")
+                return True
+        item = self.current
+        if item is None or item.id != item_id:
+            return False
+        item.cancelled = True
+        await asyncio.gather(*(executor.Executor.terminate(proc) for proc in item.procs))
+        return True
+
+    async def run(self):
+        while True:
+            while not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            item = self.current = self.pending.popleft()
+            try:
+                item.finish(*await self.play(item))
+            except Exception as e:
+                logger.exception(f"Playback of {item.label} failed")
+                item.finish(False, str(e))
+            finally:
+                self.current = None
+
+    # --- Pipeline ---
+
+    def feed(self, item, fd):
+        """Worker thread: copy the source into the decoder's stdin until done or cancelled"""
+        try:
+            for chunk in item.source():
+                if item.cancelled:
+                    break
+                view = memoryview(chunk)
+                while view:
+                    view = view[os.write(fd, view):]
+        except BrokenPipeError:
+            pass    # Decoder gone (cancelled or failed), it reports its own error
+        except httppool.HTTPError as e:
+            # Not str(e): Telegram download URLs contain the bot token
+            if isinstance(e.__cause__, TimeoutError):
+                item.error = "download timed out"
+            else:
+                item.error = f"download failed (HTTP {e.status})" if e.status else "download failed"
+        except SourceError as e:
+            item.error = str(e)
+        except TimeoutError:
+            # Before OSError, which it subclasses (no strerror)
+            item.error = "timed out waiting for the audio"
+        except OSError as e:
+            item.error = f"cannot read audio: {e.strerror or e}"
+        finally:
+            os.close(fd)
+
+    async def spawn(self, item, argv, stdin, stdout=asyncio.subprocess.DEVNULL):
+        # Own process group, so cancel() and the timeout reach everything
+        proc = await asyncio.create_subprocess_exec(
+            *argv, stdin=stdin, stdout=stdout, stderr=asyncio.subprocess.PIPE, start_new_session=True)
+        item.procs.append(proc)
+        return proc
+
+    async def finished(self, item):
+        """stderr of every process once all have exited, None if cut short"""
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*(p.communicate() for p in item.procs)), MAX_DURATION)
+        except asyncio.TimeoutError:
+            item.error = f"longer than {MAX_DURATION}s"
+            await asyncio.gather(*(executor.Executor.terminate(proc) for proc in item.procs))
+            return None
+        return None if item.cancelled else [err.decode(errors="replace").strip() for _, err in results]
+
+    async def reap(self, item, feeder):
+        """Cut short: the decoder is gone, so the feeder stops at its next write and closes
+        its fd. A download stalled inside a read only returns at its own timeout, the
+        queue waits FEED_GRACE seconds for it and then moves on."""
+        try:
+            await asyncio.wait_for(asyncio.shield(feeder), FEED_GRACE)
+        except asyncio.TimeoutError:
+            logger.warning(f"Download of {item.label} still blocked, its pipe closes when it returns")
+            feeder.add_done_callback(lambda task: task.cancelled() or task.exception())
+        except Exception:
+            logger.exception(f"Feeding {item.label} failed")
+
+    async def play(self, item):
+        path = self.cache.get(item.key) if self.cached(item.key) else None
+        partial = self.cache.partial(item.key) if self.cache and item.key and not path else None
+        logger.info(f"Playing {item.label}" + (" from cache" if path else ""))
+        ok = False
+        try:
+            ok, error = await (self.play_file(item, path) if path else self.play_stream(item, partial))
+        finally:
+            if partial:
+                (self.cache.commit if ok else self.cache.discard)(item.key)
+        return ok, error
+
+    async def play_file(self, item, path):
+        """Cached PCM: the file itself is aplay's stdin"""
+        try:
+            with open(path, "rb") as f:
+                player = await self.spawn(item, self.player, f)
+        except OSError as e:
+            return False, str(e)
+        errors = await self.finished(item)
+        if errors is None:
+            return False, item.error or "cancelled"
+        if player.returncode != 0:
+            return False, errors[0] or f"aplay exited with {player.returncode}"
+        return True, ""
+
+    async def play_stream(self, item, partial=None):
+        """Download -> ffmpeg -> aplay, ffmpeg also writing to partial if given"""
+        decoder = self.decoder + (PCM_OUTPUT + ["-y", partial] if partial else [])
+        src_r, src_w = os.pipe()
+        pcm_r, pcm_w = os.pipe()
+        try:
+            decoder = await self.spawn(item, decoder, src_r, pcm_w)
+            player = await self.spawn(item, self.player, pcm_r)
+        except OSError as e:
+            os.close(src_w)
+            await asyncio.gather(*(executor.Executor.terminate(proc) for proc in item.procs))
+            return False, str(e)
+        finally:
+            # The children hold their ends now
+            for fd in (src_r, pcm_r, pcm_w):
+                os.close(fd)
+        feeder = asyncio.create_task(asyncio.to_thread(self.feed, item, src_w))
+        errors = await self.finished(item)
+        if errors is None:
+            await self.reap(item, feeder)
+            return False, item.error or "cancelled"
+        await feeder
+        if item.error:
+            return False, item.error
+        # A failing player takes the decoder down with SIGPIPE, so it goes first
+        if player.returncode != 0:
+            return False, errors[1] or f"aplay exited with {player.returncode}"
+        if decoder.returncode != 0:
+            return False, errors[0] or f"ffmpeg exited with {decoder.returncode}"
+        return True, ""
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: playback.py FILE_OR_URL...")
+        sys.exit(1)
+
+    async def main():
+        queue = PlaybackQueue()
+        items = [queue.submit(arg, url_source(arg) if "://" in arg else file_source(arg)) for arg in sys.argv[1:]]
+        for item in items:
+            ok, error = await item.wait()
+            print(f"{item.label}: {'ok' if ok else error}")
+        return all(item.done.result()[0] for item in items)
+
+    sys.exit(0 if asyncio.run(main()) else 1)
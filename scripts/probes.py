@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+System probes read straight from /proc and /sys, no fork/exec
+- USB microphones from /proc/asound (what `arecord -l | grep USB` finds)
+- CPU temperature from /sys/class/thermal (the sensor vcgencmd reports)
+- Uptime, memory and CPU usage from /proc/uptime, /proc/meminfo, /proc/stat
+- Interface state from /sys/class/net, IPv4 address with one ioctl
+Every probe returns None / empty when its source is missing (e.g. off the Pi).
+Used by statusd.py, micwatch.py, capture.py and telegram-bot.py.
+Usage: probes.py
+"""
+import fcntl, glob, os, socket, struct
+
+ASOUND_CARDS = "/proc/asound/cards"
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+SIOCGIFADDR = 0x8915
+
+
+def read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def sound_cards():
+    """(index, id, name) of every ALSA card, e.g. (1, "Device", "USB-Audio - USB PnP Sound Device")"""
+    cards = []
+    for line in read(ASOUND_CARDS).splitlines():
+        # " 1 [Device         ]: USB-Audio - USB PnP Sound Device", followed by an indented long name
+        head, sep, name = line.partition("]: ")
+        index, _, card_id = head.partition("[")
+        if sep and index.strip().isdigit():
+            cards.append((int(index), card_id.strip(), name.strip()))
+    return cards
+
+
+def usb_mics():
+    """USB cards with a capture device, one 'card N: id [name]' line each (arecord -l style)"""
+    return [f"card {index}: {card_id} [{name}]" for index, card_id, name in sound_cards()
+            if "USB" in name and glob.glob(f"/proc/asound/card{index}/pcm*c")]
+
+
+def mic_detected():
+    return bool(usb_mics())
+
+
+def temperature():
+    """CPU temperature in degrees C"""
+    value = read(THERMAL_ZONE).strip()
+    return int(value) / 1000 if value.lstrip("-").isdigit() else None
+
+
+def uptime():
+    """Seconds since boot"""
+    try:
+        return float(read("/proc/uptime").split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def memory():
+    """(used, total) bytes, used = MemTotal - MemAvailable like `free`"""
+    info = {}
+    for line in read("/proc/meminfo").splitlines():
+        key, _, value = line.partition(":")
+        if value.strip().endswith("kB"):
+            info[key] = int(value.split()[0]) * 1024
+    if "MemTotal" not in info:
+        return None, None
+    total = info["MemTotal"]
+    return total - info.get("MemAvailable", info.get("MemFree", 0)), total
+
+
+def cpu_times():
+    """(busy, total) jiffies since boot"""
+    try:
+        fields = [int(v) for v in read("/proc/stat").splitlines()[0].split()[1:]]
+    except (IndexError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  # idle + iowait
+    return sum(fields) - idle, sum(fields)
+
+
+class CpuUsage:
+    """CPU busy percentage between successive percent() calls (no `top -bn1`)"""
+
+    def __init__(self):
+        self.last = cpu_times()
+
+    def percent(self):
+        now, last = cpu_times(), self.last
+        self.last = now
+        if not now or not last or now[1] == last[1]:
+            return None
+        return round(100 * (now[0] - last[0]) / (now[1] - last[1]), 1)
+
+
+def link_state(ifname):
+    """Kernel operstate: up, down, dormant, ... or None if there is no such interface"""
+    return read(f"/sys/class/net/{ifname}/operstate").strip() or None
+
+
+def ipv4(ifname):
+    """IPv4 address of an interface, empty if it has none"""
+    if not os.path.exists(f"/sys/class/net/{ifname}"):
+        return ""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            ifreq = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, struct.pack("256s", ifname.encode()[:15]))
+        except OSError:
+            return ""
+    return socket.inet_ntoa(ifreq[20:24])
+
+
+if __name__ == "__main__":
+    used, total = memory()
+    print(f"USB mics:    {', '.join(usb_mics()) or 'none'}")
+    print(f"Temperature: {temperature()}")
+    print(f"Uptime:      {uptime()}")
+    print(f"Memory:      {used}/{total}")
+    for ifname in sorted(os.listdir("/sys/class/net")) if os.path.isdir("/sys/class/net") else []:
+        print(f"{ifname + ':':<12} {link_state(ifname)} {ipv4(ifname)}")
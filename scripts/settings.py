@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Shared config.env access
+- Parsed once, lookups are dict reads (no stat(), no read)
+- Each process checks for edits at one known point: check() on its main loop
+  (every RELOAD_CHECK seconds) or a SIGHUP-forced refresh. Listeners run there,
+  never on whichever thread happened to do a lookup.
+- refresh() reparses only when the file changed and tells listeners which keys did
+- Typed accessors fall back to the default (with a log line) on bad values
+Used by supervisor.py (monitor, mic watcher, heartbeat), capture.py, statusd.py and telegram-bot.py.
+"""
+import os, sys, threading, time
+from datetime import datetime
+
+CONFIG_FILE = os.environ.get("BABYMONITOR_CONFIG", "/opt/babymonitor/config/config.env")
+TRUE_VALUES = ("true", "yes", "on", "1")
+RELOAD_CHECK = 5    # Seconds between config.env change checks
+
+
+def parse(path):
+    """KEY=value lines, '#' comments (also inline), optional double quotes"""
+    config = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, val = line.split('=', 1)
+                # Strip inline comments
+                if '#' in val:
+                    val = val.split('#')[0]
+                config[key.strip()] = val.strip().strip('"')
+    return config
+
+
+class Config:
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self.values = {}
+        self.stamp = None       # (inode, mtime_ns, size) of the parsed file, None = missing
+        self.loaded = False
+        self.checked = 0        # time.monotonic() of the last check()
+        self.listeners = []     # fn(changed_keys), called after a reload changed something
+        self.lock = threading.Lock()
+
+    def log(self, msg):
+        print(f"[{datetime.now()}] {msg}", file=sys.stderr)
+
+    def refresh(self, force=False):
+        """Reparse if config.env changed (or force). Returns the set of changed keys."""
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        with self.lock:
+            if self.loaded and stamp == self.stamp and not force:
+                return set()
+            try:
+                values = parse(self.path) if stamp else {}
+            except OSError as e:
+                # Keep the last good values, e.g. while an editor replaces the file
+                self.log(f"Config unreadable, keeping previous values: {e}")
+                return set()
+            old, first = self.values, not self.loaded
+            changed = {k for k in old.keys() | values.keys() if old.get(k) != values.get(k)}
+            self.values, self.stamp, self.loaded = values, stamp, True
+        if changed and not first:
+            for fn in self.listeners:
+                fn(changed)
+        return changed
+
+    def check(self, force=False):
+        """refresh() at most every RELOAD_CHECK seconds (always if force).
+        Called periodically from the owning loop, see the module docstring."""
+        now = time.monotonic()
+        if not force and now - self.checked < RELOAD_CHECK:
+            return set()
+        self.checked = now
+        return self.refresh(force)
+
+    def on_change(self, fn):
+        self.listeners.append(fn)
+
+    # --- Lookups (the cached values; parsed on first use, edits arrive via check()) ---
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.refresh()
+
+    def get(self, key, default=None):
+        self.ensure_loaded()
+        return self.values.get(key, default)
+
+    def __contains__(self, key):
+        self.ensure_loaded()
+        return key in self.values
+
+    def as_dict(self):
+        self.ensure_loaded()
+        return dict(self.values)
+
+    def get_str(self, key, default=""):
+        value = self.get(key)
+        return default if value is None else value
+
+    def get_int(self, key, default=0):
+        return self._convert(key, default, int)
+
+    def get_float(self, key, default=0.0):
+        return self._convert(key, default, float)
+
+    def get_bool(self, key, default=False):
+        value = self.get(key)
+        return default if not value else value.lower() in TRUE_VALUES
+
+    def get_list(self, key, default=()):
+        """Whitespace separated values, e.g. HEALTHCHECK_URLS"""
+        value = self.get(key)
+        return value.split() if value else list(default)
+
+    def _convert(self, key, default, type_):
+        value = self.get(key)
+        if not value:
+            return default
+        try:
+            return type_(value)
+        except ValueError:
+            self.log(f"Config {key}={value!r} is not a valid {type_.__name__}, using {default}")
+            return default
+
+
+CONFIG = Config()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Snapcast JSON-RPC client (control port 1705)
+- Newline-framed incremental reader, so large replies are never truncated
+- One reused connection with request-id pipelining
+- Compact status model: Server / Group / Client / Stream
+Used by monitor.py and statusd.py.
+"""
+import itertools, json, select, socket, sys, threading, time
+from collections import deque
+
+SNAPSERVER_HOST = "localhost"
+SNAPSERVER_PORT = 1705
+
+
+class SnapcastError(Exception):
+    """Connection, protocol or RPC error from snapserver"""
+
+
+# ============== Status Model ==============
+
+class Stream:
+    __slots__ = ("id", "status")
+
+    def __init__(self, id, status):
+        self.id, self.status = id, status
+
+    @classmethod
+    def from_json(cls, d):
+        return cls(d["id"], d.get("status", "unknown"))
+
+
+class Client:
+    __slots__ = ("id", "name", "connected", "volume", "muted", "last_seen")
+
+    def __init__(self, id, name, connected, volume, muted, last_seen):
+        self.id, self.name, self.connected = id, name, connected
+        self.volume, self.muted, self.last_seen = volume, muted, last_seen
+
+    @classmethod
+    def from_json(cls, d):
+        host, cfg = d.get("host", {}), d.get("config", {})
+        vol = cfg.get("volume", {})
+        seen = d.get("lastSeen", {})
+        return cls(
+            d["id"],
+            cfg.get("name") or host.get("name") or d["id"],
+            bool(d.get("connected")),
+            vol.get("percent", 0),
+            bool(vol.get("muted")),
+            seen.get("sec", 0) + seen.get("usec", 0) / 1e6,
+        )
+
+
+class Group:
+    __slots__ = ("id", "stream_id", "muted", "clients")
+
+    def __init__(self, id, stream_id, muted, clients):
+        self.id, self.stream_id, self.muted, self.clients = id, stream_id, muted, clients
+
+    @classmethod
+    def from_json(cls, d):
+        return cls(d.get("id", ""), d.get("stream_id", ""), bool(d.get("muted")),
+                   [Client.from_json(c) for c in d.get("clients", [])])
+
+
+class Server:
+    __slots__ = ("groups", "streams")
+
+    def __init__(self, groups, streams):
+        self.groups, self.streams = groups, streams
+
+    @classmethod
+    def from_json(cls, d):
+        return cls([Group.from_json(g) for g in d.get("groups", [])],
+                   [Stream.from_json(s) for s in d.get("streams", [])])
+
+    def clients(self):
+        return [c for g in self.groups for c in g.clients]
+
+    def connected_clients(self):
+        return [c for g in self.groups for c in g.clients if c.connected]
+
+
+# ============== Client ==============
+
+class SnapcastClient:
+    """Persistent control connection. Notifications received while waiting for
+    a reply are kept in self.notifications for the caller to drain.
+    on_reply(method, seconds) is called with the round-trip time of every reply."""
+
+    def __init__(self, host=SNAPSERVER_HOST, port=SNAPSERVER_PORT, timeout=2, on_reply=None):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.on_reply = on_reply
+        self.sock, self.buf = None, b""
+        self.ids = itertools.count(1)
+        self.sent = {}      # request id -> (method, send time)
+        self.replies = {}
+        self.notifications = deque(maxlen=256)
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def connect(self):
+        self.close()
+        try:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise SnapcastError(f"cannot connect to snapserver: {e}") from e
+        self.sock.setblocking(False)
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock, self.buf = None, b""
+        self.sent.clear()
+        self.replies.clear()
+
+    def send(self, method, params=None):
+        """Send a request without waiting. Returns its id."""
+        with self.lock:
+            if not self.sock:
+                self.connect()
+            req_id = next(self.ids)
+            req = {"id": req_id, "jsonrpc": "2.0", "method": method}
+            if params is not None:
+                req["params"] = params
+            try:
+                self.sock.settimeout(self.timeout)
+                self.sock.sendall((json.dumps(req) + "\n").encode())
+                self.sock.setblocking(False)
+            except OSError as e:
+                self.close()
+                raise SnapcastError(f"send failed: {e}") from e
+            self.sent[req_id] = (method, time.monotonic())
+            return req_id
+
+    def read_messages(self, timeout=0):
+        """Wait up to timeout seconds for data and return every complete message"""
+        with self.lock:
+            if not self.sock:
+                raise SnapcastError("not connected")
+            try:
+                if not select.select([self.sock], [], [], timeout)[0]:
+                    return []
+                chunk = self.sock.recv(65536)
+            except OSError as e:
+                self.close()
+                raise SnapcastError(f"receive failed: {e}") from e
+            if not chunk:
+                self.close()
+                raise SnapcastError("snapserver closed the control connection")
+            self.buf += chunk
+            *lines, self.buf = self.buf.split(b"\n")
+            try:
+                return [json.loads(line) for line in lines if line.strip()]
+            except ValueError as e:
+                self.close()
+                raise SnapcastError(f"invalid JSON from snapserver: {e}") from e
+
+    def pump(self, timeout=0):
+        """Read available messages, filing replies by id and queueing notifications"""
+        for msg in self.read_messages(timeout):
+            if "id" in msg and "method" not in msg:
+                self.replied(msg)
+                self.replies[msg["id"]] = msg
+            else:
+                self.notifications.append(msg)
+
+    def replied(self, msg):
+        """Account for a reply; callers reading raw messages pass replies through here"""
+        sent = self.sent.pop(msg.get("id"), None)
+        if sent and self.on_reply:
+            self.on_reply(sent[0], time.monotonic() - sent[1])
+
+    def wait_reply(self, req_id, timeout=None):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self.lock:
+            while req_id not in self.replies:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.close()
+                    raise SnapcastError("timed out waiting for snapserver reply")
+                self.pump(remaining)
+            msg = self.replies.pop(req_id)
+        if "error" in msg:
+            raise SnapcastError(f"RPC error: {msg['error']}")
+        return msg.get("result")
+
+    def call(self, method, params=None, timeout=None):
+        with self.lock:
+            reused = self.connected
+            try:
+                return self.wait_reply(self.send(method, params), timeout)
+            except SnapcastError:
+                if not reused or self.connected:
+                    raise
+                # Stale connection (e.g. snapserver restarted): retry once on a fresh one
+                return self.wait_reply(self.send(method, params), timeout)
+
+    def call_many(self, calls, timeout=None):
+        """Pipeline several (method, params) requests; results come back in order"""
+        with self.lock:
+            ids = [self.send(method, params) for method, params in calls]
+            return [self.wait_reply(i, timeout) for i in ids]
+
+    def get_status(self):
+        return Server.from_json(self.call("Server.GetStatus")["server"])
+
+
+def get_status(host=SNAPSERVER_HOST, port=SNAPSERVER_PORT, timeout=2):
+    """One-shot status query for short-lived callers"""
+    with SnapcastClient(host, port, timeout) as client:
+        return client.get_status()
+
+
+def print_status(server):
+    """Stream and client sections as shown by status.sh"""
+    print("Stream:")
+    for s in server.streams:
+        print(f"  {s.id}: {s.status}")
+    print("")
+    print("Clients:")
+    clients = server.clients()
+    if clients:
+        for c in clients:
+            print(f"  {c.name}: {'connected' if c.connected else 'disconnected'} (volume: {c.volume}%)")
+    else:
+        print("  No clients registered")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["status"]:
+        print("Usage: snapcast.py status")
+        sys.exit(1)
+    try:
+        print_status(get_status())
+    except SnapcastError as e:
+        print("Stream:")
+        print("  Unable to connect to snapserver")
+        print("")
+        print("Clients:")
+        print(f"  Unable to read client info ({e})")
+        sys.exit(1)
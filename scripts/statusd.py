@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+BabyMonitor status daemon
+- Background probes for services, Snapcast streams / clients, mic, Tailscale,
+  temperature, memory and CPU, each on its own interval and thread, so a slow
+  probe (tailscale, systemctl) never holds up the others
+- The latest snapshot is kept pre-encoded and served as JSON over a Unix
+  socket: connect, read until EOF, done. Readers never wait for a probe.
+- Mic, temperature, memory, CPU (no `top -bn1`) and uptime come from
+  probes.py, read from /proc and /sys without forking
+- collect() runs every probe once, the fallback when the daemon is not running
+Used by telegram-bot.py, status.sh and babymonitor-ctl.
+Usage: statusd.py serve | json | show [SECTION...]
+"""
+import asyncio, atexit, json, os, signal, socket, subprocess, sys, threading, time
+from datetime import datetime
+import history, probes, settings, snapcast, units
+
+CONFIG = settings.CONFIG
+SOCKET_PATH = "/tmp/babymonitor-status.sock"
+SECTIONS = ("services", "snapcast", "mic", "tailscale", "system")
+
+
+def log(msg):
+    print(f"[{datetime.now()}] {msg}", flush=True)
+
+
+def run(*argv, timeout=5):
+    """stdout of argv, empty if it failed or is not installed"""
+    try:
+        result = subprocess.run(argv, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return ""
+    return result.stdout if result.returncode == 0 else ""
+
+
+# ============== Probes ==============
+# Each returns a JSON-able dict for its snapshot section, {"error": ...} if unavailable.
+
+def probe_services():
+    states = units.query()
+    if not states:
+        return {"error": "systemctl not available"}
+    return {"units": {name: {"status": s.status, "sub_state": s.sub_state,
+                             "restarts": s.restarts, "since": s.since}
+                      for name, s in states.items()}}
+
+
+SNAPCAST = None
+
+def probe_snapcast():
+    global SNAPCAST
+    host, port = CONFIG.get_str('SNAPSERVER_HOST', 'localhost'), CONFIG.get_int('SNAPSERVER_PORT', 1705)
+    if SNAPCAST is None or (SNAPCAST.host, SNAPCAST.port) != (host, port):
+        if SNAPCAST:
+            SNAPCAST.close()
+        # Kept open between passes, one round-trip per probe
+        SNAPCAST = snapcast.SnapcastClient(host, port)
+    try:
+        server = SNAPCAST.get_status()
+    except snapcast.SnapcastError as e:
+        return {"error": str(e)}
+    return {"streams": [{"id": s.id, "status": s.status} for s in server.streams],
+            "clients": [{"name": c.name, "connected": c.connected, "volume": c.volume}
+                        for c in server.clients()]}
+
+
+def probe_mic():
+    devices = probes.usb_mics()
+    return {"detected": bool(devices), "devices": devices}
+
+
+def probe_tailscale():
+    ip = run("tailscale", "ip", "-4").strip()
+    account = ""
+    if ip:
+        names = [line.replace("Name:", "").strip()
+                 for line in run("tailscale", "whois", ip).splitlines() if "Name:" in line]
+        account = names[-1] if names else ""
+    return {"ip": ip, "account": account}
+
+
+CPU = probes.CpuUsage()  # Busy percentage since the previous system probe
+
+def probe_system():
+    used, total = probes.memory()
+    return {"temperature": probes.temperature(), "memory_used": used, "memory_total": total,
+            "cpu_percent": CPU.percent(), "uptime": probes.uptime()}
+
+
+# Section -> (probe, seconds between runs)
+PROBES = {
+    "services": (probe_services, 10),
+    "snapcast": (probe_snapcast, 5),
+    "mic": (probe_mic, 2),       # A file read, cheap enough to run often
+    "tailscale": (probe_tailscale, 30),
+    "system": (probe_system, 10),
+}
+
+
+def probe(name):
+    try:
+        section = PROBES[name][0]()
+    except Exception as e:
+        section = {"error": f"{type(e).__name__}: {e}"}
+    section["updated"] = time.time()
+    return section
+
+
+def collect(sections=SECTIONS):
+    """Run the probes once, directly (slow: use read() when the daemon is up)"""
+    if "system" in sections:
+        CPU.percent()
+        time.sleep(0.5)  # CPU usage needs two samples
+    return {"time": time.time(), **{name: probe(name) for name in sections}}
+
+
+# ============== Daemon ==============
+
+class StatusDaemon:
+    def __init__(self, path=SOCKET_PATH):
+        self.path = path
+        self.snapshot = {}
+        self.encoded = b"{}"
+        self.lock = threading.Lock()
+
+    def update(self, name, section):
+        with self.lock:
+            self.snapshot[name] = section
+            self.snapshot["time"] = time.time()
+            # Encoded once per update, not once per reader
+            self.encoded = json.dumps(self.snapshot).encode()
+
+    def probe_loop(self, name):
+        interval = PROBES[name][1]
+        while True:
+            started = time.monotonic()
+            # No listeners in this process, any probe thread may pick up config.env edits
+            CONFIG.check()
+            self.update(name, probe(name))
+            time.sleep(max(1, interval - (time.monotonic() - started)))
+
+    def listen(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        # Read-only status, status.sh and babymonitor-ctl run as any user
+        os.chmod(self.path, 0o666)
+        sock.listen(16)
+        atexit.register(lambda: os.path.exists(self.path) and os.unlink(self.path))
+        return sock
+
+    def serve(self):
+        sock = self.listen()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        for name in PROBES:
+            threading.Thread(target=self.probe_loop, args=(name,), daemon=True, name=name).start()
+        log(f"Serving status on {self.path}")
+        while True:
+            conn, _ = sock.accept()
+            with conn:
+                try:
+                    conn.settimeout(1)
+                    conn.sendall(self.encoded)
+                except OSError:
+                    pass
+
+
+# ============== Readers ==============
+
+def read(path=SOCKET_PATH, timeout=1):
+    """Latest snapshot from the daemon, None if it is not running"""
+    chunks = []
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            while chunk := sock.recv(65536):
+                chunks.append(chunk)
+        return json.loads(b"".join(chunks))
+    except (OSError, ValueError):
+        return None
+
+
+async def aread(path=SOCKET_PATH, timeout=1):
+    """read() for asyncio callers"""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(path), timeout)
+        try:
+            data = await asyncio.wait_for(reader.read(), timeout)
+        finally:
+            writer.close()
+        return json.loads(data)
+    except (OSError, ValueError, asyncio.TimeoutError):
+        return None
+
+
+def print_snapshot(snap, sections=SECTIONS):
+    """The status.sh layout"""
+    if "services" in sections:
+        print("Services:")
+        svc = snap.get("services", {})
+        for name, s in svc.get("units", {}).items():
+            up = time.time() - s["since"] if s["status"] == "active" and s["since"] else None
+            since = f", up {history.duration(up)}" if up is not None else ""
+            print(f"  {name + ':':<24} {s['status']} ({s['sub_state']}{since}, {s['restarts']} restarts)")
+        if "error" in svc:
+            print(f"  {svc['error']}")
+        print("")
+    if "snapcast" in sections:
+        sc = snap.get("snapcast", {})
+        print("Stream:")
+        for s in sc.get("streams", []):
+            print(f"  {s['id']}: {s['status']}")
+        if "error" in sc:
+            print("  Unable to connect to snapserver")
+        print("")
+        print("Clients:")
+        for c in sc.get("clients", []):
+            print(f"  {c['name']}: {'connected' if c['connected'] else 'disconnected'} (volume: {c['volume']}%)")
+        if "error" in sc:
+            print(f"  Unable to read client info ({sc['error']})")
+        elif not sc.get("clients"):
+            print("  No clients registered")
+        print("")
+    if "system" in sections:
+        sysinfo = snap.get("system", {})
+        temp, cpu = sysinfo.get("temperature"), sysinfo.get("cpu_percent")
+        used, total = sysinfo.get("memory_used"), sysinfo.get("memory_total")
+        uptime = sysinfo.get("uptime")
+        print("System:")
+        print(f"  Uptime:      {history.duration(uptime) if uptime is not None else 'N/A'}")
+        print(f"  Temperature: {f'{temp:.1f}°C' if temp is not None else 'N/A'}")
+        print(f"  Memory:      {f'{used / 2**20:.0f}M/{total / 2**20:.0f}M' if total else 'N/A'}")
+        print(f"  CPU:         {f'{cpu}%' if cpu is not None else 'N/A'}")
+        print("")
+    if "tailscale" in sections:
+        ts = snap.get("tailscale", {})
+        print("Tailscale:")
+        if ts.get("ip"):
+            print(f"  {ts['ip']}" + (f" ({ts['account']})" if ts.get("account") else ""))
+        else:
+            print("  Not connected")
+        print("")
+    if "mic" in sections:
+        print("Audio Device:")
+        mic = snap.get("mic", {})
+        for line in mic.get("devices", []):
+            print(f"  {line}")
+        if not mic.get("devices"):
+            print("  No USB audio device detected!")
+        print("")
+
+
+if __name__ == "__main__":
+    cmd, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("show", [])
+    if cmd == "serve":
+        StatusDaemon().serve()
+    elif cmd in ("json", "show"):
+        sections = tuple(a for a in args if a in SECTIONS) or SECTIONS
+        snap = read()
+        if snap is None:
+            print("(status daemon not running, probing directly)", file=sys.stderr)
+            snap = collect(sections)
+        if cmd == "json":
+            print(json.dumps({k: v for k, v in snap.items() if k in sections or k == "time"}, indent=2))
+        else:
+            print_snapshot(snap, sections)
+    else:
+        print("Usage: statusd.py serve | json | show [SECTION...]")
+        sys.exit(1)
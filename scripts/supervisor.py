@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+BabyMonitor supervisor: the Pi's background duties in one asyncio process
+- Connection monitor (monitor.py, push or poll mode)
+- USB mic hot-plug watcher (micwatch.py)
+- Heartbeat beep every BEEP_INTERVAL minutes (was heartbeat-beep.sh from cron),
+  mixed into the stream by the capture relay (capture.py)
+- One config.env cache, one ntfy dispatcher and HTTP pool, one history writer,
+  one snapserver connection, instead of an interpreter or shell run per duty
+- Control socket for the CLI wrappers (heartbeat-beep.sh, mic-check.sh)
+Runs as babymonitor-monitor.service.
+Usage: supervisor.py [run] | beep | mic | status
+"""
+import asyncio, json, os, signal, sys, time
+from datetime import datetime
+import control, micwatch, monitor, probes, settings
+
+CONFIG = settings.CONFIG
+SOCKET_PATH = "/tmp/babymonitor-supervisor.sock"
+PAUSE_FILE = os.path.join(os.path.dirname(CONFIG.path), "paused")
+
+
+def log(msg):
+    print(f"[{datetime.now()}] {msg}", flush=True)
+
+
+class Heartbeat:
+    """Periodic beep into the stream, so parents know the monitor is alive"""
+
+    def __init__(self):
+        self.last = None    # time.time() of the last beep
+        self.slot = None    # Wall-clock boundary (time.time()) of the last slot that fired
+
+    def play(self):
+        reply = control.request(control.CAPTURE_SOCKET, "beep heartbeat", timeout=1)
+        if not reply or not reply["ok"]:
+            return False
+        self.last = time.time()
+        return True
+
+    def due(self):
+        """(boundary, seconds until it) of the next multiple of BEEP_INTERVAL minutes
+        (cron's */N timing). The loop's timer may fire a little before the wall clock
+        reaches the boundary, so a slot that already fired is skipped, not played twice."""
+        period = max(1, CONFIG.get_int('BEEP_INTERVAL', 5)) * 60
+        now = time.time()
+        slot = (now // period + 1) * period
+        while self.slot is not None and slot <= self.slot:
+            slot += period
+        return slot, slot - now
+
+    async def run(self):
+        while True:
+            slot, delay = self.due()
+            await asyncio.sleep(delay)
+            self.slot = slot
+            if CONFIG.get_bool('BEEP_ENABLED', True) and not os.path.exists(PAUSE_FILE):
+                await asyncio.to_thread(self.play)
+
+
+class Supervisor:
+    def __init__(self):
+        self.monitor = monitor.Monitor()
+        # Mic alerts and events go through the monitor's dispatcher and history writer
+        self.mic = micwatch.MicWatcher(alerts=self.monitor.alerts, events=self.monitor.history)
+        self.heartbeat = Heartbeat()
+        self.started = time.time()
+
+    # --- Duties ---
+
+    async def readable(self, fd, timeout):
+        """Wait until fd is readable or timeout passes. True if readable."""
+        loop, ready = asyncio.get_running_loop(), asyncio.Event()
+        loop.add_reader(fd, ready.set)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    async def run_monitor(self):
+        mon = self.monitor
+        if monitor.MONITOR_MODE == "poll":
+            while True:
+                # Reload here, on the loop and between passes, never inside the worker thread
+                mon.check_config()
+                # Blocking round-trip (2s timeout at most), kept off the event loop
+                await asyncio.to_thread(mon.poll_pass)
+                await asyncio.sleep(monitor.CHECK_INTERVAL)
+        while True:
+            mon.check_config()
+            # (Re)connecting blocks up to the 2s socket timeout, kept off the event loop
+            wait = await asyncio.to_thread(mon.push_wait)
+            if wait is None:
+                await asyncio.sleep(monitor.CHECK_INTERVAL)
+                continue
+            await self.readable(mon.snapcast.fileno(), wait)
+            # Readable or timed out, the read itself does not block. Timers and resync run
+            # here and alerts write the spool (fsync), so this goes to a thread as well.
+            await asyncio.to_thread(mon.push_receive, 0)
+
+    async def run_mic(self):
+        # update() talks to the capture relay (1s timeout), may run sudo systemctl (10s)
+        # and writes the alert spool: all of it in a worker thread
+        await asyncio.to_thread(self.mic.start)
+        while True:
+            if await self.readable(self.mic.inotify.fileno(), self.mic.timeout()):
+                await asyncio.sleep(micwatch.SETTLE)
+                self.mic.handle_events()
+            await asyncio.to_thread(self.mic.tick)
+
+    # --- Control socket ---
+
+    def command(self, cmd):
+        if cmd == "beep":
+            # Explicit test beep: plays even when paused or BEEP_ENABLED=false
+            return {"ok": self.heartbeat.play(), "error": "capture relay not running"}
+        if cmd == "mic":
+            return {"ok": True, "present": self.mic.present, "alerted": self.mic.alerted}
+        if cmd == "status":
+            return {"ok": True, "uptime": time.time() - self.started, "mode": monitor.MONITOR_MODE,
+                    "snapserver": self.monitor.snapcast.connected, "clients_online": len(self.monitor.online),
+                    "mic": self.mic.present, "last_beep": self.heartbeat.last, "paused": os.path.exists(PAUSE_FILE)}
+        return {"ok": False, "error": f"unknown command {cmd!r}"}
+
+    async def handle_client(self, reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), 5)
+            # `beep` waits for the capture relay, off the event loop like the duties
+            reply = await asyncio.to_thread(self.command, line.decode(errors="replace").strip())
+            writer.write((json.dumps(reply) + "\n").encode())
+            await writer.drain()
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_control(self):
+        if os.path.exists(SOCKET_PATH):
+            os.unlink(SOCKET_PATH)
+        server = await asyncio.start_unix_server(self.handle_client, SOCKET_PATH)
+        # The bot and babymonitor-ctl run as other users
+        os.chmod(SOCKET_PATH, 0o666)
+        try:
+            await server.serve_forever()
+        finally:
+            os.unlink(SOCKET_PATH)
+
+    # --- Lifecycle ---
+
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        loop.add_signal_handler(signal.SIGTERM, task.cancel)
+        # systemctl reload: reread config.env at the next monitor pass (the one reload point)
+        loop.add_signal_handler(signal.SIGHUP, lambda: setattr(self.monitor, "reload_requested", True))
+        # Sends the online notice (spool write)
+        await asyncio.to_thread(self.monitor.start)
+        duties = [self.run_monitor(), self.run_mic(), self.heartbeat.run(), self.serve_control()]
+        try:
+            # A crashing duty takes the process down, systemd restarts all of it
+            await asyncio.gather(*duties)
+        except asyncio.CancelledError:
+            log("Supervisor stopping")
+
+    def run(self):
+        asyncio.run(self.main())
+
+
+# ============== CLI ==============
+
+def request(cmd, timeout=5):
+    """Send one command to the running supervisor, None if it is not running"""
+    return control.request(SOCKET_PATH, cmd, timeout)
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if cmd == "run":
+        Supervisor().run()
+        sys.exit(0)
+    if cmd not in ("beep", "mic", "status"):
+        print("Usage: supervisor.py [run] | beep | mic | status")
+        sys.exit(1)
+    reply = request(cmd)
+    if reply is None and cmd == "beep":
+        # Supervisor stopped (paused): ask the capture relay directly
+        reply = {"ok": Heartbeat().play(), "error": "capture relay not running"}
+    elif reply is None and cmd == "mic":
+        reply = {"ok": True, "present": probes.mic_detected(), "alerted": None}
+    elif reply is None:
+        print("Supervisor not running (babymonitor-monitor.service)")
+        sys.exit(1)
+    if cmd == "beep":
+        print("Beep sent" if reply["ok"] else f"Beep failed: {reply['error']}")
+    elif cmd == "mic":
+        print(f"Mic: {'connected' if reply['present'] else 'NOT DETECTED'}"
+              + (" (alert sent)" if reply.get("alerted") else ""))
+    else:
+        for key, value in reply.items():
+            if key != "ok":
+                print(f"  {key + ':':<16} {value}")
+    sys.exit(0 if reply["ok"] else 1)
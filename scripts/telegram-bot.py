@@ -9,18 +9,35 @@ BabyMonitor Telegram Bot
 
 import os
 import sys
-import json
 import asyncio
-import subprocess
+import collections
+import concurrent.futures
+import functools
+import html
+import itertools
 import logging
-import urllib.request
-import tempfile
+import sqlite3
 from pathlib import Path
-from datetime import datetime
-
+from datetime import datetime, timedelta
+
+import apk_cache
+import broadcast
+import control
+import history
+import journal
+import executor
+import httppool
+import pcm_cache
+import playback
+import probes
+import settings
+import statusd
+import units
+from botstate import BotState
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler,
+    Application, BaseUpdateProcessor, CommandHandler, CallbackQueryHandler,
     ContextTypes, MessageHandler, filters, ConversationHandler
 )
 
@@ -44,94 +61,127 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def load_config():
-    """Load config.env as dict"""
-    config = {}
-    if CONFIG_FILE.exists():
-        with open(CONFIG_FILE) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, val = line.split('=', 1)
-                    # Strip inline comments
-                    if '#' in val:
-                        val = val.split('#')[0]
-                    config[key.strip()] = val.strip().strip('"')
-    return config
+# config.env, parsed once and re-read only when the file changes (watch_config)
+CONFIG = settings.CONFIG
 
 
-# Load config once at startup
-CONFIG = load_config()
-DEVICE_NAME = CONFIG.get('DEVICE_NAME', 'Bebefon')
-OWNER_NAME = CONFIG.get('OWNER_NAME', '')
-GIFT_GIVER = CONFIG.get('GIFT_GIVER', 'den Schenker')
+def get_device_name():
+    # Looked up at each use, so a renamed device shows up without a restart
+    return CONFIG.get('DEVICE_NAME', 'Bebefon')
 
 
-def load_bot_config():
-    """Load bot-specific config"""
-    if BOT_CONFIG_FILE.exists():
-        with open(BOT_CONFIG_FILE) as f:
-            return json.load(f)
-    return {"authorized_users": [], "setup_complete": False, "device_name": "Bebefon"}
+def get_gift_giver():
+    return CONFIG.get('GIFT_GIVER', 'den Schenker')
 
 
-def save_bot_config(config):
-    """Save bot-specific config"""
-    with open(BOT_CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=2)
+# Seconds between systemd unit state checks (crash notifications)
+UNIT_WATCH_INTERVAL = CONFIG.get_int('UNIT_WATCH_INTERVAL', 10)
 
+# bot_config.json, loaded once and written through on changes
+BOT_STATE = BotState(BOT_CONFIG_FILE)
 
-def run_command(cmd, timeout=30):
-    """Run shell command and return output"""
-    try:
-        result = subprocess.run(
-            cmd, shell=True, capture_output=True, text=True, timeout=timeout
-        )
-        return result.returncode == 0, result.stdout + result.stderr
-    except subprocess.TimeoutExpired:
-        return False, "Command timed out"
-    except Exception as e:
-        return False, str(e)
+# Snapcast APK for the setup wizard: F-Droid metadata and the file are cached
+SNAPCAST_APK = apk_cache.SnapcastAPK()
+APK_CAPTION = ("📦 Snapcast {version} fuer Android\n\n"
+               "APK oeffnen und installieren. Falls 'Unbekannte Quellen' gefragt wird: einmal erlauben.")
+
+# Voice messages and audio files for the speaker, played one after another.
+# Decoded PCM is cached by file_unique_id, a repeated lullaby starts at once.
+PLAYBACK = playback.PlaybackQueue(cache=pcm_cache.PCMCache(max_bytes=CONFIG.get_int('PCM_CACHE_MB', 200) * 2**20))
+
+
+async def tailscale_ip():
+    """Tailscale IPv4 address, empty if not connected"""
+    ok, output = await executor.run("tailscale", "ip", "-4", stderr=False)
+    return output.strip() if ok else ""
+
+
+async def tailscale_account(ip):
+    """Account name of a Tailscale IP, empty if unknown"""
+    if not ip:
+        return ""
+    ok, output = await executor.run("tailscale", "whois", ip, stderr=False)
+    names = [line.replace("Name:", "").strip() for line in output.splitlines() if "Name:" in line]
+    return names[-1] if ok and names else ""
+
+
+class TailscaleLogin:
+    """`sudo tailscale up` through the executor. It prints the auth URL and then runs
+    until the login in the browser is done, at most LOGIN_TIMEOUT: the executor
+    kills and reaps it after that. One login at a time, asking again meanwhile
+    returns the same URL."""
+
+    URL_WAIT = 10           # Seconds to wait for the URL to be printed
+    LOGIN_TIMEOUT = 300     # Same as the "connected" notification loops
+
+    def __init__(self):
+        self.task, self.url, self.seen = None, None, None
+
+    def on_line(self, line):
+        for word in line.split():
+            if word.startswith("https://login.tailscale.com") and not self.url:
+                self.url = word
+                self.seen.set()
+
+    async def auth_url(self, reauth=False):
+        """The login URL, None if none came within URL_WAIT (e.g. already logged in)"""
+        if self.task is None or self.task.done():
+            self.url, self.seen = None, asyncio.Event()
+            argv = ["sudo", "tailscale", "up"] + (["--force-reauth"] if reauth else [])
+            self.task = asyncio.create_task(
+                executor.run(*argv, kind="login", timeout=self.LOGIN_TIMEOUT, on_line=self.on_line))
+        waiter = asyncio.create_task(self.seen.wait())
+        # The command may also end without a URL (already connected, error)
+        await asyncio.wait([waiter, self.task], timeout=self.URL_WAIT, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        return self.url
+
+
+TAILSCALE_LOGIN = TailscaleLogin()
+
+
+async def status_snapshot():
+    """Latest snapshot from the status daemon, probed directly if it is not running"""
+    snap = await statusd.aread()
+    if snap is None:
+        logger.warning("Status daemon not reachable, probing directly")
+        snap = await asyncio.to_thread(statusd.collect)
+    # Sections whose first probe has not finished yet (daemon just started)
+    for section in statusd.SECTIONS:
+        snap.setdefault(section, {})
+    return snap
+
+
+async def play_beep():
+    return await executor.run("python3", str(SCRIPTS_DIR / "supervisor.py"), "beep", kind="media")
 
 
-def get_service_status(service):
-    """Get systemd service status"""
-    ok, output = run_command(f"systemctl is-active {service}")
-    return output.strip()
+async def capture_command(cmd):
+    """Reply of the capture relay (capture.py), None if babymonitor-audio is not running"""
+    return await asyncio.to_thread(control.request, control.CAPTURE_SOCKET, cmd, 2)
 
 
-def fetch_snapcast_apk_info():
-    """Fetch latest Snapcast APK info from F-Droid API. Returns (version, url) or (None, None)."""
+async def record_event(kind, subject="", detail=""):
+    """Add an event to the history database, never failing the command"""
     try:
-        req = urllib.request.Request(
-            "https://f-droid.org/api/v1/packages/de.badaix.snapcast",
-            headers={"User-Agent": "bebefon-bot"}
-        )
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read())
-        pkg = data["packages"][0]
-        version = pkg["versionName"]
-        version_code = pkg["versionCode"]
-        url = f"https://f-droid.org/repo/de.badaix.snapcast_{version_code}.apk"
-        return version, url
-    except Exception:
-        return None, None
-
-
-def is_authorized(update: Update, bot_config: dict) -> bool:
+        await asyncio.to_thread(history.record, kind, subject, detail)
+    except sqlite3.Error as e:
+        logger.warning(f"History write failed: {e}")
+
+
+def is_authorized(update: Update) -> bool:
     """Check if user is authorized"""
-    user_id = update.effective_user.id
-    return user_id in bot_config.get("authorized_users", [])
+    return BOT_STATE.is_authorized(update.effective_user.id)
 
 
-async def deny_if_unauthorized(update: Update, bot_config: dict) -> bool:
-    """Returns True if unauthorized (and sends explanation). Use as: if await deny_if_unauthorized(...): return"""
-    if is_authorized(update, bot_config):
+async def deny_if_unauthorized(update: Update) -> bool:
+    """Returns True if unauthorized (and sends explanation). Use as: if await deny_if_unauthorized(update): return"""
+    if is_authorized(update):
         return False
-    if not bot_config.get("authorized_users"):
+    if not BOT_STATE.has_users:
         await update.message.reply_text("Tippe /start um den Bot zu aktivieren.")
     else:
-        invite_code = load_config().get("INVITE_CODE", "")
+        invite_code = CONFIG.get("INVITE_CODE", "")
         if invite_code:
             await update.message.reply_text(f"Kein Zugriff. Falls du einen Einladungscode hast:\n/join <code>")
         else:
@@ -143,22 +193,19 @@ async def deny_if_unauthorized(update: Update, bot_config: dict) -> bool:
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command - welcome and setup wizard"""
-    bot_config = load_bot_config()
     user = update.effective_user
     user_id = user.id
 
     # Auto-authorize first user
-    if not bot_config.get("authorized_users"):
-        bot_config["authorized_users"] = [user_id]
-        save_bot_config(bot_config)
+    if await BOT_STATE.authorize(user_id, only_if_first=True):
         logger.info(f"Auto-authorized first user: {user_id} ({user.first_name})")
 
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
-    device_name = DEVICE_NAME
+    device_name = get_device_name()
 
-    if bot_config.get("setup_complete"):
+    if BOT_STATE.get("setup_complete"):
         await update.message.reply_text(
             f"Willkommen zurueck bei {device_name}!\n\n"
             "Befehle:\n"
@@ -184,26 +231,24 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def join(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Join with invite code"""
-    bot_config = load_bot_config()
     user = update.effective_user
     user_id = user.id
 
-    if user_id in bot_config.get("authorized_users", []):
+    if BOT_STATE.is_authorized(user_id):
         await update.message.reply_text("Du hast bereits Zugriff!")
         return
 
-    invite_code = load_config().get('INVITE_CODE', '')
+    invite_code = CONFIG.get('INVITE_CODE', '')
     if not invite_code:
         await update.message.reply_text("Kein Einladungscode konfiguriert.")
         return
 
     provided = " ".join(context.args) if context.args else ""
     if provided == invite_code:
-        bot_config.setdefault("authorized_users", []).append(user_id)
-        save_bot_config(bot_config)
+        await BOT_STATE.authorize(user_id)
         logger.info(f"User {user_id} ({user.first_name}) joined via invite code")
         await update.message.reply_text(
-            f"✅ Willkommen bei {DEVICE_NAME}!\n\nDu hast jetzt Zugriff. Tippe /start."
+            f"✅ Willkommen bei {get_device_name()}!\n\nDu hast jetzt Zugriff. Tippe /start."
         )
     else:
         await update.message.reply_text("❌ Falscher Einladungscode.")
@@ -211,30 +256,24 @@ async def join(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def leave(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Remove yourself from authorized users"""
-    bot_config = load_bot_config()
     user = update.effective_user
     user_id = user.id
 
-    users = bot_config.get("authorized_users", [])
-    if user_id not in users:
+    if not await BOT_STATE.revoke(user_id):
         await update.message.reply_text("Du bist nicht autorisiert.")
         return
 
-    users.remove(user_id)
-    bot_config["authorized_users"] = users
-    save_bot_config(bot_config)
     logger.info(f"User {user_id} ({user.first_name}) left")
     await update.message.reply_text("👋 Du wurdest entfernt und bekommst keine Benachrichtigungen mehr.")
 
 
 async def set_invite_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Set invite code via Telegram"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     if not context.args:
-        current = load_config().get('INVITE_CODE', '(nicht gesetzt)')
+        current = CONFIG.get('INVITE_CODE', '(nicht gesetzt)')
         await update.message.reply_text(
             f"Aktueller Code: {current}\n\nNeuen Code setzen:\n/setcode <neuer-code>"
         )
@@ -254,27 +293,32 @@ async def set_invite_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     with open(config_path, 'w') as f:
         f.write(content)
+    CONFIG.refresh()
 
     await update.message.reply_text(f"✅ Einladungscode gesetzt: {new_code}")
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Help command"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     await update.message.reply_text(
-        f"{DEVICE_NAME} Befehle:\n\n"
+        f"{get_device_name()} Befehle:\n\n"
         "📊 *Status & Info*\n"
         "/status - Vollstaendiger Systemstatus\n"
         "/temp - CPU Temperatur anzeigen\n"
         "/uptime - Laufzeit anzeigen\n"
+        "/history [tage] - Verbindungsabbrueche & Verfuegbarkeit\n"
         "/config - Aktuelle Konfiguration\n\n"
         "🔔 *Benachrichtigungen*\n"
         "/pause - Alarme pausieren\n"
         "/resume - Alarme fortsetzen\n"
         "/beep - Test-Piep senden\n\n"
+        "🎤 *Audio*\n"
+        "/gain [dB] - Mikrofon-Verstaerkung anzeigen / setzen\n"
+        "/mute - Mikrofon stumm schalten\n"
+        "/unmute - Mikrofon wieder einschalten\n\n"
         "🔧 *Verwaltung*\n"
         "/restart - Dienste neu starten\n"
         "/reboot - Raspberry Pi neu starten\n"
@@ -283,13 +327,15 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/tailscale reauth - Account wechseln\n"
         "/tailscale disconnect - Tailscale trennen\n"
         "/update - Updates von Git laden\n"
-        "/logs [service] - Logs anzeigen\n\n"
+        "/logs [service] - Logs anzeigen\n"
+        "/logs follow [service] [min] - Logs live verfolgen\n\n"
         "⚙️ *Einstellungen*\n"
         "/setup - Setup-Assistent\n"
         "/reset - Setup zuruecksetzen\n"
         "/setname <name> - Geraetename aendern\n"
         "/setcode <code> - Einladungscode setzen\n"
         "/join <code> - Mit Einladungscode beitreten\n"
+        "/broadcast <text> - Nachricht an alle anderen Nutzer\n"
         "/leave - Eigenen Zugang entfernen",
         parse_mode="Markdown"
     )
@@ -297,31 +343,29 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show system status"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
-    device_name = DEVICE_NAME
-    config = load_config()
+    device_name = get_device_name()
 
-    # Service statuses
-    services = {
-        "snapserver": get_service_status("snapserver"),
-        "babymonitor-audio": get_service_status("babymonitor-audio"),
-        "babymonitor-monitor": get_service_status("babymonitor-monitor"),
-        "babymonitor-mic-alert": get_service_status("babymonitor-mic-alert"),
-        "tailscaled": get_service_status("tailscaled"),
-    }
+    # Everything comes from the status daemon's snapshot, no probes run here
+    snap = await status_snapshot()
+    service_names = ["snapserver", "babymonitor-audio", "babymonitor-monitor", "babymonitor-status", "tailscaled"]
+    services = snap["services"].get("units", {})
 
     # Tailscale IP + account
-    ok, tailscale_ip = run_command("tailscale ip -4 2>/dev/null")
-    tailscale_ip = tailscale_ip.strip() if ok else "Nicht verbunden"
-    ok, ts_account = run_command("tailscale whois $(tailscale ip -4 2>/dev/null) 2>/dev/null | grep 'Name:' | tail -1")
-    tailscale_account = ts_account.strip().replace("Name:", "").strip() if ok else ""
+    ts_ip = snap["tailscale"].get("ip") or "Nicht verbunden"
+    ts_account = snap["tailscale"].get("account", "")
 
     # Mic status
-    ok, mic_output = run_command("arecord -l 2>/dev/null | grep -c USB")
-    mic_status = "Verbunden" if ok and mic_output.strip() != "0" else "NICHT ERKANNT"
+    mic_status = "Verbunden" if snap["mic"].get("detected") else "NICHT ERKANNT"
+
+    # Snapcast clients
+    if "error" in snap["snapcast"]:
+        clients_line = "Snapserver nicht erreichbar"
+    else:
+        names = [c["name"] for c in snap["snapcast"]["clients"] if c["connected"]]
+        clients_line = f"{len(names)} ({', '.join(names)})" if names else "keine"
 
     # Alerts paused?
     paused = PAUSE_FILE.exists()
@@ -332,34 +376,38 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status_text = f"📊 {device_name} Status\n\n"
     status_text += f"🔔 Benachrichtigungen: {'⏸️ PAUSIERT' if paused else '✅ Aktiv'}\n"
     status_text += f"🎤 Mikrofon: {'✅' if mic_status == 'Verbunden' else '❌'} {mic_status}\n"
-    ts_line = f"🌐 Tailscale: {tailscale_ip}"
-    if tailscale_account:
-        ts_line += f" ({tailscale_account})"
+    status_text += f"📱 Verbundene Geraete: {clients_line}\n"
+    ts_line = f"🌐 Tailscale: {ts_ip}"
+    if ts_account:
+        ts_line += f" ({ts_account})"
     status_text += ts_line + "\n\n"
 
     status_text += "Dienste:\n"
-    for service, state in services.items():
-        icon = status_icons.get(state, "❓")
-        status_text += f"  {icon} {service}: {state}\n"
+    for service in service_names:
+        state = services.get(service, {})
+        status = state.get("status", "unknown")
+        icon = status_icons.get(status, "❓")
+        status_text += f"  {icon} {service}: {status}"
+        if state.get("restarts"):
+            status_text += f" ({state['restarts']}x neu gestartet)"
+        status_text += "\n"
 
-    status_text += f"\n📢 Ntfy Topic: {config.get('NTFY_TOPIC', 'nicht gesetzt')}"
+    status_text += f"\n📢 Ntfy Topic: {CONFIG.get('NTFY_TOPIC', 'nicht gesetzt')}"
 
     await update.message.reply_text(status_text)
 
 
 async def pause(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Pause alerts"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     PAUSE_FILE.touch()
-    run_command("sudo systemctl stop babymonitor-monitor")
+    await executor.run("sudo", "systemctl", "stop", "babymonitor-monitor", kind="service")
+    await record_event(history.PAUSED, "", update.effective_user.first_name or "Telegram")
 
-    # Ping healthchecks with /0 to prevent false alarms
-    config = load_config()
-    for url in config.get("HEALTHCHECK_URLS", "").split():
-        run_command(f"curl -fsS -m 10 '{url}/0' > /dev/null 2>&1")
+    # Ping healthchecks with /0 to prevent false alarms (all URLs at once)
+    await asyncio.to_thread(httppool.ping_all, CONFIG.get_list("HEALTHCHECK_URLS"), "/0")
 
     await update.message.reply_text(
         "⏸️ Benachrichtigungen PAUSIERT\n\n"
@@ -370,69 +418,119 @@ async def pause(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Resume alerts"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     if PAUSE_FILE.exists():
         PAUSE_FILE.unlink()
-    run_command("sudo systemctl start babymonitor-monitor")
+    await executor.run("sudo", "systemctl", "start", "babymonitor-monitor", kind="service")
+    await record_event(history.RESUMED, "", update.effective_user.first_name or "Telegram")
 
-    # Ping healthchecks to resume monitoring
-    config = load_config()
-    for url in config.get("HEALTHCHECK_URLS", "").split():
-        run_command(f"curl -fsS -m 10 '{url}' > /dev/null 2>&1")
+    # Ping healthchecks to resume monitoring (all URLs at once)
+    await asyncio.to_thread(httppool.ping_all, CONFIG.get_list("HEALTHCHECK_URLS"))
 
     await update.message.reply_text("▶️ Benachrichtigungen AKTIV\n\nUeberwachung laeuft.")
 
 
 async def beep(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send test beep"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
-    ok, output = run_command("sudo -u _snapserver /opt/babymonitor/scripts/heartbeat-beep.sh")
+    ok, output = await play_beep()
     if ok:
         await update.message.reply_text("🔔 Piep gesendet! Du solltest ihn im Stream hoeren.")
     else:
         await update.message.reply_text(f"❌ Piep fehlgeschlagen: {output}")
 
 
+async def gain_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show or set the software mic gain (dB), applied live"""
+    if await deny_if_unauthorized(update):
+        return
+
+    previous = await capture_command("gain")
+    if previous is None:
+        await update.message.reply_text("❌ Audio-Capture laeuft nicht (babymonitor-audio).")
+        return
+    if not context.args:
+        await update.message.reply_text(
+            f"🎚️ Mikrofon-Verstaerkung: {previous['gain_db']:+.1f} dB"
+            + (" (stumm)" if previous["muted"] else "")
+            + "\n\nAendern mit /gain <dB>, z.B. /gain 6 oder /gain -3"
+        )
+        return
+
+    reply = await capture_command(f"gain {context.args[0].replace(',', '.')}")
+    if not reply or not reply["ok"]:
+        await update.message.reply_text("❌ Ungueltiger Wert. Beispiel: /gain 6 (erlaubt: -30 bis 30 dB)")
+        return
+    await update.message.reply_text(
+        "🎚️ Verstaerkung angepasst\n\n"
+        f"Neuer Wert: {reply['gain_db']:+.1f} dB\n"
+        f"Vorheriger Wert: {previous['gain_db']:+.1f} dB"
+    )
+
+
+async def mute(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mute the mic in the stream (heartbeat and warning beeps stay audible)"""
+    if await deny_if_unauthorized(update):
+        return
+
+    if await capture_command("mute") is None:
+        await update.message.reply_text("❌ Audio-Capture laeuft nicht (babymonitor-audio).")
+        return
+    await update.message.reply_text(
+        "🔇 Audio stumm geschaltet\n\n"
+        "Das Mikrofon ist im Stream stumm, die Clients bleiben verbunden.\n"
+        "Nutze /unmute zum Reaktivieren."
+    )
+
+
+async def unmute(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Unmute the mic"""
+    if await deny_if_unauthorized(update):
+        return
+
+    if await capture_command("unmute") is None:
+        await update.message.reply_text("❌ Audio-Capture laeuft nicht (babymonitor-audio).")
+        return
+    await update.message.reply_text("🔊 Audio aktiviert\n\nMikrofon ist wieder hoerbar.")
+
+
 async def show_config(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show current config"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
-    config = load_config()
 
     text = "⚙️ Aktuelle Konfiguration:\n\n"
-    text += f"🎤 Audio-Geraet: {config.get('AUDIO_DEVICE', 'hw:2,0')}\n"
-    text += f"📢 Ntfy Topic: {config.get('NTFY_TOPIC', 'nicht gesetzt')}\n"
-    text += f"⏱️ Pruefintervall: {config.get('CHECK_INTERVAL', '5')}s\n"
-    text += f"⏱️ Verbindungs-Timeout: {config.get('DISCONNECT_TIMEOUT', '10')}s\n"
-    text += f"⏱️ Alarm-Cooldown: {config.get('ALERT_COOLDOWN', '30')}s\n"
-    text += f"\n🔔 Piep aktiviert: {config.get('BEEP_ENABLED', 'true')}\n"
-    text += f"🔔 Piep-Intervall: {config.get('BEEP_INTERVAL', '5')} Min\n"
-    if config.get('INVITE_CODE'):
-        text += f"\n🔑 Einladungscode: {config.get('INVITE_CODE')}\n"
-        text += f"   Teilen mit: /join {config.get('INVITE_CODE')}\n"
+    text += f"🎤 Audio-Geraet: {CONFIG.get('AUDIO_DEVICE', 'hw:2,0')}\n"
+    text += f"📢 Ntfy Topic: {CONFIG.get('NTFY_TOPIC', 'nicht gesetzt')}\n"
+    text += f"⏱️ Pruefintervall: {CONFIG.get('CHECK_INTERVAL', '5')}s\n"
+    text += f"⏱️ Verbindungs-Timeout: {CONFIG.get('DISCONNECT_TIMEOUT', '10')}s\n"
+    text += f"⏱️ Alarm-Cooldown: {CONFIG.get('ALERT_COOLDOWN', '30')}s\n"
+    text += f"\n🔔 Piep aktiviert: {CONFIG.get('BEEP_ENABLED', 'true')}\n"
+    text += f"🔔 Piep-Intervall: {CONFIG.get('BEEP_INTERVAL', '5')} Min\n"
+    if CONFIG.get('INVITE_CODE'):
+        text += f"\n🔑 Einladungscode: {CONFIG.get('INVITE_CODE')}\n"
+        text += f"   Teilen mit: /join {CONFIG.get('INVITE_CODE')}\n"
 
     await update.message.reply_text(text)
 
 
 async def git_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Update from git"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     await update.message.reply_text("🔄 Suche nach Updates...")
 
-    _, before = run_command(f"cd {REPO_DIR} && git rev-parse HEAD")
-    ok, output = run_command(f"cd {REPO_DIR} && git fetch origin && git reset --hard origin/main", timeout=60)
-    _, after = run_command(f"cd {REPO_DIR} && git rev-parse HEAD")
+    _, before = await executor.run("git", "rev-parse", "HEAD", cwd=REPO_DIR, kind="git")
+    ok, output = await executor.run("git", "fetch", "origin", cwd=REPO_DIR, kind="git", timeout=60)
+    if ok:
+        ok, output = await executor.run("git", "reset", "--hard", "origin/main", cwd=REPO_DIR, kind="git")
+    _, after = await executor.run("git", "rev-parse", "HEAD", cwd=REPO_DIR, kind="git")
 
     if ok:
         if before.strip() != after.strip():
@@ -447,17 +545,18 @@ async def git_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def restart_services(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Restart all services"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     await update.message.reply_text("🔄 Starte Dienste neu...")
 
-    services = ["snapserver", "babymonitor-audio", "babymonitor-monitor", "babymonitor-mic-alert"]
+    services = ["snapserver", "babymonitor-audio", "babymonitor-monitor", "babymonitor-status"]
+    # One systemctl call restarts all units, one query reads back the result per unit
+    await executor.run("sudo", "systemctl", "restart", *services, kind="service", timeout=90)
+    states = await units.aquery(services)
     results = []
-
     for service in services:
-        ok, _ = run_command(f"sudo systemctl restart {service}")
+        ok = service in states and states[service].active_state in ("active", "activating")
         results.append(f"{'✅' if ok else '❌'} {service}")
     results.append("🔄 babymonitor-telegram (startet neu...)")
 
@@ -465,21 +564,20 @@ async def restart_services(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     async def self_restart():
         await asyncio.sleep(2)
-        run_command("sudo systemctl restart babymonitor-telegram")
+        await executor.run("sudo", "systemctl", "restart", "babymonitor-telegram", kind="service")
     asyncio.create_task(self_restart())
 
 
 async def tailscale_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Connect Tailscale - sends auth URL via Telegram"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     arg = context.args[0] if context.args else ""
 
     # Disconnect / logout
     if arg == "disconnect":
-        ok, output = run_command("sudo tailscale logout")
+        ok, output = await executor.run("sudo", "tailscale", "logout", kind="network")
         if ok:
             await update.message.reply_text(
                 "🔌 Tailscale abgemeldet.\n\nMit /tailscale neu verbinden und anderem Account anmelden."
@@ -489,12 +587,11 @@ async def tailscale_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Check current status
-    ok, ts_ip = run_command("tailscale ip -4 2>/dev/null")
-    if ok and ts_ip.strip():
-        ok2, ts_account = run_command("tailscale whois $(tailscale ip -4 2>/dev/null) 2>/dev/null | grep 'Name:' | tail -1")
-        account = ts_account.strip().replace("Name:", "").strip() if ok2 else "unbekannt"
+    ts_ip = await tailscale_ip()
+    if ts_ip:
+        account = await tailscale_account(ts_ip) or "unbekannt"
         await update.message.reply_text(
-            f"✅ Tailscale verbunden\n\nIP: {ts_ip.strip()}\nAccount: {account}\n\n"
+            f"✅ Tailscale verbunden\n\nIP: {ts_ip}\nAccount: {account}\n\n"
             "Optionen:\n/tailscale reauth - Account wechseln\n/tailscale disconnect - Trennen"
         )
         if arg != "reauth":
@@ -503,27 +600,7 @@ async def tailscale_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🔄 Starte Tailscale-Anmeldung...")
 
     try:
-        cmd = ["sudo", "tailscale", "up", "--force-reauth"] if arg == "reauth" else ["sudo", "tailscale", "up"]
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT
-        )
-
-        # Read output looking for auth URL (timeout 10s)
-        auth_url = None
-        try:
-            async with asyncio.timeout(10):
-                async for line in proc.stdout:
-                    text_line = line.decode().strip()
-                    for word in text_line.split():
-                        if word.startswith("https://login.tailscale.com"):
-                            auth_url = word
-                            break
-                    if auth_url:
-                        break
-        except asyncio.TimeoutError:
-            pass
+        auth_url = await TAILSCALE_LOGIN.auth_url(reauth=arg == "reauth")
 
         if auth_url:
             await update.message.reply_text(
@@ -534,11 +611,10 @@ async def tailscale_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             async def notify_when_connected():
                 for _ in range(60):  # max 5 min
                     await asyncio.sleep(5)
-                    ok, ip = run_command("tailscale ip -4 2>/dev/null")
-                    if ok and ip.strip():
-                        ok2, acc = run_command("tailscale whois $(tailscale ip -4 2>/dev/null) 2>/dev/null | grep 'Name:' | tail -1")
-                        account = acc.strip().replace("Name:", "").strip() if ok2 else ""
-                        msg = f"✅ Tailscale verbunden!\n\nIP: {ip.strip()}"
+                    ip = await tailscale_ip()
+                    if ip:
+                        account = await tailscale_account(ip)
+                        msg = f"✅ Tailscale verbunden!\n\nIP: {ip}"
                         if account:
                             msg += f"\nAccount: {account}"
                         await update.message.reply_text(msg)
@@ -546,9 +622,9 @@ async def tailscale_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             asyncio.create_task(notify_when_connected())
         else:
             # Maybe already connected without needing auth
-            ok, ts_ip = run_command("tailscale ip -4 2>/dev/null")
-            if ok and ts_ip.strip():
-                await update.message.reply_text(f"✅ Tailscale verbunden! IP: {ts_ip.strip()}")
+            ts_ip = await tailscale_ip()
+            if ts_ip:
+                await update.message.reply_text(f"✅ Tailscale verbunden! IP: {ts_ip}")
             else:
                 await update.message.reply_text("❌ Kein Auth-Link erhalten. Versuche es nochmal mit /tailscale")
 
@@ -556,20 +632,131 @@ async def tailscale_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Fehler: {e}")
 
 
+LOG_SERVICES = ["snapserver", "babymonitor-audio", "babymonitor-monitor", "babymonitor-status"]
+FOLLOW_MINUTES = 10         # Default run time of /logs follow, at most FOLLOW_MAX_MINUTES
+FOLLOW_MAX_MINUTES = 60
+FOLLOW_EDIT_INTERVAL = 3    # Seconds between edits: everything logged meanwhile goes into one edit
+FOLLOW_LINES = 40
+FOLLOW_BODY_CHARS = 3000    # Escaped text, Telegram's limit is 4096 for the whole message
+FOLLOWS = {}                # chat_id -> running follow task, one per chat
+
+
+async def edit_follow_message(message, text, reply_markup=None):
+    """Edit in place. Waits out flood control, ignores 'message is not modified'."""
+    while True:
+        try:
+            await message.edit_text(text, parse_mode="HTML", reply_markup=reply_markup)
+            return
+        except RetryAfter as e:
+            await asyncio.sleep(broadcast.retry_seconds(e))
+        except BadRequest as e:
+            if "not modified" not in str(e):
+                logger.warning(f"Log follow edit failed: {e}")
+            return
+
+
+def escaped_tail(text, limit):
+    """End of text, html-escaped, at most limit characters. Cut before escaping
+    (counting each character's escaped length), so no entity is split."""
+    start, size = len(text), 0
+    while start > 0 and size + len(html.escape(text[start - 1])) <= limit:
+        start -= 1
+        size += len(html.escape(text[start]))
+    return html.escape(text[start:])
+
+
+async def follow_logs(message, service, minutes):
+    """Keep one message updated with the newest journal lines of service"""
+    lines = collections.deque(maxlen=FOLLOW_LINES)
+    changed = asyncio.Event()
+    failed = []
+    stop_button = InlineKeyboardMarkup([[InlineKeyboardButton("⏹ Stoppen", callback_data="logs_stop")]])
+    header = f"📋 Live-Logs fuer {service} (bis {datetime.now() + timedelta(minutes=minutes):%H:%M})"
+
+    def render(footer=""):
+        # Newest lines win when the message would get too long. Measured after escaping:
+        # '&' becomes '&amp;', a stack trace can grow several times over.
+        body, size = [], 0
+        for line in reversed(lines):
+            escaped = html.escape(line)
+            if size + len(escaped) > FOLLOW_BODY_CHARS:
+                if not body:
+                    body.append(escaped_tail(line, FOLLOW_BODY_CHARS))
+                break
+            body.append(escaped)
+            size += len(escaped) + 1
+        text = "\n".join(reversed(body)) or "(noch keine Eintraege)"
+        return f"{html.escape(header)}\n\n<pre>{text}</pre>{footer}"
+
+    async def read():
+        try:
+            async for entry in journal.JournalFollower(service).entries():
+                lines.append(journal.format_entry(entry))
+                changed.set()
+        except OSError as e:
+            failed.append(f"\n\n❌ journalctl nicht verfuegbar: {html.escape(str(e)[:200])}")
+            changed.set()
+        except Exception as e:
+            # Shown in the footer, a dead reader must not leave the message frozen
+            logger.exception(f"Log follow of {service} failed")
+            failed.append(f"\n\n❌ Lesefehler: {html.escape(str(e)[:200])}")
+            changed.set()
+
+    reader = asyncio.create_task(read())
+    deadline = asyncio.get_running_loop().time() + minutes * 60
+    footer = "\n\n⏱ Zeit abgelaufen."
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(changed.wait(), deadline - asyncio.get_running_loop().time())
+            except asyncio.TimeoutError:
+                break
+            if failed:
+                footer = failed[0]
+                break
+            changed.clear()
+            await edit_follow_message(message, render(), stop_button)
+            await asyncio.sleep(FOLLOW_EDIT_INTERVAL)
+    except asyncio.CancelledError:
+        footer = "\n\n⏹ Gestoppt."
+        raise
+    finally:
+        reader.cancel()
+        await asyncio.shield(edit_follow_message(message, render(footer)))
+
+
 async def logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show logs"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    """Show logs, or follow them live: /logs follow [service] [minutes]"""
+    if await deny_if_unauthorized(update):
         return
 
-    service = context.args[0] if context.args else "babymonitor-monitor"
-    valid_services = ["snapserver", "babymonitor-audio", "babymonitor-monitor", "babymonitor-mic-alert"]
+    args = list(context.args or [])
+    follow = bool(args) and args[0] == "follow"
+    if follow:
+        args.pop(0)
+    service = args[0] if args else "babymonitor-monitor"
+
+    if service not in LOG_SERVICES:
+        await update.message.reply_text(f"Gueltige Dienste: {', '.join(LOG_SERVICES)}")
+        return
 
-    if service not in valid_services:
-        await update.message.reply_text(f"Gueltige Dienste: {', '.join(valid_services)}")
+    if follow:
+        minutes = FOLLOW_MINUTES
+        if len(args) > 1:
+            if not args[1].isdigit():
+                await update.message.reply_text("Verwendung: /logs follow [dienst] [minuten]")
+                return
+            minutes = min(max(int(args[1]), 1), FOLLOW_MAX_MINUTES)
+        chat_id = update.effective_chat.id
+        if chat_id in FOLLOWS:
+            FOLLOWS.pop(chat_id).cancel()
+        message = await update.message.reply_text(f"📋 Live-Logs fuer {service} werden gestartet...")
+        task = asyncio.create_task(follow_logs(message, service, minutes))
+        FOLLOWS[chat_id] = task
+        task.add_done_callback(lambda t: FOLLOWS.get(chat_id) is t and FOLLOWS.pop(chat_id))
         return
 
-    ok, output = run_command(f"journalctl -u {service} -n 20 --no-pager")
+    ok, output = await executor.run("journalctl", "-u", service, "-n", "20", "--no-pager")
 
     if ok and output:
         # Truncate if too long
@@ -580,10 +767,47 @@ async def logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Keine Logs gefunden.")
 
 
+async def logs_stop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop button under a /logs follow message"""
+    query = update.callback_query
+    if not is_authorized(update):
+        await query.answer("Kein Zugriff.", show_alert=True)
+        return
+
+    task = FOLLOWS.pop(update.effective_chat.id, None)
+    if task:
+        task.cancel()
+    await query.answer("Gestoppt" if task else "Laeuft nicht mehr")
+
+
+async def broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send a message to all other authorized users"""
+    if await deny_if_unauthorized(update):
+        return
+
+    if not context.args:
+        await update.message.reply_text("Verwendung: /broadcast <Nachricht>\nBeispiel: /broadcast Bin gleich zurueck")
+        return
+
+    sender = update.effective_user
+    recipients = [u for u in BOT_STATE.authorized_users if u != sender.id]
+    if not recipients:
+        await update.message.reply_text("Niemand sonst hat Zugriff. Teile den Einladungscode mit /setcode.")
+        return
+
+    results = await broadcast.send_message(context.bot, recipients,
+                                           f"📢 {sender.first_name or 'Jemand'}: {' '.join(context.args)}",
+                                           what="broadcast")
+    failed = [user_id for user_id, (ok, _) in results.items() if not ok]
+    text = f"📢 Gesendet an {len(results) - len(failed)}/{len(results)}"
+    if failed:
+        text += "\n❌ Nicht zugestellt: " + ", ".join(str(user_id) for user_id in failed)
+    await update.message.reply_text(text)
+
+
 async def set_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Set device name"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     if not context.args:
@@ -591,20 +815,17 @@ async def set_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     new_name = " ".join(context.args)
-    bot_config["device_name"] = new_name
-    save_bot_config(bot_config)
+    await BOT_STATE.set("device_name", new_name)
 
     await update.message.reply_text(f"✅ Geraetename gesetzt: {new_name}")
 
 
 async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Reset setup wizard"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
-    bot_config["setup_complete"] = False
-    save_bot_config(bot_config)
+    await BOT_STATE.set("setup_complete", False)
 
     await update.message.reply_text(
         "🔄 Setup zurueckgesetzt!\n\n"
@@ -614,132 +835,203 @@ async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def reboot_pi(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Reboot the Pi"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     await update.message.reply_text("🔄 Neustart wird ausgefuehrt...\n\nDas Babyphone ist in ca. 1 Minute wieder online.")
-    run_command("sudo reboot")
+    await executor.run("sudo", "reboot", kind="service")
 
 
 async def temperature(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show Pi temperature"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
-    ok, temp = run_command("vcgencmd measure_temp 2>/dev/null || cat /sys/class/thermal/thermal_zone0/temp 2>/dev/null")
-
-    if "temp=" in temp:
-        # vcgencmd format: temp=45.0'C
-        temp_str = temp.strip()
-    elif temp.strip().isdigit():
-        # /sys format: 45000 (millidegrees)
-        temp_c = int(temp.strip()) / 1000
-        temp_str = f"temp={temp_c:.1f}'C"
-    else:
-        temp_str = "Nicht verfuegbar"
+    temp = probes.temperature()
+    temp_str = f"temp={temp:.1f}'C" if temp is not None else "Nicht verfuegbar"
 
     await update.message.reply_text(f"🌡️ CPU Temperatur: {temp_str}")
 
 
 async def uptime_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show system uptime"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
-    ok, output = run_command("uptime -p")
-    await update.message.reply_text(f"⏱️ Laufzeit: {output.strip()}")
+    secs = probes.uptime()
+    await update.message.reply_text(f"⏱️ Laufzeit: {history.duration(secs) if secs is not None else 'unbekannt'}")
 
 
-async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle voice messages - play them in baby's room"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
-        return
+HISTORY_LABELS = {
+    history.CLIENT_CONNECTED: "🟢 {subject} verbunden",
+    history.CLIENT_DISCONNECTED: "🔴 {subject} getrennt",
+    history.STREAM_IDLE: "🔇 Audio-Stream {subject} inaktiv",
+    history.STREAM_PLAYING: "🔊 Audio-Stream {subject} laeuft wieder",
+    history.MIC_LOST: "🎤 Mikrofon getrennt",
+    history.MIC_RESTORED: "🎤 Mikrofon wieder da",
+    history.PAUSED: "⏸️ Pausiert ({detail})",
+    history.RESUMED: "▶️ Fortgesetzt ({detail})",
+    history.MONITOR_START: "🚀 Ueberwachung gestartet",
+    history.MONITOR_STOP: "⏹️ Ueberwachung gestoppt",
+}
 
-    await update.message.reply_text("🎤 Sprachnachricht empfangen, wird abgespielt...")
 
+async def history_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Disconnect counts, per-client availability and recent events"""
+    if await deny_if_unauthorized(update):
+        return
+
+    days = int(context.args[0]) if context.args and context.args[0].isdigit() else 7
+    days = max(1, min(days, history.KEEP_DAYS))
     try:
-        # Download voice message
-        voice = update.message.voice
-        file = await context.bot.get_file(voice.file_id)
+        summary = await asyncio.to_thread(history.summary, days)
+    except sqlite3.Error:
+        await update.message.reply_text("📜 Noch keine Ereignisse aufgezeichnet.")
+        return
 
-        # Save to temp file
-        with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as f:
-            temp_path = f.name
+    def counts_line(label, counts):
+        return (f"{label}: {counts.get(history.CLIENT_DISCONNECTED, 0)} Verbindungsabbrueche, "
+                f"{counts.get(history.MIC_LOST, 0)} Mikrofonausfaelle, "
+                f"{counts.get(history.PAUSED, 0)} Pausen, {counts.get(history.ALERT, 0)} Alarme")
+
+    text = f"📜 {get_device_name()} Verlauf\n\n"
+    text += counts_line("Letzte 24h", summary["day"]) + "\n"
+    text += counts_line(f"Letzte {days} Tage", summary["window"]) + "\n\n"
+
+    text += f"📱 Verfuegbarkeit ({days} Tage):\n"
+    for name, stat in sorted(summary["clients"].items()):
+        pct = history.uptime_percent(stat)
+        text += f"  {name}: {'-' if pct is None else f'{pct:.1f}%'}"
+        if stat[2]:
+            text += f", laengster Ausfall {history.duration(stat[2])}"
+        text += "\n"
+    if not summary["clients"]:
+        text += "  Keine Daten\n"
+
+    if summary["recent"]:
+        text += "\nLetzte Ereignisse:\n"
+        for ts, kind, subject, detail in summary["recent"]:
+            label = HISTORY_LABELS.get(kind, kind).format(subject=subject, detail=detail)
+            text += f"  {datetime.fromtimestamp(ts):%d.%m. %H:%M} {label}\n"
 
-        await file.download_to_drive(temp_path)
+    await update.message.reply_text(text)
 
-        # Convert to WAV and play through speaker
-        wav_path = temp_path.replace(".ogg", ".wav")
-        ok, output = run_command(f"ffmpeg -y -i {temp_path} -ar 48000 -ac 1 {wav_path} 2>/dev/null")
 
-        if ok:
-            # Play through default audio output (speaker)
-            ok, output = run_command(f"aplay {wav_path} 2>&1")
-            if ok:
-                await update.message.reply_text("✅ Nachricht wurde im Babyzimmer abgespielt!")
-            else:
-                await update.message.reply_text(f"❌ Abspielen fehlgeschlagen: {output[:200]}")
-        else:
-            await update.message.reply_text("❌ Audio-Konvertierung fehlgeschlagen")
+def telegram_source(bot, file_id):
+    """Playback source for a Telegram file. Runs in the queue's worker thread and
+    only when the file is not cached, so a cache hit costs no Bot API call."""
+    loop = asyncio.get_running_loop()
+
+    def chunks():
+        future = asyncio.run_coroutine_threadsafe(bot.get_file(file_id), loop)
+        try:
+            file = future.result(30)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise playback.SourceError("Telegram did not answer within 30s") from None
+        except TelegramError as e:
+            raise playback.SourceError(f"Telegram: {e}") from e
+        yield from httppool.stream(file.file_path, chunk_size=playback.CHUNK_SIZE, timeout=60)
+    return chunks
+
+
+async def queue_playback(update: Update, context: ContextTypes.DEFAULT_TYPE, media, label, done_text):
+    """Stream a Telegram file through the playback queue, report when it has played"""
+    item = PLAYBACK.submit(f"{label} von {update.effective_user.first_name or 'Telegram'}",
+                           telegram_source(context.bot, media.file_id), key=media.file_unique_id)
+    position = PLAYBACK.position(item)
+    status = "wird abgespielt..." if not position else f"in der Warteschlange (Platz {position})"
+    await update.message.reply_text(
+        f"{label} empfangen, {status}",
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⏹ Abbrechen", callback_data=f"play_cancel:{item.id}")]])
+    )
+
+    ok, error = await item.wait()
+    if ok:
+        await update.message.reply_text(done_text)
+    elif item.cancelled:
+        await update.message.reply_text("⏹ Wiedergabe abgebrochen.")
+    else:
+        await update.message.reply_text(f"❌ Abspielen fehlgeschlagen: {error[:200]}")
+
 
-        # Cleanup
-        run_command(f"rm -f {temp_path} {wav_path}")
+async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle voice messages - play them in baby's room"""
+    if await deny_if_unauthorized(update):
+        return
 
+    try:
+        await queue_playback(update, context, update.message.voice, "🎤 Sprachnachricht",
+                             "✅ Nachricht wurde im Babyzimmer abgespielt!")
     except Exception as e:
         await update.message.reply_text(f"❌ Fehler: {str(e)}")
 
 
 async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle audio files - play them in baby's room"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
-    await update.message.reply_text("🎵 Audio empfangen, wird abgespielt...")
-
     try:
-        # Download audio file
-        audio = update.message.audio or update.message.document
-        file = await context.bot.get_file(audio.file_id)
+        await queue_playback(update, context, update.message.audio or update.message.document, "🎵 Audio",
+                             "✅ Audio wurde im Babyzimmer abgespielt!")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Fehler: {str(e)}")
 
-        # Save to temp file
-        with tempfile.NamedTemporaryFile(suffix=".audio", delete=False) as f:
-            temp_path = f.name
 
-        await file.download_to_drive(temp_path)
+async def playback_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Cancel button under a queued voice message / audio file"""
+    query = update.callback_query
+    if not is_authorized(update):
+        await query.answer("Kein Zugriff.", show_alert=True)
+        return
 
-        # Convert to WAV and play
-        wav_path = temp_path + ".wav"
-        ok, output = run_command(f"ffmpeg -y -i {temp_path} -ar 48000 -ac 1 {wav_path} 2>/dev/null")
+    item_id = int(query.data.split(":", 1)[1])
+    if await PLAYBACK.cancel(item_id):
+        await query.answer("Abgebrochen")
+    else:
+        await query.answer("Schon fertig")
+    await query.edit_message_reply_markup(reply_markup=None)
 
-        if ok:
-            ok, output = run_command(f"aplay {wav_path} 2>&1")
-            if ok:
-                await update.message.reply_text("✅ Audio wurde im Babyzimmer abgespielt!")
-            else:
-                await update.message.reply_text(f"❌ Abspielen fehlgeschlagen: {output[:200]}")
-        else:
-            await update.message.reply_text("❌ Audio-Konvertierung fehlgeschlagen")
 
-        # Cleanup
-        run_command(f"rm -f {temp_path} {wav_path}")
+# ============== Setup Wizard ==============
+
+async def send_snapcast_apk(bot, chat_id):
+    """Send the current Snapcast APK. Uploaded once per version, after that
+    Telegram re-shares it by file_id without any transfer."""
+    sent = BOT_STATE.get("snapcast_apk") or {}
+    # F-Droid down: the version uploaded last time is still fine to hand out
+    info = await asyncio.to_thread(SNAPCAST_APK.latest) or (sent and (sent["version"], sent["version_code"]))
+    if not info:
+        await bot.send_message(chat_id, "❌ Snapcast APK nicht gefunden. Bitte manuell von F-Droid laden.")
+        return
+    version, version_code = info
+    caption = APK_CAPTION.format(version=version)
 
-    except Exception as e:
-        await update.message.reply_text(f"❌ Fehler: {str(e)}")
+    if sent.get("version_code") == version_code:
+        try:
+            await bot.send_document(chat_id, document=sent["file_id"], caption=caption)
+            return
+        except TelegramError as e:
+            logger.warning(f"Stored APK file_id rejected, uploading again: {e}")
 
+    try:
+        if not os.path.exists(SNAPCAST_APK.path(version_code)):
+            await bot.send_message(chat_id, f"📦 Lade Snapcast {version} herunter...")
+        path = await asyncio.to_thread(SNAPCAST_APK.download, version_code)
+        with open(path, "rb") as f:
+            message = await bot.send_document(chat_id, document=f, filename=f"snapcast_{version}.apk", caption=caption)
+        await BOT_STATE.set("snapcast_apk", {"version": version, "version_code": version_code,
+                                             "file_id": message.document.file_id})
+    except Exception as e:
+        await bot.send_message(chat_id, f"❌ Fehler beim Herunterladen: {str(e)[:200]}")
 
-# ============== Setup Wizard ==============
 
 async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle setup wizard callbacks"""
     query = update.callback_query
     await query.answer()
 
-    bot_config = load_bot_config()
     data = query.data
 
     if data == "setup_start":
@@ -765,8 +1057,6 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data == "setup_tailscale":
         # Get Tailscale status
-        ok, ts_status = run_command("tailscale status --json 2>/dev/null")
-
         await query.edit_message_text(
             "🌐 Schritt 2: Tailscale verbinden\n\n"
             "Tailscale erstellt ein sicheres Netzwerk, damit du dich von ueberall verbinden kannst (auch unterwegs mit mobilen Daten).\n\n"
@@ -783,14 +1073,13 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data == "setup_tailscale_link":
         # Check if we need to generate auth URL for the Pi
-        ok, ts_ip = run_command("tailscale ip -4 2>/dev/null")
-        ts_ip = ts_ip.strip() if ok else None
+        ts_ip = await tailscale_ip()
 
         if ts_ip:
             await query.edit_message_text(
                 "🌐 Schritt 2b: Tailscale Verbindung\n\n"
                 "✅ Das Babyphone ist bereits mit Tailscale verbunden!\n\n"
-                f"📍 {DEVICE_NAME} Tailscale IP: `{ts_ip}`\n\n"
+                f"📍 {get_device_name()} Tailscale IP: `{ts_ip}`\n\n"
                 "Stelle sicher, dass dein Handy auch mit Tailscale verbunden ist.\n"
                 "Du findest dein Handy dann in der Tailscale App.",
                 parse_mode="Markdown",
@@ -802,7 +1091,7 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             # Need to set up Tailscale on Pi first
             await query.edit_message_text(
-                f"🌐 Schritt 2b: Tailscale auf {DEVICE_NAME} einrichten\n\n"
+                f"🌐 Schritt 2b: Tailscale auf {get_device_name()} einrichten\n\n"
                 f"⚠️ Das Babyphone ist noch nicht mit Tailscale verbunden.\n\n"
                 f"Tippe auf 'Anmeldelink generieren' — du bekommst dann einen Link zum Einloggen.",
                 parse_mode="Markdown",
@@ -817,32 +1106,14 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("🔄 Verbindung wird vorbereitet...")
 
         try:
-            proc = await asyncio.create_subprocess_exec(
-                "sudo", "tailscale", "up",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
-            )
-
-            auth_url = None
-            try:
-                async with asyncio.timeout(10):
-                    async for line in proc.stdout:
-                        text_line = line.decode().strip()
-                        for word in text_line.split():
-                            if word.startswith("https://login.tailscale.com"):
-                                auth_url = word
-                                break
-                        if auth_url:
-                            break
-            except asyncio.TimeoutError:
-                pass
+            auth_url = await TAILSCALE_LOGIN.auth_url()
 
             if auth_url:
                 await query.edit_message_text(
                     f"🔑 Tailscale-Anmeldung\n\n"
                     f"Oeffne diesen Link in deinem Browser und melde dich an:\n\n"
                     f"{auth_url}\n\n"
-                    f"Nach der Anmeldung verbindet sich {DEVICE_NAME} automatisch.\n"
+                    f"Nach der Anmeldung verbindet sich {get_device_name()} automatisch.\n"
                     f"Du bekommst hier eine Bestaetigung.",
                     reply_markup=InlineKeyboardMarkup([
                         [InlineKeyboardButton("🔄 Verbindung pruefen", callback_data="setup_tailscale_link")]
@@ -854,12 +1125,12 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 async def notify_setup_connected():
                     for _ in range(60):
                         await asyncio.sleep(5)
-                        ok, ip = run_command("tailscale ip -4 2>/dev/null")
-                        if ok and ip.strip():
+                        ip = await tailscale_ip()
+                        if ip:
                             await query.get_bot().send_message(
                                 chat_id,
-                                f"✅ {DEVICE_NAME} ist jetzt mit Tailscale verbunden!\n\n"
-                                f"IP: {ip.strip()}\n\n"
+                                f"✅ {get_device_name()} ist jetzt mit Tailscale verbunden!\n\n"
+                                f"IP: {ip}\n\n"
                                 f"Tippe auf 'Weiter' im Setup-Wizard um fortzufahren.",
                             )
                             return
@@ -867,10 +1138,10 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             else:
                 # Check if already connected
-                ok, ts_ip = run_command("tailscale ip -4 2>/dev/null")
-                if ok and ts_ip.strip():
+                ts_ip = await tailscale_ip()
+                if ts_ip:
                     await query.edit_message_text(
-                        f"✅ {DEVICE_NAME} ist bereits mit Tailscale verbunden!\n\nIP: {ts_ip.strip()}",
+                        f"✅ {get_device_name()} ist bereits mit Tailscale verbunden!\n\nIP: {ts_ip}",
                         reply_markup=InlineKeyboardMarkup([
                             [InlineKeyboardButton("Weiter →", callback_data="setup_snapcast")]
                         ])
@@ -893,8 +1164,7 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
 
     elif data == "setup_snapcast":
-        ok, ts_ip = run_command("tailscale ip -4 2>/dev/null")
-        ts_ip = ts_ip.strip() if ok and ts_ip.strip() else None
+        ts_ip = await tailscale_ip()
 
         if not ts_ip:
             await query.edit_message_text(
@@ -924,40 +1194,14 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data == "setup_send_apk":
         await query.answer("📦 APK wird gesucht...", show_alert=False)
-        chat_id = query.message.chat_id
-
-        version, apk_url = fetch_snapcast_apk_info()
-        if not apk_url:
-            await query.get_bot().send_message(chat_id, "❌ Snapcast APK nicht gefunden. Bitte manuell von F-Droid laden.")
-            return
-
-        await query.get_bot().send_message(chat_id, f"📦 Lade Snapcast {version} herunter...")
-
-        try:
-            with tempfile.NamedTemporaryFile(suffix=".apk", delete=False) as tmp:
-                tmp_path = tmp.name
-                req = urllib.request.Request(apk_url, headers={"User-Agent": "bebefon-bot"})
-                with urllib.request.urlopen(req, timeout=60) as resp:
-                    tmp.write(resp.read())
-
-            with open(tmp_path, "rb") as f:
-                await query.get_bot().send_document(
-                    chat_id,
-                    document=f,
-                    filename=f"snapcast_{version}.apk",
-                    caption=f"📦 Snapcast {version} fuer Android\n\nAPK oeffnen und installieren. Falls 'Unbekannte Quellen' gefragt wird: einmal erlauben."
-                )
-            os.unlink(tmp_path)
-        except Exception as e:
-            await query.get_bot().send_message(chat_id, f"❌ Fehler beim Herunterladen: {str(e)[:200]}")
+        await send_snapcast_apk(query.get_bot(), query.message.chat_id)
 
     elif data == "setup_test_beep":
-        run_command("sudo -u _snapserver /opt/babymonitor/scripts/heartbeat-beep.sh")
+        await play_beep()
         await query.answer("🔔 Piep gesendet! Hast du ihn gehoert?", show_alert=True)
 
     elif data == "setup_ntfy":
-        config = load_config()
-        topic = config.get("NTFY_TOPIC", "babymonitor-alerts")
+        topic = CONFIG.get("NTFY_TOPIC", "babymonitor-alerts")
 
         await query.edit_message_text(
             "🔔 Schritt 4: Benachrichtigungen einrichten\n\n"
@@ -977,22 +1221,22 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     elif data == "setup_test_alert":
-        config = load_config()
-        topic = config.get("NTFY_TOPIC", "babymonitor-alerts")
-        server = config.get("NTFY_SERVER", "https://ntfy.sh")
-
-        run_command(
-            f'curl -s -H "Title: Test Alarm" -H "Priority: high" '
-            f'-H "Tags: baby,white_check_mark" -d "Setup-Test erfolgreich!" '
-            f'"{server}/{topic}"'
-        )
+        topic = CONFIG.get("NTFY_TOPIC", "babymonitor-alerts")
+        server = CONFIG.get("NTFY_SERVER", "https://ntfy.sh")
+
+        try:
+            await asyncio.to_thread(
+                httppool.post, f"{server}/{topic}", "Setup-Test erfolgreich!",
+                headers={"Title": "Test Alarm", "Priority": "high", "Tags": "baby,white_check_mark"}
+            )
+        except httppool.HTTPError as e:
+            logger.error(f"Test alert failed: {e}")
         await query.answer("📲 Test-Alarm gesendet! Pruefe deine Ntfy App.", show_alert=True)
 
     elif data == "setup_complete":
-        bot_config["setup_complete"] = True
-        save_bot_config(bot_config)
+        await BOT_STATE.set("setup_complete", True)
 
-        device_name = DEVICE_NAME
+        device_name = get_device_name()
 
         await query.edit_message_text(
             f"✅ {device_name} Setup abgeschlossen!\n\n"
@@ -1010,8 +1254,7 @@ async def setup_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def setup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manually trigger setup wizard"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return
 
     await update.message.reply_text(
@@ -1024,6 +1267,27 @@ async def setup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ============== Main ==============
 
+async def notify_unit_change(bot, name, old, new):
+    """units.watch callback: tell authorized users about crashes and automatic restarts"""
+    if new.active_state == "failed" and old.active_state != "failed":
+        text = f"❌ Dienst {name} ist abgestuerzt ({new.sub_state})."
+    elif new.restarts > old.restarts:
+        text = f"🔁 Dienst {name} wurde nach einem Absturz neu gestartet ({new.restarts}x seit Boot)."
+    elif old.active_state == "failed" and new.active_state == "active":
+        text = f"✅ Dienst {name} laeuft wieder."
+    else:
+        return
+    logger.warning(f"Unit {name}: {old.active_state}/{old.sub_state} -> {new.active_state}/{new.sub_state}, restarts {new.restarts}")
+    await broadcast.send_message(bot, BOT_STATE.authorized_users, f"{get_device_name()}: {text}", what="unit notification")
+
+
+async def watch_config():
+    """The bot's one config reload point: config.env edits are picked up here, on the event loop"""
+    while True:
+        await asyncio.sleep(settings.RELOAD_CHECK)
+        CONFIG.check()
+
+
 async def post_init(application):
     """Set up bot commands menu and send startup message"""
     # Set commands menu
@@ -1033,8 +1297,12 @@ async def post_init(application):
         ("pause", "Alarme pausieren"),
         ("resume", "Alarme fortsetzen"),
         ("beep", "Test-Piep senden"),
+        ("gain", "Mikrofon-Verstaerkung"),
+        ("mute", "Mikrofon stumm"),
+        ("unmute", "Mikrofon einschalten"),
         ("temp", "CPU Temperatur"),
         ("uptime", "Laufzeit anzeigen"),
+        ("history", "Verlauf & Verfuegbarkeit"),
         ("config", "Konfiguration anzeigen"),
         ("restart", "Dienste neu starten"),
         ("reboot", "Pi neu starten"),
@@ -1046,50 +1314,48 @@ async def post_init(application):
         ("reset", "Setup zuruecksetzen"),
         ("setcode", "Einladungscode setzen"),
         ("join", "Mit Einladungscode beitreten"),
+        ("broadcast", "Nachricht an alle Nutzer"),
         ("leave", "Eigenen Zugang entfernen"),
         ("help", "Alle Befehle"),
     ]
     await application.bot.set_my_commands(commands)
     logger.info("Bot commands menu set")
 
+    application.create_task(watch_config())
+
+    # Push a message when a service crashes or is restarted by systemd
+    application.create_task(units.watch(functools.partial(notify_unit_change, application.bot),
+                                        interval=UNIT_WATCH_INTERVAL))
+
     # Send startup message to authorized users
-    bot_config = load_bot_config()
-    authorized_users = bot_config.get("authorized_users", [])
+    authorized_users = BOT_STATE.authorized_users
 
     if not authorized_users:
         logger.info("No authorized users yet - waiting for first /start")
         return
 
-    device_name = DEVICE_NAME
+    device_name = get_device_name()
 
-    if bot_config.get("setup_complete"):
+    if BOT_STATE.get("setup_complete"):
         # Already set up - send status check
         # Wait a bit for services to fully start
-        import asyncio
         await asyncio.sleep(10)
 
-        config = load_config()
-
-        # Check services (active or activating counts as OK)
-        services_ok = all(
-            get_service_status(s) in ["active", "activating"]
-            for s in ["snapserver", "babymonitor-audio", "babymonitor-monitor"]
-        )
-
-        # Check mic
-        ok, mic_output = run_command("arecord -l 2>/dev/null | grep -c USB")
-        mic_ok = ok and mic_output.strip() != "0"
-
-        # Check Tailscale
-        ok, ts_ip = run_command("tailscale ip -4 2>/dev/null")
-        ts_ok = ok and ts_ip.strip()
+        # Check services (active or activating counts as OK), mic and Tailscale
+        snap = await status_snapshot()
+        states = snap["services"].get("units", {})
+        services_ok = all(states.get(name, {}).get("status") in ["active", "activating"]
+                          for name in ["snapserver", "babymonitor-audio", "babymonitor-monitor"])
+        mic_ok = snap["mic"].get("detected", False)
+        ts_ip = snap["tailscale"].get("ip", "")
+        ts_ok = bool(ts_ip)
 
         if services_ok and mic_ok and ts_ok:
             message = (
                 f"✅ *{device_name} ist online!*\n\n"
                 f"Alle Systeme laufen einwandfrei.\n\n"
                 f"🎤 Mikrofon: OK\n"
-                f"🌐 Tailscale: `{ts_ip.strip()}`\n"
+                f"🌐 Tailscale: `{ts_ip}`\n"
                 f"🔔 Benachrichtigungen: Aktiv\n\n"
                 f"Tippe /status fuer Details."
             )
@@ -1116,28 +1382,19 @@ async def post_init(application):
             f"1️⃣ Tippe auf /setup\n"
             f"2️⃣ Folge dem Assistenten\n"
             f"3️⃣ In 5 Minuten ist alles fertig!\n\n"
-            f"Bei Fragen wende dich an {GIFT_GIVER} 😊"
+            f"Bei Fragen wende dich an {get_gift_giver()} 😊"
         )
 
-    # Send to all authorized users
-    for user_id in authorized_users:
-        try:
-            await application.bot.send_message(
-                chat_id=user_id,
-                text=message,
-                parse_mode="Markdown"
-            )
-            logger.info(f"Startup message sent to user {user_id}")
-        except Exception as e:
-            logger.error(f"Failed to send startup message to {user_id}: {e}")
+    # Send to all authorized users at once
+    await broadcast.send_message(application.bot, authorized_users, message, what="startup message",
+                                 parse_mode="Markdown")
 
 
 ## ============== WiFi ==============
 
 async def wifi_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """WiFi Hauptmenü"""
-    bot_config = load_bot_config()
-    if await deny_if_unauthorized(update, bot_config):
+    if await deny_if_unauthorized(update):
         return ConversationHandler.END
     context.user_data.clear()
     keyboard = [
@@ -1156,18 +1413,22 @@ async def wifi_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
 
     if data == "wifi_status":
-        ok, out = run_command("nmcli -t -f DEVICE,STATE,CONNECTION device status | grep '^wlan0:'")
-        ok2, ip = run_command("ip addr show wlan0 | grep 'inet ' | awk '{print $2}' | cut -d/ -f1")
-        ok3, signal = run_command("nmcli -t -f IN-USE,SSID,SIGNAL device wifi list | grep '^\\*'")
+        (ok, devices), (ok3, networks) = await asyncio.gather(
+            executor.run("nmcli", "-t", "-f", "DEVICE,STATE,CONNECTION", "device", "status", stderr=False),
+            executor.run("nmcli", "-t", "-f", "IN-USE,SSID,SIGNAL", "device", "wifi", "list", stderr=False),
+        )
+        ip = probes.ipv4("wlan0")
+        out = next((line for line in devices.splitlines() if line.startswith("wlan0:")), "")
+        active = next((line for line in networks.splitlines() if line.startswith("*")), "")
 
         if ok and "connected" in out:
             parts = out.strip().split(":")
             ssid = parts[2] if len(parts) > 2 else "unbekannt"
-            sig = signal.strip().split(":")[-1] if ok3 else "?"
-            ip_addr = ip.strip() if ok2 else "?"
+            sig = active.strip().split(":")[-1] if ok3 and active else "?"
+            ip_addr = ip or "?"
             text = f"📡 WiFi verbunden\n\nNetzwerk: {ssid}\nSignal: {sig}%\nIP: {ip_addr}"
         else:
-            ok4, radio = run_command("nmcli radio wifi")
+            ok4, radio = await executor.run("nmcli", "radio", "wifi")
             text = f"📴 WiFi {'deaktiviert' if ok4 and 'disabled' in radio else 'getrennt'}"
 
         keyboard = [[InlineKeyboardButton("🔙 Zurück", callback_data="wifi_back")]]
@@ -1175,7 +1436,7 @@ async def wifi_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return WIFI_MENU
 
     if data == "wifi_toggle":
-        ok, radio = run_command("nmcli radio wifi")
+        ok, radio = await executor.run("nmcli", "radio", "wifi")
         enabled = ok and "enabled" in radio
         keyboard = [
             [InlineKeyboardButton("✅ Ja", callback_data="wifi_toggle_confirm")],
@@ -1189,15 +1450,15 @@ async def wifi_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return WIFI_MENU
 
     if data == "wifi_toggle_confirm":
-        ok, radio = run_command("nmcli radio wifi")
+        ok, radio = await executor.run("nmcli", "radio", "wifi")
         if ok and "enabled" in radio:
-            ok2, out = run_command("sudo nmcli radio wifi off")
+            ok2, out = await executor.run("sudo", "nmcli", "radio", "wifi", "off", kind="network")
             if ok2:
                 await query.edit_message_text("📴 WiFi deaktiviert.")
             else:
                 await query.edit_message_text(f"❌ Fehler: {out[:200]}")
         else:
-            ok2, out = run_command("sudo nmcli radio wifi on")
+            ok2, out = await executor.run("sudo", "nmcli", "radio", "wifi", "on", kind="network")
             if ok2:
                 await query.edit_message_text("📶 WiFi aktiviert.")
             else:
@@ -1206,7 +1467,7 @@ async def wifi_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if data == "wifi_scan":
         await query.edit_message_text("🔍 Suche Netzwerke...")
-        ok, out = run_command("nmcli -t -f SSID,SECURITY device wifi list")
+        ok, out = await executor.run("nmcli", "-t", "-f", "SSID,SECURITY", "device", "wifi", "list", stderr=False)
         if not ok or not out.strip():
             await query.edit_message_text("❌ Keine Netzwerke gefunden.")
             return ConversationHandler.END
@@ -1228,13 +1489,13 @@ async def wifi_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ssid = data.replace("wifi_connect_", "")
         context.user_data["wifi_ssid"] = ssid
         # Check if already saved
-        ok, saved = run_command(f"nmcli -t -f NAME connection show | grep -Fx '{ssid}'")
-        if ok and saved.strip():
+        ok, saved = await executor.run("nmcli", "-t", "-f", "NAME", "connection", "show", stderr=False)
+        if ok and ssid in saved.splitlines():
             await query.edit_message_text(f"🔄 Verbinde mit {ssid}...")
-            ok2, out = run_command(f"sudo nmcli device wifi connect '{ssid}'", timeout=20)
+            ok2, out = await executor.run("sudo", "nmcli", "device", "wifi", "connect", ssid, kind="network", timeout=20)
             if ok2 or "successfully" in out.lower():
-                ok3, ip = run_command("ip addr show wlan0 | grep 'inet ' | awk '{print $2}' | cut -d/ -f1")
-                await query.edit_message_text(f"✅ Verbunden mit {ssid}\nIP: {ip.strip() if ok3 else '?'}")
+                ip = probes.ipv4("wlan0")
+                await query.edit_message_text(f"✅ Verbunden mit {ssid}\nIP: {ip or '?'}")
             else:
                 await query.edit_message_text(f"❌ Verbindung fehlgeschlagen:\n{out[:200]}")
             return ConversationHandler.END
@@ -1263,10 +1524,11 @@ async def wifi_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Fehler: kein Netzwerk gewählt.")
         return ConversationHandler.END
     await update.message.reply_text(f"🔄 Verbinde mit {ssid}...")
-    ok, out = run_command(f"sudo nmcli device wifi connect '{ssid}' password '{password}'", timeout=20)
+    ok, out = await executor.run("sudo", "nmcli", "device", "wifi", "connect", ssid, "password", password,
+                                 kind="network", timeout=20)
     if ok or "successfully" in out.lower():
-        ok2, ip = run_command("ip addr show wlan0 | grep 'inet ' | awk '{print $2}' | cut -d/ -f1")
-        await update.message.reply_text(f"✅ Verbunden mit {ssid}\nIP: {ip.strip() if ok2 else '?'}")
+        ip = probes.ipv4("wlan0")
+        await update.message.reply_text(f"✅ Verbunden mit {ssid}\nIP: {ip or '?'}")
     else:
         await update.message.reply_text(f"❌ Verbindung fehlgeschlagen. Passwort falsch?\n{out[:200]}")
     return ConversationHandler.END
@@ -1290,6 +1552,36 @@ wifi_conv_handler = ConversationHandler(
 )
 
 
+class ConversationOrderedUpdates(BaseUpdateProcessor):
+    """Updates run concurrently, a slow command never holds up the others. Except the
+    ones a conversation could take (entry point, state or fallback handler): those are
+    processed one at a time per chat, in arrival order. ConversationHandler state is
+    not safe under concurrent updates, a quick password after the WiFi menu button
+    would otherwise be matched against the old state and dropped."""
+
+    def __init__(self, conversation, max_concurrent_updates=256):
+        super().__init__(max_concurrent_updates)
+        # Filters only (command name, callback pattern, text), no conversation state
+        self.handlers = [*conversation.entry_points, *itertools.chain.from_iterable(conversation.states.values()),
+                         *conversation.fallbacks]
+        self.locks = {}     # chat id -> asyncio.Lock
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None or not any(handler.check_update(update) for handler in self.handlers):
+            await coroutine
+            return
+        lock = self.locks.setdefault(chat.id, asyncio.Lock())
+        async with lock:
+            await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
 def main():
     """Start the bot"""
     # Load bot token from config.env or environment
@@ -1301,7 +1593,10 @@ def main():
         sys.exit(1)
 
     # Create application
-    app = Application.builder().token(token).post_init(post_init).build()
+    # Handlers run concurrently, a slow command (git fetch, WiFi connect) never holds up the others.
+    # WiFi conversation updates are kept in order per chat (ConversationOrderedUpdates).
+    app = (Application.builder().token(token).concurrent_updates(ConversationOrderedUpdates(wifi_conv_handler))
+           .post_init(post_init).build())
 
     # Add handlers
     app.add_handler(CommandHandler("start", start))
@@ -1314,25 +1609,33 @@ def main():
     app.add_handler(CommandHandler("pause", pause))
     app.add_handler(CommandHandler("resume", resume))
     app.add_handler(CommandHandler("beep", beep))
+    app.add_handler(CommandHandler("gain", gain_cmd))
+    app.add_handler(CommandHandler("mute", mute))
+    app.add_handler(CommandHandler("unmute", unmute))
     app.add_handler(CommandHandler("config", show_config))
     app.add_handler(CommandHandler("update", git_update))
     app.add_handler(CommandHandler("restart", restart_services))
     app.add_handler(CommandHandler("logs", logs))
     app.add_handler(CommandHandler("setname", set_name))
+    app.add_handler(CommandHandler("broadcast", broadcast_cmd))
     app.add_handler(CommandHandler("setup", setup_command))
     app.add_handler(CommandHandler("reset", reset))
     app.add_handler(CommandHandler("reboot", reboot_pi))
     app.add_handler(CommandHandler("tailscale", tailscale_cmd))
     app.add_handler(CommandHandler("temp", temperature))
     app.add_handler(CommandHandler("uptime", uptime_cmd))
+    app.add_handler(CommandHandler("history", history_cmd))
     app.add_handler(CallbackQueryHandler(setup_callback, pattern="^setup_"))
+    app.add_handler(CallbackQueryHandler(logs_stop_callback, pattern="^logs_stop$"))
 
-    # Voice/audio message handlers (for future: play in baby's room)
-    # app.add_handler(MessageHandler(filters.VOICE, handle_voice))
-    # app.add_handler(MessageHandler(filters.AUDIO, handle_audio))
+    # Voice messages / audio files are played in baby's room (needs a speaker), one after another
+    if CONFIG.get_bool('VOICE_PLAYBACK_ENABLED', False):
+        app.add_handler(MessageHandler(filters.VOICE, handle_voice))
+        app.add_handler(MessageHandler(filters.AUDIO, handle_audio))
+        app.add_handler(CallbackQueryHandler(playback_callback, pattern="^play_cancel:"))
 
     # Start polling
-    logger.info(f"Starting bot: {DEVICE_NAME}")
+    logger.info(f"Starting bot: {get_device_name()}")
     app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+systemd unit states for all BabyMonitor services in one query
+- A single batched `systemctl show` instead of one `systemctl is-active` fork per unit
+- ActiveState / SubState / restart count / active-since per unit
+- watch() diffs successive snapshots and reports state changes (crash push signal)
+Used by telegram-bot.py and statusd.py.
+Usage: units.py [UNIT...]
+"""
+import asyncio, subprocess, sys, time
+
+import executor
+
+UNITS = ["snapserver", "babymonitor-audio", "babymonitor-monitor", "babymonitor-status",
+         "babymonitor-telegram", "tailscaled"]
+# The monotonic variant exists on every systemd; `--timestamp=unix` needs v251+ (not on older Raspberry Pi OS)
+PROPERTIES = "Id,LoadState,ActiveState,SubState,NRestarts,ActiveEnterTimestampMonotonic"
+
+
+class UnitState:
+    __slots__ = ("name", "loaded", "active_state", "sub_state", "restarts", "since")
+
+    def __init__(self, name, loaded, active_state, sub_state, restarts, since):
+        self.name, self.loaded = name, loaded
+        self.active_state, self.sub_state = active_state, sub_state
+        self.restarts, self.since = restarts, since
+
+    @classmethod
+    def from_properties(cls, props):
+        # Microseconds of CLOCK_MONOTONIC, the clock behind time.monotonic() on Linux
+        stamp = props.get("ActiveEnterTimestampMonotonic", "")
+        since = None
+        if stamp.isdigit() and stamp != "0":
+            since = int(time.time() - (time.monotonic() - int(stamp) / 1e6))
+        return cls(
+            props.get("Id", "").removesuffix(".service"),
+            props.get("LoadState") != "not-found",
+            props.get("ActiveState", "unknown"),
+            props.get("SubState", "unknown"),
+            int(props.get("NRestarts") or 0),
+            since,
+        )
+
+    @property
+    def status(self):
+        """Same word `systemctl is-active` prints"""
+        return self.active_state if self.loaded else "not-found"
+
+    def uptime(self, now=None):
+        if self.active_state != "active" or self.since is None:
+            return None
+        return (now or time.time()) - self.since
+
+
+def command(units=UNITS):
+    return ["systemctl", "show", "-p", PROPERTIES, *units]
+
+
+def parse(output, units=UNITS):
+    """Blank-line separated property blocks, one per unit in argument order"""
+    states = {}
+    if not output.strip():
+        return states
+    for name, block in zip(units, output.strip().split("\n\n")):
+        props = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+        state = UnitState.from_properties(props)
+        state.name = name
+        states[name] = state
+    return states
+
+
+def query(units=UNITS, timeout=10):
+    """All unit states with one systemctl fork. Missing units come back as not-found."""
+    try:
+        result = subprocess.run(command(units), capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return {}
+    return parse(result.stdout, units)
+
+
+async def aquery(units=UNITS, timeout=10):
+    """query() without blocking the event loop"""
+    ok, output = await executor.run(*command(units), timeout=timeout, stderr=False)
+    return parse(output, units) if output else {}
+
+
+def changes(old, new):
+    """(name, old state, new state) for units whose state or restart count moved"""
+    for name, state in new.items():
+        before = old.get(name)
+        if before is None:
+            continue
+        if (before.active_state, before.sub_state, before.restarts) != (state.active_state, state.sub_state, state.restarts):
+            yield name, before, state
+
+
+async def watch(callback, units=UNITS, interval=10):
+    """Call await callback(name, old, new) for every unit state change, forever.
+    One batched query per interval, so watching costs one fork every few seconds."""
+    previous = await aquery(units)
+    while True:
+        await asyncio.sleep(interval)
+        current = await aquery(units)
+        if not current:
+            continue
+        for name, before, state in changes(previous, current):
+            await callback(name, before, state)
+        previous = current
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or UNITS
+    states = query(names)
+    if not states:
+        print("  systemctl not available")
+        sys.exit(1)
+    for name in names:
+        s = states.get(name)
+        if s is None:
+            print(f"  {name + ':':<24} unknown")
+            continue
+        up = s.uptime()
+        since = f", up {int(up)}s" if up is not None else ""
+        print(f"  {name + ':':<24} {s.status} ({s.sub_state}{since}, {s.restarts} restarts)")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+End-to-end disconnect detection benchmark for monitor.py
+
+For every monitor configuration it starts a fake snapserver, a fake ntfy
+server and a real monitor.py process, then repeatedly disconnects a client
+and measures the time until the "CONNECTION LOST!" POST reaches the fake
+ntfy server. Reports p50 / p95 / max detection latency per configuration.
+
+    tools/bench_detection.py --trials 10 --config push:5:2 --config poll:5:2
+
+A configuration is MODE:CHECK_INTERVAL:DISCONNECT_TIMEOUT.
+"""
+import argparse, os, random, subprocess, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_snapserver import FakeSnapserver
+
+MONITOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", "monitor.py")
+
+
+class FakeNtfy:
+    """Records (arrival time, title) of every POST"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.received = []
+        ntfy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with ntfy.cond:
+                    ntfy.received.append((time.monotonic(), self.headers.get("Title", "")))
+                    ntfy.cond.notify_all()
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        # The monitor is killed with keep-alive connections open, that is expected
+        self.server.handle_error = lambda request, address: None
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def wait_for(self, title, after, timeout):
+        """Arrival time of the first POST with title received after `after`, or None"""
+        def found():
+            return next((t for t, ti in self.received if ti == title and t >= after), None)
+        with self.cond:
+            self.cond.wait_for(lambda: found() is not None, timeout)
+            return found()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def run_config(mode, check_interval, timeout, trials):
+    snap, ntfy = FakeSnapserver(), FakeNtfy()
+    snap.add_client("phone")
+    with tempfile.TemporaryDirectory() as tmp:
+        config_file = os.path.join(tmp, "config.env")
+        with open(config_file, "w") as f:
+            f.write(f"SNAPSERVER_HOST=127.0.0.1\nSNAPSERVER_PORT={snap.port}\n"
+                    f"NTFY_SERVER=http://127.0.0.1:{ntfy.port}\nNTFY_TOPIC=bench\n"
+                    f"MONITOR_MODE={mode}\nCHECK_INTERVAL={check_interval}\n"
+                    f"DISCONNECT_TIMEOUT={timeout}\nALERT_COOLDOWN=0\n")
+        env = dict(os.environ, BABYMONITOR_CONFIG=config_file)
+        proc = subprocess.Popen([sys.executable, "-u", MONITOR], env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        latencies = []
+        try:
+            if ntfy.wait_for("BabyMonitor Online", 0, 10) is None:
+                raise RuntimeError("monitor did not start")
+            time.sleep(check_interval + 0.5)    # let it see the client at least once
+            for i in range(trials):
+                # Random phase relative to the poll interval
+                time.sleep(random.uniform(0, check_interval))
+                t0 = time.monotonic()
+                snap.disconnect_client("phone")
+                t1 = ntfy.wait_for("CONNECTION LOST!", t0, timeout + check_interval * 2 + 10)
+                if t1 is None:
+                    print(f"  trial {i + 1}: no alert received", file=sys.stderr)
+                else:
+                    latencies.append(t1 - t0)
+                snap.connect_client("phone")
+                ntfy.wait_for("Connection Restored", t0, check_interval * 2 + 10)
+        finally:
+            proc.terminate()
+            proc.wait()
+            snap.close()
+            ntfy.server.shutdown()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument("--config", action="append", metavar="MODE:CHECK_INTERVAL:DISCONNECT_TIMEOUT",
+                        help="may be given several times (default: push:5:2 and poll:5:2)")
+    args = parser.parse_args()
+
+    configs = args.config or ["push:5:2", "poll:5:2"]
+    print(f"{'config':<16} {'n':>3} {'p50':>8} {'p95':>8} {'max':>8} {'p50-timeout':>12}")
+    for spec in configs:
+        mode, check_interval, timeout = spec.split(":")
+        check_interval, timeout = int(check_interval), int(timeout)
+        lat = run_config(mode, check_interval, timeout, args.trials)
+        if not lat:
+            print(f"{spec:<16} {0:>3} {'-':>8} {'-':>8} {'-':>8} {'-':>12}")
+            continue
+        p50 = percentile(lat, 50)
+        print(f"{spec:<16} {len(lat):>3} {p50:>7.3f}s {percentile(lat, 95):>7.3f}s {max(lat):>7.3f}s {p50 - timeout:>11.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Fake snapserver control port (JSON-RPC on 1705) for testing monitor.py
+without a Pi, a real snapserver or a phone.
+
+Scriptable behaviour:
+- clients connecting / disconnecting (sends Client.OnConnect / OnDisconnect)
+- stream state changes (sends Stream.OnUpdate)
+- slow replies, truncated replies, refused connections
+
+Interactive use: run it and type commands on stdin, e.g.
+    ./fake_snapserver.py --port 1705
+    add mama            (register a connected client)
+    disconnect mama
+    connect mama
+    stream idle
+    delay 3             (reply to requests after 3s)
+    truncate on         (send half of each reply, then hang up)
+    refuse on           (close new and existing connections)
+"""
+import argparse, json, socket, sys, threading, time
+
+
+class FakeSnapserver:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.lock = threading.Lock()
+        self.clients = {}           # id -> connected
+        self.stream_status = "playing"
+        self.reply_delay = 0.0
+        self.truncate = False
+        self.refuse = False
+        self.conns = []
+        self.listener = socket.create_server((host, port), reuse_port=False)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.accept_loop, name="fake-snapserver", daemon=True).start()
+
+    # --- JSON model ---
+
+    def client_json(self, cid):
+        return {
+            "id": cid, "connected": self.clients[cid],
+            "host": {"name": cid, "ip": "127.0.0.1"},
+            "config": {"name": "", "volume": {"muted": False, "percent": 100}},
+            "lastSeen": {"sec": int(time.time()), "usec": 0},
+        }
+
+    def stream_json(self):
+        return {"id": "BabyMonitor", "status": self.stream_status}
+
+    def server_json(self):
+        return {
+            "groups": [{"id": "group-1", "stream_id": "BabyMonitor", "muted": False,
+                        "clients": [self.client_json(c) for c in self.clients]}],
+            "streams": [self.stream_json()],
+        }
+
+    # --- Scripted changes ---
+
+    def add_client(self, cid, connected=True):
+        with self.lock:
+            self.clients[cid] = connected
+        self.notify("Client.OnConnect" if connected else "Client.OnDisconnect",
+                    {"id": cid, "client": self.client_json(cid)})
+
+    def connect_client(self, cid):
+        self.add_client(cid, True)
+
+    def disconnect_client(self, cid):
+        self.add_client(cid, False)
+
+    def set_stream(self, status):
+        with self.lock:
+            self.stream_status = status
+        self.notify("Stream.OnUpdate", {"id": "BabyMonitor", "stream": self.stream_json()})
+
+    def set_refuse(self, refuse):
+        self.refuse = refuse
+        if refuse:
+            with self.lock:
+                conns, self.conns = self.conns, []
+            for c in conns:
+                c.close()
+
+    # --- Networking ---
+
+    def notify(self, method, params):
+        line = (json.dumps({"jsonrpc": "2.0", "method": method, "params": params}) + "\n").encode()
+        with self.lock:
+            conns = list(self.conns)
+        for c in conns:
+            try:
+                c.sendall(line)
+            except OSError:
+                pass
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            if self.refuse:
+                conn.close()
+                continue
+            with self.lock:
+                self.conns.append(conn)
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn):
+        buf = b""
+        try:
+            while True:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    break
+                buf += chunk
+                *lines, buf = buf.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        self.reply(conn, json.loads(line))
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                if conn in self.conns:
+                    self.conns.remove(conn)
+            conn.close()
+
+    def reply(self, conn, req):
+        if self.reply_delay:
+            time.sleep(self.reply_delay)
+        with self.lock:
+            result = {"server": self.server_json()} if req.get("method") == "Server.GetStatus" else {}
+        data = (json.dumps({"id": req.get("id"), "jsonrpc": "2.0", "result": result}) + "\n").encode()
+        if self.truncate:
+            conn.sendall(data[:len(data) // 2])
+            conn.shutdown(socket.SHUT_RDWR)
+            return
+        conn.sendall(data)
+
+    def close(self):
+        self.listener.close()
+        self.set_refuse(True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1705)
+    args = parser.parse_args()
+
+    server = FakeSnapserver(args.host, args.port)
+    print(f"Fake snapserver on {args.host}:{server.port}")
+    commands = {
+        "add": lambda a: server.add_client(a),
+        "connect": lambda a: server.connect_client(a),
+        "disconnect": lambda a: server.disconnect_client(a),
+        "stream": lambda a: server.set_stream(a),
+        "delay": lambda a: setattr(server, "reply_delay", float(a)),
+        "truncate": lambda a: setattr(server, "truncate", a == "on"),
+        "refuse": lambda a: server.set_refuse(a == "on"),
+    }
+    for line in sys.stdin:
+        cmd, _, arg = line.strip().partition(" ")
+        if not cmd:
+            continue
+        if cmd not in commands:
+            print(f"Unknown command: {cmd} ({', '.join(commands)})")
+            continue
+        commands[cmd](arg.strip())
+        print("ok")
+
+
+if __name__ == "__main__":
+    main()